@@ -38,6 +38,12 @@ EVENT_SERVICE_URL = os.getenv("EVENT_SERVICE_URL", "http://localhost:8006")
 
 JWT_SECRET = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-in-production")
 
+# Upstream timeout; the remaining budget is passed on so services can stop work we've given up on
+GATEWAY_TIMEOUT_SECONDS = float(os.getenv("GATEWAY_TIMEOUT_SECONDS", "10"))
+DEADLINE_HEADER = "X-Request-Timeout-Ms"
+# Kept back from the forwarded budget for network / response time
+DEADLINE_MARGIN_SECONDS = float(os.getenv("DEADLINE_MARGIN_SECONDS", "0.25"))
+
 # Helper Functions
 def verify_token(token: str) -> Optional[dict]:
     """Verify JWT token"""
@@ -49,18 +55,40 @@ def verify_token(token: str) -> Optional[dict]:
     except jwt.InvalidTokenError:
         return None
 
-async def forward_request(url: str, method: str, headers: dict, body: Optional[dict] = None):
+def client_deadline(headers: dict) -> Optional[float]:
+    """Budget (seconds) the client itself sent in X-Request-Timeout-Ms, if any"""
+    for key, value in headers.items():
+        if key.lower() == DEADLINE_HEADER.lower():
+            try:
+                return max(0.0, float(value) / 1000.0)
+            except (TypeError, ValueError):
+                return None
+    return None
+
+def with_deadline(headers: dict, timeout: float) -> dict:
+    """Copy of headers carrying the time budget left for the upstream service"""
+    headers = {k: v for k, v in headers.items() if k.lower() != DEADLINE_HEADER.lower()}
+    headers[DEADLINE_HEADER] = str(int(max(0.0, timeout - DEADLINE_MARGIN_SECONDS) * 1000))
+    return headers
+
+async def forward_request(url: str, method: str, headers: dict, body: Optional[dict] = None,
+                          timeout: float = GATEWAY_TIMEOUT_SECONDS):
     """Forward request to microservice"""
+    # a tighter deadline from the client wins
+    requested = client_deadline(headers)
+    if requested is not None:
+        timeout = min(timeout, requested)
+    headers = with_deadline(headers, timeout)
     async with httpx.AsyncClient() as client:
         try:
             if method == "GET":
-                response = await client.get(url, headers=headers, timeout=10.0)
+                response = await client.get(url, headers=headers, timeout=timeout)
             elif method == "POST":
-                response = await client.post(url, headers=headers, json=body, timeout=10.0)
+                response = await client.post(url, headers=headers, json=body, timeout=timeout)
             elif method == "PUT":
-                response = await client.put(url, headers=headers, json=body, timeout=10.0)
+                response = await client.put(url, headers=headers, json=body, timeout=timeout)
             elif method == "DELETE":
-                response = await client.delete(url, headers=headers, timeout=10.0)
+                response = await client.delete(url, headers=headers, timeout=timeout)
             else:
                 raise HTTPException(status_code=405, detail="Method not allowed")
             
@@ -196,7 +224,7 @@ async def send_chat_message(request: Request):
     """Forward chat message to chat service"""
     body = await request.json()
     return await forward_request(
-        f"{CHAT_SERVICE_URL}/api/chat/message",
+        f"{CHAT_SERVICE_URL}/api/v1/chat",
         "POST",
         dict(request.headers),
         body
@@ -206,7 +234,7 @@ async def send_chat_message(request: Request):
 async def get_chat_history(user_id: int, request: Request):
     """Forward get chat history to chat service"""
     return await forward_request(
-        f"{CHAT_SERVICE_URL}/api/chat/history/{user_id}",
+        f"{CHAT_SERVICE_URL}/api/v1/chat-history/{user_id}",
         "GET",
         dict(request.headers)
     )
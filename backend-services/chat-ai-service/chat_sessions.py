@@ -0,0 +1,96 @@
+"""
+Live chat sessions - per-connection state for the WebSocket chat endpoint.
+Mood context is loaded once per session and kept current in memory as new
+moods (chat, photo, manual) are saved for the user.
+"""
+import os
+import time
+import threading
+from collections import defaultdict
+from typing import Optional
+
+# Re-read mood context from the database after this long (trend / color insight drift)
+SESSION_CONTEXT_TTL_SECONDS = float(os.getenv("SESSION_CONTEXT_TTL_SECONDS", "900"))
+# Close sessions idle for longer than this
+SESSION_IDLE_TIMEOUT_SECONDS = float(os.getenv("SESSION_IDLE_TIMEOUT_SECONDS", "600"))
+
+
+class ChatSession:
+    def __init__(self, user_id: Optional[int], token: Optional[str] = None):
+        self.user_id = user_id
+        self.token = token
+        self.user_mood: Optional[str] = None
+        self.mood_analysis: Optional[dict] = None
+        self.mood_source: Optional[str] = None
+        self.context_loaded_at = 0.0
+        self.started_at = time.time()
+        self.last_active = self.started_at
+        self.messages = 0
+
+    def set_context(self, user_mood: Optional[str], mood_analysis: Optional[dict]):
+        self.user_mood = user_mood
+        self.mood_analysis = mood_analysis
+        self.context_loaded_at = time.time()
+
+    def context_stale(self) -> bool:
+        return time.time() - self.context_loaded_at > SESSION_CONTEXT_TTL_SECONDS
+
+    def note_mood(self, emotion: str, source: Optional[str] = None):
+        """A new mood was saved for this user - use it as the current mood from now on"""
+        self.user_mood = emotion
+        self.mood_source = source
+        if self.mood_analysis:
+            self.mood_analysis = dict(self.mood_analysis, current_mood=emotion)
+
+    def touch(self):
+        self.last_active = time.time()
+        self.messages += 1
+
+
+class SessionRegistry:
+    """user_id -> open sessions, so mood saves anywhere in the service reach live connections"""
+
+    def __init__(self):
+        self._sessions = defaultdict(set)
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.mood_updates = 0
+
+    def register(self, session: ChatSession):
+        with self._lock:
+            self._sessions[session.user_id].add(session)
+            self.opened += 1
+
+    def unregister(self, session: ChatSession):
+        with self._lock:
+            sessions = self._sessions.get(session.user_id)
+            if sessions is not None:
+                sessions.discard(session)
+                if not sessions:
+                    self._sessions.pop(session.user_id, None)
+
+    def publish_mood(self, user_id: Optional[int], emotion: str, source: Optional[str] = None):
+        if user_id is None or not emotion:
+            return
+        with self._lock:
+            sessions = list(self._sessions.get(user_id, ()))
+        for session in sessions:
+            session.note_mood(emotion, source)
+        if sessions:
+            self.mood_updates += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            sessions = [s for group in self._sessions.values() for s in group]
+        return {
+            "open_sessions": len(sessions),
+            "users": len({s.user_id for s in sessions}),
+            "opened_total": self.opened,
+            "messages_in_open_sessions": sum(s.messages for s in sessions),
+            "mood_updates": self.mood_updates,
+            "context_ttl_s": SESSION_CONTEXT_TTL_SECONDS,
+            "idle_timeout_s": SESSION_IDLE_TIMEOUT_SECONDS,
+        }
+
+
+chat_sessions = SessionRegistry()
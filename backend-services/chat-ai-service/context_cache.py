@@ -0,0 +1,88 @@
+"""
+Per-user chat context cache - the mood context (current mood + time-window
+analysis) used to build the chat prompt, kept warm between messages and
+prefetched when the app opens (/api/v1/session/start).
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+MOOD_CONTEXT_TTL_SECONDS = float(os.getenv("MOOD_CONTEXT_TTL_SECONDS", "120"))
+MOOD_CONTEXT_MAX_USERS = int(os.getenv("MOOD_CONTEXT_MAX_USERS", "5000"))
+
+
+class MoodContextCache:
+    """LRU of user_id -> (user_mood, mood_analysis) with a TTL; moods saved in-process update it in place"""
+
+    def __init__(self, ttl_seconds: float = MOOD_CONTEXT_TTL_SECONDS, max_users: int = MOOD_CONTEXT_MAX_USERS):
+        self.ttl = ttl_seconds
+        self.max_users = max_users
+        self._entries: "OrderedDict[int, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._prefetching = set()
+        self.hits = 0
+        self.misses = 0
+        self.prefetches = 0
+
+    def get(self, user_id: int) -> Optional[Tuple[Optional[str], Optional[dict]]]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or time.time() - entry["loaded_at"] > self.ttl:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry["user_mood"], entry["mood_analysis"]
+
+    def is_warm(self, user_id: int) -> bool:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            return entry is not None and time.time() - entry["loaded_at"] <= self.ttl
+
+    def put(self, user_id: int, user_mood: Optional[str], mood_analysis: Optional[dict]):
+        with self._lock:
+            self._entries[user_id] = {"user_mood": user_mood, "mood_analysis": mood_analysis, "loaded_at": time.time()}
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def note_mood(self, user_id: int, emotion: str):
+        """A mood was just saved - make it the current mood without dropping the cached analysis"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return
+            entry["user_mood"] = emotion
+            if entry["mood_analysis"]:
+                entry["mood_analysis"] = dict(entry["mood_analysis"], current_mood=emotion)
+
+    def begin_prefetch(self, user_id: int) -> bool:
+        """False when a prefetch for this user is already running"""
+        with self._lock:
+            if user_id in self._prefetching:
+                return False
+            self._prefetching.add(user_id)
+            self.prefetches += 1
+            return True
+
+    def end_prefetch(self, user_id: int):
+        with self._lock:
+            self._prefetching.discard(user_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "users": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else None,
+                "prefetches": self.prefetches,
+                "prefetching": len(self._prefetching),
+                "ttl_s": self.ttl,
+            }
+
+
+mood_context_cache = MoodContextCache()
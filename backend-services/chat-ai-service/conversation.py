@@ -0,0 +1,139 @@
+"""
+Conversation memory - per-user ring buffer of recent chat turns plus a
+token-budgeted message builder, so the bot remembers the conversation
+without reading chat_history on every message.
+"""
+import os
+import json
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Optional
+
+from prompts import estimate_tokens
+
+CONVERSATION_MAX_TURNS = int(os.getenv("CONVERSATION_MAX_TURNS", "20"))
+CONVERSATION_MAX_USERS = int(os.getenv("CONVERSATION_MAX_USERS", "5000"))
+# Token budget for verbatim history turns, and for the one-line summary of older ones
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "600"))
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "80"))
+
+
+class ConversationStore:
+    """In-process LRU of user_id -> deque of recent turns"""
+
+    def __init__(self, max_turns: int = CONVERSATION_MAX_TURNS, max_users: int = CONVERSATION_MAX_USERS):
+        self.max_turns = max_turns
+        self.max_users = max_users
+        self._buffers: "OrderedDict[int, deque]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.history_loads = 0
+
+    def _buffer(self, user_id: int) -> deque:
+        buf = self._buffers.get(user_id)
+        if buf is None:
+            buf = deque(maxlen=self.max_turns)
+            self._buffers[user_id] = buf
+            while len(self._buffers) > self.max_users:
+                self._buffers.popitem(last=False)
+        self._buffers.move_to_end(user_id)
+        return buf
+
+    def is_loaded(self, user_id: int) -> bool:
+        return user_id in self._buffers
+
+    def ensure_loaded(self, user_id: int, loader: Callable[[int, int], list]):
+        """Fill the buffer from chat history the first time we see this user (one read per process)"""
+        if user_id is None or self.is_loaded(user_id):
+            return
+        try:
+            rows = loader(user_id, self.max_turns) or []
+        except Exception as e:
+            print(f"⚠️ Failed to load conversation history for user_id={user_id}: {e}")
+            rows = []
+        with self._lock:
+            if user_id in self._buffers:
+                return
+            buf = self._buffer(user_id)
+            # loader returns newest first
+            for row in reversed(rows):
+                buf.append({
+                    "user": row.get("user_message") or "",
+                    "assistant": row.get("ai_reply") or "",
+                    "emotion": row.get("ai_emotion"),
+                })
+            self.history_loads += 1
+
+    def record_turn(self, user_id: int, user_message: str, ai_reply: str, ai_emotion: Optional[str] = None):
+        """Append a turn for a user whose buffer is loaded (others pick it up from history on first load)"""
+        with self._lock:
+            buf = self._buffers.get(user_id)
+            if buf is None:
+                return
+            buf.append({"user": user_message or "", "assistant": ai_reply or "", "emotion": ai_emotion})
+
+    def turns(self, user_id: int) -> list:
+        with self._lock:
+            buf = self._buffers.get(user_id)
+            return list(buf) if buf else []
+
+    def reset(self, user_id: int):
+        """Forget the conversation but keep the user marked as loaded (no reload from history)"""
+        with self._lock:
+            self._buffer(user_id).clear()
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._buffers),
+            "max_users": self.max_users,
+            "max_turns": self.max_turns,
+            "history_loads": self.history_loads,
+            "history_token_budget": HISTORY_TOKEN_BUDGET,
+        }
+
+
+def _assistant_content(turn: dict) -> str:
+    # Keep earlier assistant turns in the same JSON shape we ask the model to produce
+    return json.dumps({"reply": turn["assistant"], "emotion": turn.get("emotion") or "Neutral"}, ensure_ascii=False)
+
+
+def _summarize(turns: list, budget_tokens: int) -> str:
+    """One-line summary of turns that didn't fit verbatim (emotions + snippets), capped to the budget"""
+    emotions = [t.get("emotion") for t in turns if t.get("emotion")]
+    summary = f"Earlier in this conversation ({len(turns)} older messages)"
+    if emotions:
+        summary += f", the user's emotions were: {' -> '.join(emotions[-6:])}"
+    summary += ". They said:"
+    for t in turns[-6:]:
+        snippet = " ".join(t["user"].split()[:8])
+        candidate = f'{summary} "{snippet}";'
+        if estimate_tokens(candidate) > budget_tokens:
+            break
+        summary = candidate
+    return summary.rstrip(";:") + "."
+
+
+def build_messages(system_prompt: str, turns: list, message: str,
+                   budget_tokens: int = HISTORY_TOKEN_BUDGET,
+                   summary_tokens: int = HISTORY_SUMMARY_TOKENS) -> list:
+    """System prompt + as many recent turns as fit the budget (+ summary of older ones) + current message"""
+    kept = []
+    used = 0
+    for turn in reversed(turns):
+        pair = [
+            {"role": "user", "content": turn["user"]},
+            {"role": "assistant", "content": _assistant_content(turn)},
+        ]
+        cost = sum(estimate_tokens(m["content"]) + 4 for m in pair)
+        if used + cost > budget_tokens:
+            break
+        kept = pair + kept
+        used += cost
+
+    older = turns[:len(turns) - len(kept) // 2]
+    if older and summary_tokens > 0:
+        system_prompt = f"{system_prompt}\n{_summarize(older, summary_tokens)}"
+
+    return [{"role": "system", "content": system_prompt}] + kept + [{"role": "user", "content": message}]
+
+
+conversation_store = ConversationStore()
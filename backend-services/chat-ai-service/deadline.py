@@ -0,0 +1,76 @@
+"""
+Request deadlines - the API gateway sends the remaining time budget in
+`X-Request-Timeout-Ms`; handlers use it to skip or cut short work for a
+client that has already given up.
+"""
+import os
+import time
+import asyncio
+from typing import Optional
+from fastapi import Header
+
+DEADLINE_HEADER = "X-Request-Timeout-Ms"
+# Budget used when a caller sends no deadline header (0 = unbounded, legacy behaviour)
+DEFAULT_REQUEST_BUDGET_SECONDS = float(os.getenv("DEFAULT_REQUEST_BUDGET_SECONDS", "0"))
+# Time kept back for the LLM call when deciding whether context fetches can still run
+DEADLINE_LLM_RESERVE_SECONDS = float(os.getenv("DEADLINE_LLM_RESERVE_SECONDS", "3"))
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget is spent"""
+
+
+class Deadline:
+    def __init__(self, budget_seconds: Optional[float]):
+        self.budget = budget_seconds
+        # 0 is a spent budget, not "no deadline"
+        self._expires = time.monotonic() + budget_seconds if budget_seconds is not None else None
+
+    @classmethod
+    def from_header(cls, value: Optional[str]) -> "Deadline":
+        try:
+            if value:
+                return cls(max(0.0, float(value) / 1000.0))
+        except ValueError:
+            print(f"⚠️ Ignoring invalid {DEADLINE_HEADER} header: {value!r}")
+        return cls(DEFAULT_REQUEST_BUDGET_SECONDS or None)
+
+    @property
+    def bounded(self) -> bool:
+        return self._expires is not None
+
+    def remaining(self) -> float:
+        """Seconds left (inf when the request has no deadline)"""
+        if self._expires is None:
+            return float("inf")
+        return max(0.0, self._expires - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0.0
+
+    def check(self, step: str):
+        if self.expired():
+            raise DeadlineExceeded(f"deadline exceeded before {step}")
+
+    def cap(self, seconds: float, reserve: float = 0.0) -> float:
+        """`seconds`, shortened so that `reserve` seconds of budget are still left afterwards"""
+        return max(0.0, min(seconds, self.remaining() - reserve))
+
+    async def run(self, step: str, func, *args, reserve: float = 0.0, default=None):
+        """Run a blocking call in a thread, giving up (returning `default`) if it can't finish in budget"""
+        if not self.bounded:
+            return await asyncio.to_thread(func, *args)
+        budget = self.remaining() - reserve
+        if budget <= 0:
+            print(f"⏱️ Skipping {step}: no time budget left")
+            return default
+        try:
+            return await asyncio.wait_for(asyncio.to_thread(func, *args), timeout=budget)
+        except asyncio.TimeoutError:
+            print(f"⏱️ {step} abandoned after {budget:.2f}s (deadline)")
+            return default
+
+
+async def request_deadline(x_request_timeout_ms: Optional[str] = Header(None)) -> Deadline:
+    """FastAPI dependency: the request's Deadline from the gateway header"""
+    return Deadline.from_header(x_request_timeout_ms)
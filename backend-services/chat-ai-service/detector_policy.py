@@ -0,0 +1,132 @@
+"""
+Detector path policy - decides which face-detection path each photo tries
+first. Paths (see face_emotion.run_detection_plan):
+
+  retinaface  DeepFace with RetinaFace (OpenCV backend only if it errors)
+  opencv      DeepFace with its OpenCV detector
+  haar_crop   Haar cascade (+ rotation search), DeepFace on the face crop
+
+"fixed" (the default) runs PHOTO_DETECTOR_PATHS in the configured order.
+"adaptive" orders them by expected cost of a confident result (recent avg
+latency / rate of results at PHOTO_POLICY_COMPARE_CONFIDENCE) so e.g. a run
+of frontal selfies moves haar_crop ahead of RetinaFace; every
+PHOTO_POLICY_EXPLORE_EVERY-th photo puts the least-sampled path first so the
+numbers for the others stay current. The paths accept results at different
+confidences (haar_crop at 0.25, whole-image at 0.5), so they are compared at
+one common bar - otherwise the lenient crop path looks more successful than
+it is and wins the ranking with weaker answers.
+
+The policy lives in the API process; plans are sent to the photo workers
+with each job and the per-path attempts come back with the result.
+"""
+import os
+import threading
+from collections import deque
+from typing import List
+
+DETECTOR_PATHS = ("retinaface", "opencv", "haar_crop")
+
+PHOTO_DETECTOR_POLICY = os.getenv("PHOTO_DETECTOR_POLICY", "fixed").lower()
+PHOTO_DETECTOR_PATHS = [p.strip() for p in os.getenv(
+    "PHOTO_DETECTOR_PATHS", "retinaface,haar_crop"
+).split(",") if p.strip() in DETECTOR_PATHS] or ["retinaface", "haar_crop"]
+PHOTO_POLICY_WINDOW = int(os.getenv("PHOTO_POLICY_WINDOW", "200"))
+PHOTO_POLICY_MIN_SAMPLES = int(os.getenv("PHOTO_POLICY_MIN_SAMPLES", "10"))
+PHOTO_POLICY_EXPLORE_EVERY = int(os.getenv("PHOTO_POLICY_EXPLORE_EVERY", "20"))
+# Confidence a path's result must reach to count as a success when ranking (face_emotion.BASE_ACCEPT_CONFIDENCE)
+PHOTO_POLICY_COMPARE_CONFIDENCE = float(os.getenv("PHOTO_POLICY_COMPARE_CONFIDENCE", "0.5"))
+
+
+class DetectorPolicy:
+    """Sliding window of (accepted, confident, seconds) per path -> ordered plan per photo"""
+
+    def __init__(self, policy: str = PHOTO_DETECTOR_POLICY, paths=None,
+                 window: int = PHOTO_POLICY_WINDOW, min_samples: int = PHOTO_POLICY_MIN_SAMPLES,
+                 explore_every: int = PHOTO_POLICY_EXPLORE_EVERY,
+                 compare_confidence: float = PHOTO_POLICY_COMPARE_CONFIDENCE):
+        self.policy = policy if policy in ("adaptive", "fixed") else "fixed"
+        self.paths = list(paths or PHOTO_DETECTOR_PATHS)
+        self.min_samples = min_samples
+        self.explore_every = explore_every
+        self.compare_confidence = compare_confidence
+        self._window = {path: deque(maxlen=window) for path in self.paths}
+        self._lock = threading.Lock()
+        self.photos = 0
+        self.explored = 0
+        self.first_choice = {path: 0 for path in self.paths}
+        self.winners = {path: 0 for path in self.paths}
+        self.unresolved = 0
+
+    def _path_stats(self, path: str) -> dict:
+        samples = list(self._window[path])
+        if not samples:
+            return {"samples": 0, "success_rate": None, "confident_rate": None, "avg_ms": None, "expected_ms": None}
+        successes = sum(1 for ok, _, _ in samples if ok)
+        confident = sum(1 for _, sure, _ in samples if sure)
+        avg = sum(s for _, _, s in samples) / len(samples)
+        rate = confident / len(samples)
+        return {
+            "samples": len(samples),
+            # accepted at the path's own threshold (ended the plan)
+            "success_rate": round(successes / len(samples), 3),
+            # reached the common bar - what the ranking uses
+            "confident_rate": round(rate, 3),
+            "avg_ms": round(avg * 1000, 1),
+            # cost of one confident result if this path goes first; floor the rate so 0% isn't infinite
+            "expected_ms": round(avg / max(rate, 0.05) * 1000, 1),
+        }
+
+    def plan(self) -> List[str]:
+        """Path order for the next photo"""
+        with self._lock:
+            self.photos += 1
+            order = list(self.paths)
+            if self.policy == "adaptive" and len(order) > 1:
+                stats = {path: self._path_stats(path) for path in order}
+                if self.explore_every and self.photos % self.explore_every == 0:
+                    # exploration: least-sampled path first, the rest by cost
+                    explore = min(order, key=lambda p: stats[p]["samples"])
+                    self.explored += 1
+                else:
+                    explore = None
+                sampled = [p for p in order if stats[p]["samples"] >= self.min_samples]
+                if len(sampled) == len(order):
+                    order.sort(key=lambda p: stats[p]["expected_ms"])
+                if explore:
+                    order.remove(explore)
+                    order.insert(0, explore)
+            self.first_choice[order[0]] += 1
+            return order
+
+    def record(self, attempts):
+        """attempts: [(path, succeeded, seconds[, confidence]), ...] as returned by the pipeline"""
+        with self._lock:
+            for path, ok, seconds, *rest in attempts or []:
+                if path in self._window:
+                    confidence = rest[0] if rest else None
+                    # no confidence reported -> trust the path's own accept decision
+                    confident = bool(ok) and (confidence is None or confidence >= self.compare_confidence)
+                    self._window[path].append((bool(ok), confident, float(seconds)))
+            winner = next((attempt[0] for attempt in (attempts or []) if attempt[1]), None)
+            if winner in self.winners:
+                self.winners[winner] += 1
+            elif attempts:
+                self.unresolved += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "policy": self.policy,
+                "paths": {path: self._path_stats(path) for path in self.paths},
+                "photos": self.photos,
+                "explored": self.explored,
+                "first_choice": dict(self.first_choice),
+                "winners": dict(self.winners),
+                "unresolved": self.unresolved,
+                "min_samples": self.min_samples,
+                "explore_every": self.explore_every,
+                "compare_confidence": self.compare_confidence,
+            }
+
+
+detector_policy = DetectorPolicy()
@@ -0,0 +1,215 @@
+"""
+Local emotion classifier - weighted lexicon + hashed n-gram linear model (NumPy).
+Fills in the chat emotion when Groq is down or its JSON is unusable, and backs
+the LLM-free /api/v1/classify-emotion endpoint.
+
+Run `python emotion_classifier.py` to train and cross-validate on
+local_chat_history.jsonl.
+"""
+import os
+import json
+import zlib
+import numpy as np
+from typing import Optional
+
+from reply_cache import normalize_message
+
+# Same emotion set the SYSTEM_PROMPT asks Groq to classify into
+EMOTIONS = ["Happy", "Sad", "Angry", "Stress", "Neutral", "Anxious", "Excited"]
+NEUTRAL_INDEX = EMOTIONS.index("Neutral")
+
+EMOTION_TRAINING_PATH = os.getenv(
+    "EMOTION_TRAINING_PATH",
+    os.path.join(os.path.dirname(__file__), "local_chat_history.jsonl")
+)
+HASH_DIM = 2 ** 14
+LEXICON_WEIGHT = 3.0
+
+# Seed lexicon (English / Singlish / Sinhala) - the model starts from these weights
+SEED_LEXICON = {
+    "Happy": [
+        "happy", "happiness", "glad", "great", "awesome", "amazing", "good day", "love", "smile",
+        "congrats", "yay", "nice", "wonderful", "fun", "enjoy", "enjoyed", "proud", "thanks",
+        "patta", "supiri", "shape", "hodai", "sathutui", "santhosai",
+        "සතුටුයි", "සතුට", "සතුටින්", "හොඳයි", "සුපිරි", "ආදරෙයි",
+    ],
+    "Sad": [
+        "sad", "sadness", "unhappy", "cry", "crying", "cried", "lonely", "alone", "miss", "hurt",
+        "broken", "heartbroken", "depressed", "down", "failed", "fail", "lost", "bad day", "sorry",
+        "dukai", "duka", "paalui",
+        "දුක", "දුකයි", "දුකෙන්", "අඬනවා", "හුදකලා", "පාළුයි",
+    ],
+    "Angry": [
+        "angry", "anger", "mad", "furious", "hate", "annoyed", "annoying", "pissed", "irritated",
+        "frustrated", "rage", "kenthi", "kenti", "tharaha", "yako",
+        "තරහ", "තරහයි", "කේන්ති", "කේන්තියි",
+    ],
+    "Stress": [
+        "stress", "stressed", "stressful", "pressure", "overwhelmed", "tired", "exhausted", "deadline",
+        "workload", "burnout", "too much work", "exam", "exams", "mahansi", "amaru",
+        "ආතතිය", "මහන්සි", "අමාරුයි", "වැඩ වැඩියි",
+    ],
+    "Neutral": [
+        "hi", "hy", "hello", "hey", "ok", "okay", "fine", "i am fine", "how are you", "what's up",
+        "whats up", "sup", "kohomada", "mokada", "machan", "macho", "ela",
+        "කොහොමද", "මොකද", "හරි", "හොඳින්",
+    ],
+    "Anxious": [
+        "anxious", "anxiety", "nervous", "worried", "worry", "scared", "afraid", "fear", "panic",
+        "uneasy", "bayai", "baya", "hitha kalabalai",
+        "බයයි", "බය", "කලබලයි", "හිත කලබලයි",
+    ],
+    "Excited": [
+        "excited", "exciting", "cant wait", "can't wait", "omg", "wow", "woohoo", "thrilled",
+        "pumped", "finally", "got the job", "won", "we won", "ammo", "ela kiri",
+        "ආසයි", "මාරයි", "නියමයි",
+    ],
+}
+
+
+def _hash(feature: str) -> int:
+    # crc32 is stable across processes (built-in hash() is salted)
+    return zlib.crc32(feature.encode("utf-8")) % HASH_DIM
+
+
+def featurize(text: str) -> np.ndarray:
+    """Hashed unigram, bigram and 3-char prefix feature indices for `text`"""
+    tokens = normalize_message(text).split()
+    feats = list(tokens)
+    feats += [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    feats += [f"p:{t[:3]}" for t in tokens if len(t) >= 4]
+    if not feats:
+        return np.zeros(0, dtype=np.int64)
+    return np.unique(np.fromiter((_hash(f) for f in feats), dtype=np.int64, count=len(feats)))
+
+
+def _softmax(z: np.ndarray) -> np.ndarray:
+    z = z - z.max(axis=-1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+def load_training_rows(path: str = EMOTION_TRAINING_PATH):
+    """Read (message, emotion) pairs from a chat history JSONL file"""
+    rows = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    item = json.loads(line)
+                except Exception:
+                    continue
+                msg, emotion = item.get("user_message"), item.get("ai_emotion")
+                if msg and emotion in EMOTIONS:
+                    rows.append((msg, emotion))
+    except FileNotFoundError:
+        print(f"⚠️ Emotion training data not found: {path}")
+    return rows
+
+
+class LexiconEmotionClassifier:
+    """Linear softmax model over hashed features, initialised from SEED_LEXICON"""
+
+    def __init__(self):
+        self.prior = np.zeros((HASH_DIM, len(EMOTIONS)), dtype=np.float32)
+        for k, emotion in enumerate(EMOTIONS):
+            for phrase in SEED_LEXICON.get(emotion, []):
+                self.prior[featurize(phrase), k] += LEXICON_WEIGHT
+        self.W = self.prior.copy()
+        self.b = np.zeros(len(EMOTIONS), dtype=np.float32)
+        self.b[NEUTRAL_INDEX] = 0.5  # no evidence -> Neutral
+        self.trained_on = 0
+        self.evaluation = None
+
+    def fit(self, rows, epochs: int = 150, lr: float = 0.5, l2: float = 0.05):
+        """Full-batch gradient descent, regularised towards the lexicon prior"""
+        if not rows:
+            return self
+        feats = [featurize(m) for m, _ in rows]
+        # Train on the active columns only - keeps the design matrix tiny
+        active = np.unique(np.concatenate([f for f in feats if len(f)] or [np.zeros(0, dtype=np.int64)]))
+        col = {int(h): i for i, h in enumerate(active)}
+        X = np.zeros((len(rows), len(active)), dtype=np.float32)
+        for i, f in enumerate(feats):
+            X[i, [col[int(h)] for h in f]] = 1.0
+        Y = np.zeros((len(rows), len(EMOTIONS)), dtype=np.float32)
+        Y[np.arange(len(rows)), [EMOTIONS.index(e) for _, e in rows]] = 1.0
+
+        prior = self.prior[active]
+        W = self.W[active].copy()
+        b = self.b.copy()
+        n = float(len(rows))
+        for _ in range(epochs):
+            grad = _softmax(X @ W + b) - Y
+            W -= lr * ((X.T @ grad) / n + l2 * (W - prior))
+            b -= lr * grad.mean(axis=0)
+        self.W[active] = W
+        self.b = b
+        self.trained_on = len(rows)
+        return self
+
+    def scores(self, text: str) -> np.ndarray:
+        idx = featurize(text)
+        logits = self.b + (self.W[idx].sum(axis=0) if len(idx) else 0.0)
+        return _softmax(logits)
+
+    def predict(self, text: str):
+        """Return (emotion, confidence, {emotion: probability})"""
+        probs = self.scores(text)
+        k = int(np.argmax(probs))
+        return EMOTIONS[k], float(probs[k]), {e: round(float(p), 4) for e, p in zip(EMOTIONS, probs)}
+
+    def stats(self) -> dict:
+        return {
+            "emotions": EMOTIONS,
+            "hash_dim": HASH_DIM,
+            "lexicon_size": sum(len(v) for v in SEED_LEXICON.values()),
+            "trained_on": self.trained_on,
+            "evaluation": self.evaluation,
+        }
+
+
+def cross_validate(rows, folds: int = 5, seed: int = 7) -> Optional[dict]:
+    """k-fold accuracy of the trained model vs. lexicon-only and majority-class baselines"""
+    if len(rows) < folds:
+        return None
+    order = np.random.default_rng(seed).permutation(len(rows))
+    correct = lexicon_correct = 0
+    for k in range(folds):
+        test_idx = set(order[k::folds].tolist())
+        train = [r for i, r in enumerate(rows) if i not in test_idx]
+        test = [rows[i] for i in sorted(test_idx)]
+        model = LexiconEmotionClassifier().fit(train)
+        lexicon_only = LexiconEmotionClassifier()
+        correct += sum(model.predict(m)[0] == e for m, e in test)
+        lexicon_correct += sum(lexicon_only.predict(m)[0] == e for m, e in test)
+    labels = [e for _, e in rows]
+    majority = max(set(labels), key=labels.count)
+    return {
+        "folds": folds,
+        "samples": len(rows),
+        "accuracy": round(correct / len(rows), 3),
+        "lexicon_only_accuracy": round(lexicon_correct / len(rows), 3),
+        "majority_baseline": round(labels.count(majority) / len(rows), 3),
+    }
+
+
+def build_classifier(path: str = EMOTION_TRAINING_PATH, evaluate: bool = True) -> LexiconEmotionClassifier:
+    rows = load_training_rows(path)
+    model = LexiconEmotionClassifier().fit(rows)
+    if evaluate:
+        model.evaluation = cross_validate(rows)
+    print(f"✅ Local emotion classifier ready (trained on {len(rows)} messages, eval={model.evaluation})")
+    return model
+
+
+emotion_classifier = build_classifier()
+
+
+if __name__ == "__main__":
+    for sample in ("I got the job!", "I failed my exam", "yako mata stress job eka gana",
+                   "කොහොමද ඔයා", "මං අද හරිම සතුටුයි", "I'm so nervous about tomorrow"):
+        print(f"{sample!r:40} -> {emotion_classifier.predict(sample)[:2]}")
@@ -0,0 +1,620 @@
+"""
+Face emotion detection - DeepFace analysis with OpenCV-assisted fallbacks
+(face crop, rotations, CLAHE). Free of FastAPI / service state so photo
+worker processes can import it on their own.
+
+Images are decoded once (image_prep) and passed around as BGR numpy
+arrays - DeepFace accepts arrays directly, so nothing touches the disk.
+Detection runs on a copy capped at DETECT_MAX_DIM; face boxes (OpenCV or
+DeepFace's detector) are mapped back so the emotion is always classified on
+a crop of the full image.
+Uploads are turned upright from their EXIF orientation; without one, the
+rotated candidates are searched on an even smaller copy, most successful
+angle first.
+
+run_detection_plan runs the detector paths in the order chosen by
+detector_policy and reports what each one cost. A face box detected on the
+phone (parse_face_hint) skips server-side detection entirely when it passes
+a cheap plausibility check and a Haar face check around the box.
+"""
+import os
+import json
+import time
+import threading
+
+import cv2
+import numpy as np
+
+from image_prep import PreparedImage, decode_image, map_box, ROTATION_SEARCH_WITH_EXIF
+from detector_policy import PHOTO_DETECTOR_PATHS
+
+# Try to import DeepFace for AI-powered emotion detection
+DEEPFACE_AVAILABLE = False
+DeepFace = None
+try:
+    from deepface import DeepFace
+    print("✅ DeepFace emotion detector initialized successfully")
+    DEEPFACE_AVAILABLE = True
+except Exception as e:
+    print(f"⚠️ DeepFace not available: {e}")
+    print("ℹ️  Using fallback emotion detection")
+
+# Initialize OpenCV Face Detector (for emotion analysis)
+try:
+    # Load Haar Cascade for face detection
+    face_cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+    face_cascade = cv2.CascadeClassifier(face_cascade_path)
+    print("✅ OpenCV face detector initialized successfully")
+except Exception as e:
+    print(f"⚠️  Face detector initialization failed: {e}")
+    face_cascade = None
+
+# Map DeepFace emotions to our app emotions
+EMOTION_MAPPING = {
+    'happy': 'Happy',
+    'sad': 'Sad',
+    'angry': 'Angry',
+    'fear': 'Anxious',
+    'surprise': 'Excited',
+    'neutral': 'Neutral',
+    'disgust': 'Stressed'
+}
+APP_EMOTIONS = set(EMOTION_MAPPING.values())
+
+# A DeepFace result on the whole image is accepted at this confidence, one on a face crop at the lower one
+BASE_ACCEPT_CONFIDENCE = 0.5
+CROP_ACCEPT_CONFIDENCE = 0.25
+
+# detector path -> DeepFace backends tried in turn (the next one only if the previous errors)
+DEEPFACE_PATH_BACKENDS = {
+    "retinaface": ("retinaface", "opencv"),
+    "opencv": ("opencv",),
+}
+
+# Rotations tried after the upright view, and how often each one found the face (per process)
+ROTATION_CANDIDATES = (90, 270, 180)
+_rotation_hits = {angle: 0 for angle in ROTATION_CANDIDATES}
+
+
+def rotation_order():
+    """Rotation candidates, most successful first (ties keep the default order)"""
+    return sorted(ROTATION_CANDIDATES, key=lambda angle: -_rotation_hits[angle])
+
+
+def _load_image(image):
+    """Accept a decoded BGR array or (legacy) a file path"""
+    if isinstance(image, np.ndarray):
+        return image
+    img = cv2.imread(image)
+    if img is None:
+        with open(image, 'rb') as f:
+            img = decode_image(f.read())
+    return img
+
+
+def _prepare(image) -> PreparedImage:
+    """PreparedImage as-is; arrays / paths get a downscaled detection copy"""
+    if isinstance(image, PreparedImage):
+        return image
+    return PreparedImage.from_array(_load_image(image))
+
+
+def _rotate(img, angle: int):
+    if angle == 90:
+        return cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
+    if angle == 270:
+        return cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    if angle == 180:
+        return cv2.rotate(img, cv2.ROTATE_180)
+    return img
+
+
+def score_emotions(emotions: dict, dominant_emotion: str):
+    """
+    DeepFace emotion percentages -> (app_emotion, confidence, emotions)
+    using the priority overrides below instead of the raw dominant emotion.
+    """
+    # 🔥 INDUSTRIAL HYBRID EMOTION SCORING - Weighted Logic
+    # Instead of just taking dominant, use weighted scoring with combined emotions
+    
+    # Find top 2 emotions
+    sorted_emotions = sorted(emotions.items(), key=lambda x: x[1], reverse=True)
+    top_emotion = sorted_emotions[0]
+    second_emotion = sorted_emotions[1] if len(sorted_emotions) > 1 else (None, 0)
+    
+    print(f"🥇 Top: {top_emotion[0]} = {top_emotion[1]:.2f}%")
+    print(f"🥈 Second: {second_emotion[0]} = {second_emotion[1]:.2f}%")
+    
+    # 🎯 INDUSTRIAL EMOTION LOGIC - Production-grade detection with clear priority
+    selected_emotion = dominant_emotion
+    confidence = emotions[dominant_emotion] / 100.0
+    
+    fear_val = emotions.get('fear', 0)
+    sad_val = emotions.get('sad', 0)
+    happy_val = emotions.get('happy', 0)
+    angry_val = emotions.get('angry', 0)
+    
+    # Priority 1: Happy (25% threshold AND must be greater than Sad)
+    # Prevents Happy/Sad confusion - Happy gets priority if it's clearly dominant
+    if happy_val > 25.0 and happy_val > sad_val:
+        selected_emotion = 'happy'
+        confidence = happy_val / 100.0
+        print(f"🎭 Override: Happy dominant ({happy_val:.1f}% > 25% AND > Sad {sad_val:.1f}%), selecting Happy")
+    
+    # Priority 2: Crying/Deep Sad (Sad > Fear + 15%)
+    # When Sad is 15% more than Fear, it's crying not stressed
+    elif sad_val > (fear_val + 15.0):
+        selected_emotion = 'sad'
+        confidence = sad_val / 100.0
+        print(f"🎭 Override: Crying detected (Sad {sad_val:.1f}% > Fear {fear_val:.1f}% + 15%), selecting Sad")
+    
+    # Priority 3: Stressed (Fear + Sad > 45%)
+    # Combined anxiety/sadness indicates stress
+    elif (fear_val + sad_val) > 45.0:
+        selected_emotion = 'disgust'  # Map to Stressed
+        confidence = (fear_val + sad_val) / 200.0
+        print(f"🎭 Override: Stressed detected (Fear {fear_val:.1f}% + Sad {sad_val:.1f}% = {fear_val + sad_val:.1f}% > 45%), selecting Stressed")
+    
+    # Priority 4: Angry (10% threshold)
+    elif angry_val > 10.0:
+        selected_emotion = 'angry'
+        confidence = angry_val / 100.0
+        print(f"🎭 Override: Angry detected ({angry_val:.1f}% > 10%), selecting Angry")
+    
+    # Priority 5: Sad alone (15% threshold but only if not overpowered by Happy)
+    elif sad_val > 15.0 and sad_val > happy_val:
+        selected_emotion = 'sad'
+        confidence = sad_val / 100.0
+        print(f"🎭 Override: Sad detected ({sad_val:.1f}% > 15% AND > Happy {happy_val:.1f}%), selecting Sad")
+    
+    # Priority 6: Happy fallback (subtle smiles > 15%)
+    elif happy_val > 15.0:
+        selected_emotion = 'happy'
+        confidence = happy_val / 100.0
+        print(f"🎭 Override: Happy detected ({happy_val:.1f}% > 15%), selecting Happy")
+    
+    # Priority 5: Fear alone (30% threshold)
+    elif emotions.get('fear', 0) > 30.0:
+        selected_emotion = 'fear'
+        confidence = emotions['fear'] / 100.0
+        print(f"🎭 Override: Fear/Anxious detected ({emotions['fear']:.1f}%), selecting Anxious")
+    
+    app_emotion = EMOTION_MAPPING.get(selected_emotion, 'Neutral')
+    
+    print(f"✅ Final: {app_emotion} ({confidence:.2f})")
+    
+    return app_emotion, confidence, emotions
+
+
+def detect_emotion_with_deepface(image, backends=("retinaface", "opencv")):
+    """
+    🎭 AI-Powered Emotion Detection using DeepFace with Improved Accuracy
+    Uses Facenet512 model and RetinaFace detector for best results
+    `image` is a BGR numpy array (or a file path)
+    `backends` are tried in order, moving on only when one errors
+    Returns: (emotion, confidence, all_emotions_dict)
+    """
+    if not DEEPFACE_AVAILABLE:
+        print("⚠️ DeepFace not available, using fallback")
+        return "Neutral", 0.4, {}
+    
+    try:
+        # Analyze with DeepFace — robust attempt across backends
+        # Try RetinaFace first (more accurate), then fallback to OpenCV for tilted/low-light faces.
+        result = None
+        last_exc = None
+        for backend in backends:
+            try:
+                print(f"🔁 Trying DeepFace with backend='{backend}' (enforce_detection=False)")
+                r = DeepFace.analyze(
+                    img_path=image,
+                    actions=['emotion'],
+                    enforce_detection=False,  # never crash if face not clearly detected
+                    detector_backend=backend,
+                    silent=True
+                )
+
+                if isinstance(r, list):
+                    r = r[0]
+
+                # accept result only if it has expected keys
+                if r and isinstance(r, dict) and 'dominant_emotion' in r and 'emotion' in r:
+                    result = r
+                    print(f"✅ DeepFace succeeded with backend='{backend}'")
+                    break
+                else:
+                    print(f"⚠️ DeepFace ({backend}) returned unexpected result: {r}")
+
+            except Exception as e:
+                last_exc = e
+                print(f"⚠️ DeepFace ({backend}) error: {e}")
+                # continue to next backend
+                continue
+
+        if result is None:
+            # let the outer exception handler return the neutral fallback
+            raise Exception(f"DeepFace failed on all backends. Last error: {last_exc}")
+
+        # Get emotions
+        emotions = result['emotion']
+        dominant_emotion = result['dominant_emotion']
+        
+        # Convert numpy values to Python floats for JSON serialization
+        emotions = {k: float(v) for k, v in emotions.items()}
+        
+        print(f"📊 Raw emotions: {emotions}")
+        print(f"🎯 DeepFace dominant: {dominant_emotion}")
+        
+        return score_emotions(emotions, dominant_emotion)
+        
+    except Exception as e:
+        print(f"⚠️ DeepFace error: {e}")
+        return "Neutral", 0.4, {}
+
+
+def _opencv_faces(p_img):
+    gray = cv2.cvtColor(p_img, cv2.COLOR_BGR2GRAY)
+    try:
+        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+        gray = clahe.apply(gray)
+    except Exception:
+        pass
+    faces = face_cascade.detectMultiScale(gray, scaleFactor=1.05, minNeighbors=4, minSize=(30,30))
+    return faces
+
+
+def _haar_face_crop(prep: PreparedImage, pad_ratio: float = 0.2):
+    """Haar detection (upright, then the rotation search) -> padded full-resolution face crop or None"""
+    if face_cascade is None:
+        return None
+    img = prep.small
+
+    # Upright view first; rotated selfies without EXIF orientation get the
+    # remaining angles on the small search copy, best-performing angle first
+    angles = [0]
+    if not prep.upright_known or ROTATION_SEARCH_WITH_EXIF:
+        angles += rotation_order()
+    for angle in angles:
+        p_img = img if angle == 0 else _rotate(prep.search, angle)
+
+        faces = _opencv_faces(p_img)
+        if len(faces) > 0:
+            if angle:
+                _rotation_hits[angle] += 1
+            # pick largest face box, scaled back to the full-resolution image
+            full_img = _rotate(prep.full, angle)
+            box = max(faces, key=lambda r: r[2] * r[3])
+            x, y, w, h = map_box(box, p_img.shape, full_img.shape)
+            pad = int(pad_ratio * max(w, h))
+            x0 = max(0, x - pad)
+            y0 = max(0, y - pad)
+            x1 = min(full_img.shape[1], x + w + pad)
+            y1 = min(full_img.shape[0], y + h + pad)
+            return np.ascontiguousarray(full_img[y0:y1, x0:x1])
+    return None
+
+
+def run_detection_plan(image, plan=None):
+    """
+    Run detector paths (detector_policy.DETECTOR_PATHS) in `plan` order and stop
+    at the first confident result:
+      retinaface / opencv - DeepFace detector box -> emotion model on the crop, accepted at >= 0.5
+      haar_crop           - OpenCV face box -> DeepFace on the crop, accepted at >= 0.25
+    `image` is a PreparedImage, a BGR numpy array or a file path; detection runs on
+    the downscaled copy, the crops are cut from the full-resolution image.
+    Returns: ((emotion, confidence, all_emotions, face_detected:bool, method:str),
+              [(path, succeeded:bool, seconds, confidence|None), ...])
+    """
+    prep = _prepare(image)
+    if prep.small is None:
+        print("❌ preprocess: could not read image")
+        return ("Neutral", 0.4, {}, False, "none"), []
+
+    base = None          # first whole-image DeepFace result - the answer if nothing is confident
+    face_found = False   # OpenCV saw a face even if the crop wasn't confident
+    attempts = []
+    for path in (plan or PHOTO_DETECTOR_PATHS):
+        started = time.perf_counter()
+        result = None
+        try:
+            if path == "haar_crop":
+                crop = _haar_face_crop(prep)
+                if crop is not None:
+                    face_found = True
+                    e2, c2, all2 = detect_emotion_with_deepface(crop)
+                    if c2 >= CROP_ACCEPT_CONFIDENCE:
+                        result = (e2, c2, all2, True, "opencv_crop")
+            elif path in DEEPFACE_PATH_BACKENDS:
+                emotion, conf, all_emotions = _deepface_full_res(prep, DEEPFACE_PATH_BACKENDS[path])
+                if base is None:
+                    base = (emotion, conf, all_emotions)
+                if conf >= BASE_ACCEPT_CONFIDENCE:
+                    result = (emotion, conf, all_emotions, True, "deepface")
+            else:
+                print(f"⚠️ Unknown detector path '{path}' skipped")
+                continue
+        except Exception as e:
+            print(f"❌ detector path '{path}' error: {e}")
+        attempts.append((path, result is not None, time.perf_counter() - started,
+                         result[1] if result is not None else None))
+        if result is not None:
+            return result, attempts
+
+    base_emotion, base_conf, base_all = base or ("Neutral", 0.4, {})
+    return (base_emotion, base_conf, base_all, face_found, "opencv_detect" if face_found else "none"), attempts
+
+
+def detect_emotion_with_preprocessing(image):
+    """
+    Try DeepFace first; if confidence is low, attempt OpenCV face-detection + cropping,
+    rotation attempts and CLAHE preprocessing, then retry DeepFace on the crop
+    (the configured PHOTO_DETECTOR_PATHS order).
+    Returns: (emotion, confidence, all_emotions, face_detected:bool, method:str)
+    """
+    return run_detection_plan(image)[0]
+
+
+# Label order of DeepFace's facial-expression model output
+EMOTION_MODEL_LABELS = ('angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral')
+_emotion_model = None
+# concurrent first calls (quick-path threads) must not each build the model
+_emotion_model_lock = threading.Lock()
+
+
+def _get_emotion_model():
+    """DeepFace's emotion classifier (the Keras model behind analyze(actions=['emotion'])), built once"""
+    global _emotion_model
+    if _emotion_model is None:
+        with _emotion_model_lock:
+            if _emotion_model is None:
+                try:
+                    client = DeepFace.build_model(task="facial_attribute", model_name="Emotion")
+                except TypeError:
+                    # older DeepFace: build_model(model_name)
+                    client = DeepFace.build_model("Emotion")
+                _emotion_model = getattr(client, "model", client)
+    return _emotion_model
+
+
+def warm_emotion_model() -> dict:
+    """Build the emotion model and run one dummy crop through it (blocking) -> {"emotion_model": {"ok", ...}}"""
+    if not DEEPFACE_AVAILABLE:
+        return {}
+    started = time.perf_counter()
+    try:
+        predict_emotions_batch([np.full((48, 48, 3), 128, dtype=np.uint8)])
+    except Exception as e:
+        print(f"⚠️ Emotion model warm-up failed: {e}")
+        return {"emotion_model": {"ok": False, "error": str(e)}}
+    seconds = round(time.perf_counter() - started, 2)
+    print(f"🔥 Emotion model warm (pid {os.getpid()}) in {seconds}s")
+    return {"emotion_model": {"ok": True, "seconds": seconds}}
+
+
+def _deepface_face_crop(prep: PreparedImage, backend: str = "retinaface"):
+    """DeepFace detector box (RetinaFace by default) on the detection copy -> tight full-resolution face crop or None"""
+    faces = DeepFace.extract_faces(img_path=prep.small, detector_backend=backend,
+                                   enforce_detection=False, align=False)
+    # confidence 0 = no face (DeepFace returned the whole image); some backends leave it None
+    boxes = [f["facial_area"] for f in faces or [] if f.get("confidence") != 0]
+    if not boxes:
+        return None
+    area = max(boxes, key=lambda b: b["w"] * b["h"])
+    x, y, w, h = map_box((area["x"], area["y"], area["w"], area["h"]), prep.small.shape, prep.full.shape)
+    return np.ascontiguousarray(prep.full[max(0, y):y + h, max(0, x):x + w])
+
+
+def predict_emotions_batch(faces):
+    """One forward pass of the emotion model over all face crops -> [{emotion: percent}, ...]"""
+    batch = np.stack([
+        cv2.resize(cv2.cvtColor(face, cv2.COLOR_BGR2GRAY), (48, 48)).astype(np.float32) / 255.0
+        for face in faces
+    ])[..., np.newaxis]
+    predictions = np.asarray(_get_emotion_model().predict(batch, verbose=0))
+    results = []
+    for row in predictions:
+        total = float(row.sum()) or 1.0
+        results.append({label: float(100.0 * row[i] / total) for i, label in enumerate(EMOTION_MODEL_LABELS)})
+    return results
+
+
+def _deepface_full_res(prep: PreparedImage, backends):
+    """
+    Whole-image DeepFace path: the first backend that runs finds the face on the
+    detection copy and the emotion model classifies the full-resolution crop, so a
+    small face in a large photo is not classified from its downscaled pixels.
+    No face box (or no downscaling) -> DeepFace.analyze on the detection copy as before.
+    Returns: (emotion, confidence, all_emotions_dict)
+    """
+    if not DEEPFACE_AVAILABLE or not prep.downscaled:
+        return detect_emotion_with_deepface(prep.small, backends=backends)
+    for backend in backends:
+        try:
+            crop = _deepface_face_crop(prep, backend)
+        except Exception as e:
+            print(f"⚠️ DeepFace ({backend}) face box error: {e}")
+            continue
+        if crop is None or crop.size == 0:
+            break
+        try:
+            emotions = predict_emotions_batch([crop])[0]
+        except Exception as e:
+            # model API differs in this DeepFace version - let analyze() classify the crop
+            print(f"⚠️ Emotion model on full-resolution crop failed ({e}); using DeepFace.analyze")
+            return detect_emotion_with_deepface(crop, backends=backends)
+        print(f"✅ DeepFace ({backend}) box, emotion classified at full resolution {crop.shape[1]}x{crop.shape[0]}")
+        return score_emotions(emotions, max(emotions, key=emotions.get))
+    return detect_emotion_with_deepface(prep.small, backends=backends)
+
+
+def quick_emotion(image):
+    """
+    Coarse first answer for two-phase photo results: Haar face crop + one
+    emotion-model pass, no DeepFace detectors. Tens of milliseconds instead of
+    seconds; the full pipeline's result replaces it later.
+    Returns (emotion, confidence, all_emotions, face_detected, "quick").
+    """
+    prep = _prepare(image)
+    if prep.small is None:
+        return "Neutral", 0.4, {}, False, "quick"
+    crop = _haar_face_crop(prep, pad_ratio=0.1)
+    if crop is None or not DEEPFACE_AVAILABLE:
+        return "Neutral", 0.4, {}, crop is not None, "quick"
+    try:
+        emotions = predict_emotions_batch([crop])[0]
+    except Exception as e:
+        # a coarse answer is still owed - the refinement brings the real emotion
+        print(f"⚠️ Emotion model failed on the quick crop: {e}")
+        return "Neutral", 0.4, {}, True, "quick"
+    emotion, confidence, emotions = score_emotions(emotions, max(emotions, key=emotions.get))
+    return emotion, confidence, emotions, True, "quick"
+
+
+def analyze_batch(images):
+    """
+    Emotion for several photos with a single emotion-model forward pass: each photo's
+    face is located first (Haar crop, then RetinaFace), then all crops are classified together.
+    `images` are PreparedImages (None / undecodable entries come back as None).
+    Returns: [(emotion, confidence, all_emotions, face_detected:bool, method:str) | None, ...]
+    """
+    located = []   # (index, crop, face_detected, method)
+    for i, prep in enumerate(images):
+        if prep is None or prep.small is None:
+            continue
+        crop, method = _haar_face_crop(prep, pad_ratio=0.0), "opencv_crop"
+        if crop is None and DEEPFACE_AVAILABLE:
+            try:
+                crop, method = _deepface_face_crop(prep), "deepface"
+            except Exception as e:
+                print(f"⚠️ RetinaFace box for batch item {i} failed: {e}")
+                crop = None
+        if crop is None or crop.size == 0:
+            located.append((i, prep.small, False, "none"))
+        else:
+            located.append((i, crop, True, method))
+
+    results = [None] * len(images)
+    if not located:
+        return results
+    if not DEEPFACE_AVAILABLE:
+        for i, _, face_detected, method in located:
+            results[i] = ("Neutral", 0.4, {}, face_detected, method)
+        return results
+
+    try:
+        all_emotions = predict_emotions_batch([crop for _, crop, _, _ in located])
+        print(f"📦 Emotion model ran once for {len(located)} photos")
+    except Exception as e:
+        # model API differs in this DeepFace version - classify the crops one by one instead
+        print(f"⚠️ Batched emotion inference failed ({e}); analysing crops individually")
+        for i, crop, face_detected, method in located:
+            emotion, confidence, emotions = detect_emotion_with_deepface(crop)
+            results[i] = (emotion, confidence, emotions, face_detected, method)
+        return results
+
+    for (i, _, face_detected, method), emotions in zip(located, all_emotions):
+        dominant = max(emotions, key=emotions.get)
+        emotion, confidence, emotions = score_emotions(emotions, dominant)
+        results[i] = (emotion, confidence, emotions, face_detected, method)
+    return results
+
+
+# Client face-box hints: smallest plausible face side (px, full image) and the allowed w/h ratio
+FACE_HINT_MIN_SIZE = int(os.getenv("FACE_HINT_MIN_SIZE", "24"))
+FACE_HINT_ASPECT_RANGE = (0.5, 2.0)
+# a crop this flat (grey-level std) is not a face - blank / covered lens / wrong coordinates
+FACE_HINT_MIN_CONTRAST = float(os.getenv("FACE_HINT_MIN_CONTRAST", "8"))
+# Haar check on the (upright) area around the box before trusting it; searched at most this size
+FACE_HINT_VERIFY = os.getenv("FACE_HINT_VERIFY", "true").lower() in ("1", "true", "yes")
+FACE_HINT_VERIFY_MAX_DIM = 240
+
+
+def parse_face_hint(face_box, rotation=None):
+    """Client face box -> {"box": (x, y, w, h), "rotation": deg} or None if it can't be read.
+
+    `face_box` is a dict ({x, y, w|width, h|height}), a JSON string of one, or "x,y,w,h".
+    Values <= 1 are fractions of the image size, otherwise pixels of the upright
+    (EXIF-rotated) image. `rotation` is the clockwise turn that makes the face upright.
+    """
+    if face_box is None or face_box == "":
+        return None
+    try:
+        if isinstance(face_box, str):
+            face_box = face_box.strip()
+            face_box = json.loads(face_box) if face_box.startswith(("{", "[")) else face_box.split(",")
+        if isinstance(face_box, dict):
+            values = (face_box.get("x", face_box.get("left")), face_box.get("y", face_box.get("top")),
+                      face_box.get("w", face_box.get("width")), face_box.get("h", face_box.get("height")))
+            if rotation is None:
+                rotation = face_box.get("rotation")
+        else:
+            values = tuple(face_box)
+        x, y, w, h = (float(v) for v in values)
+        rotation = int(round(float(rotation or 0) / 90.0)) * 90 % 360
+    except Exception:
+        return None
+    return {"box": (x, y, w, h), "rotation": rotation}
+
+
+def _hint_has_face(area: np.ndarray) -> bool:
+    """Cheap Haar check that an upright area around a client box really holds a face"""
+    if not FACE_HINT_VERIFY or face_cascade is None:
+        return True
+    h, w = area.shape[:2]
+    scale = min(1.0, FACE_HINT_VERIFY_MAX_DIM / float(max(h, w)))
+    if scale < 1.0:
+        area = cv2.resize(area, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    return len(_opencv_faces(area)) > 0
+
+
+def hinted_face_crop(prep: PreparedImage, hint: dict):
+    """Full-resolution crop for a client face box, turned upright, or None if the box is implausible
+    (size / shape / contrast, then a Haar face check on a slightly larger area)"""
+    full = prep.full
+    img_h, img_w = full.shape[:2]
+    x, y, w, h = hint["box"]
+    if max(x, y, w, h) <= 1.0:
+        x, y, w, h = x * img_w, y * img_h, w * img_w, h * img_h
+    if w < FACE_HINT_MIN_SIZE or h < FACE_HINT_MIN_SIZE:
+        return None
+    if not FACE_HINT_ASPECT_RANGE[0] <= w / h <= FACE_HINT_ASPECT_RANGE[1]:
+        return None
+    x0, y0 = max(0, int(x)), max(0, int(y))
+    x1, y1 = min(img_w, int(x + w)), min(img_h, int(y + h))
+    # most of the box must lie inside the image
+    if x1 <= x0 or y1 <= y0 or (x1 - x0) * (y1 - y0) < 0.8 * w * h:
+        return None
+    pad = int(0.1 * max(w, h))
+    crop = full[max(0, y0 - pad):min(img_h, y1 + pad), max(0, x0 - pad):min(img_w, x1 + pad)]
+    if float(cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY).std()) < FACE_HINT_MIN_CONTRAST:
+        return None
+    # the cascade needs some margin around the face; a box drawn tight to the skin still passes
+    margin = int(0.3 * max(w, h))
+    area = full[max(0, y0 - margin):min(img_h, y1 + margin), max(0, x0 - margin):min(img_w, x1 + margin)]
+    if not _hint_has_face(_rotate(area, hint["rotation"])):
+        return None
+    return np.ascontiguousarray(_rotate(crop, hint["rotation"]))
+
+
+def analyze_with_face_hint(image, hint: dict):
+    """
+    Emotion classifier only, on the client's face box - no server-side detection.
+    Returns (emotion, confidence, all_emotions, True, "client_hint") or None when the
+    hint is rejected (the caller falls back to full detection).
+    """
+    prep = _prepare(image)
+    if prep.small is None or not hint:
+        return None
+    crop = hinted_face_crop(prep, hint)
+    if crop is None:
+        print(f"⚠️ Client face box rejected: {hint}")
+        return None
+    if not DEEPFACE_AVAILABLE:
+        return "Neutral", 0.4, {}, True, "client_hint"
+    try:
+        emotions = predict_emotions_batch([crop])[0]
+    except Exception as e:
+        print(f"⚠️ Emotion model on client face box failed ({e}); using full detection")
+        return None
+    emotion, confidence, emotions = score_emotions(emotions, max(emotions, key=emotions.get))
+    return emotion, confidence, emotions, True, "client_hint"
@@ -0,0 +1,226 @@
+"""
+Frame-sequence emotion - a short burst of camera frames (or a short clip)
+in, one temporally smoothed emotion out. Runs in the photo workers.
+
+  1. frame selection: near-duplicate frames (mean thumbnail difference below
+     FRAME_DIFF_THRESHOLD) are skipped, the rest evenly thinned to
+     FRAME_MAX_ANALYZED
+  2. face tracking: full Haar detection every FRAME_REDETECT_EVERY selected
+     frames; in between only the area around the previous box is searched,
+     and the previous box is reused if that misses (at most FRAME_MAX_REUSE
+     frames in a row - then the face counts as gone until it is detected again)
+  3. one emotion-model forward pass over the selected face crops
+     (face_emotion.predict_emotions_batch, per-crop DeepFace as fallback)
+  4. exponential smoothing of the per-frame emotion scores, scored with the
+     usual priority overrides
+
+Frames are decoded straight to FRAME_DETECT_MAX_DIM (image_prep.reduced_decode)
+and clip frames are downscaled as they are read, so a burst never holds
+full-size frames in memory. The result carries per-stage `timing_ms`.
+"""
+import os
+import time
+import tempfile
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+import face_emotion
+from image_prep import downscale, reduced_decode
+
+FRAME_MAX_ANALYZED = int(os.getenv("FRAME_MAX_ANALYZED", "8"))
+FRAME_MAX_RECEIVED = int(os.getenv("FRAME_MAX_RECEIVED", "90"))
+FRAME_DIFF_THRESHOLD = float(os.getenv("FRAME_DIFF_THRESHOLD", "6"))
+FRAME_REDETECT_EVERY = int(os.getenv("FRAME_REDETECT_EVERY", "4"))
+FRAME_SMOOTHING_ALPHA = float(os.getenv("FRAME_SMOOTHING_ALPHA", "0.5"))
+FRAME_DETECT_MAX_DIM = int(os.getenv("FRAME_DETECT_MAX_DIM", "480"))
+# Selected frames in a row that may keep the last face box when tracking loses it
+FRAME_MAX_REUSE = int(os.getenv("FRAME_MAX_REUSE", "2"))
+# Largest clip accepted by /api/v1/analyze-emotion/frames (it is written to a temp file to decode)
+FRAME_VIDEO_MAX_BYTES = int(os.getenv("FRAME_VIDEO_MAX_BYTES", str(10 * 1024 * 1024)))
+
+
+def _thumb(img: np.ndarray) -> np.ndarray:
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, (64, 64), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+
+def select_frames(frames: List[np.ndarray], threshold: float = FRAME_DIFF_THRESHOLD,
+                  max_frames: int = FRAME_MAX_ANALYZED) -> List[int]:
+    """Indices of frames that differ enough from the last kept frame, thinned to max_frames"""
+    selected, last = [], None
+    for i, frame in enumerate(frames):
+        thumb = _thumb(frame)
+        if last is None or float(np.mean(np.abs(thumb - last))) >= threshold:
+            selected.append(i)
+            last = thumb
+    if len(selected) > max_frames:
+        picks = np.linspace(0, len(selected) - 1, max_frames).round().astype(int)
+        selected = [selected[p] for p in sorted(set(picks))]
+    return selected
+
+
+def _largest_face(img: np.ndarray, roi=None):
+    """Largest Haar face box (x, y, w, h) in img, optionally only inside roi"""
+    if face_emotion.face_cascade is None:
+        return None
+    ox, oy = 0, 0
+    if roi is not None:
+        ox, oy, rw, rh = roi
+        img = img[oy:oy + rh, ox:ox + rw]
+        if img.size == 0:
+            return None
+    faces = face_emotion._opencv_faces(img)
+    if len(faces) == 0:
+        return None
+    x, y, w, h = max(faces, key=lambda r: r[2] * r[3])
+    return int(x + ox), int(y + oy), int(w), int(h)
+
+
+def _around(box, shape, ratio: float = 0.5):
+    """Box grown by `ratio` of its size on each side, clipped to the frame"""
+    x, y, w, h = box
+    dx, dy = int(w * ratio), int(h * ratio)
+    x0, y0 = max(0, x - dx), max(0, y - dy)
+    x1, y1 = min(shape[1], x + w + dx), min(shape[0], y + h + dy)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def track_faces(frames: List[np.ndarray], indices: List[int], redetect_every: int = FRAME_REDETECT_EVERY,
+                max_reuse: int = FRAME_MAX_REUSE):
+    """[(box | None, how), ...] per selected frame; how is detect / track / reuse / none"""
+    tracked, prev, since_detect, reused = [], None, 0, 0
+    for i in indices:
+        img = frames[i]
+        box, how = None, "none"
+        if prev is not None and since_detect < redetect_every:
+            box = _largest_face(img, roi=_around(prev, img.shape))
+            if box is not None:
+                how = "track"
+            since_detect += 1
+        if box is None and (prev is None or since_detect >= redetect_every):
+            box = _largest_face(img)
+            if box is not None:
+                how, since_detect = "detect", 0
+        if box is None and prev is not None:
+            if reused < max_reuse:
+                # face briefly lost (blur, turn) - keep the last box
+                box, how = prev, "reuse"
+                reused += 1
+            else:
+                # lost for too long - the face has left; the next frame gets a full detection
+                prev = None
+        if how in ("detect", "track"):
+            reused = 0
+        tracked.append((box, how))
+        if box is not None:
+            prev = box
+    return tracked
+
+
+def _crop(img: np.ndarray, box, pad_ratio: float = 0.1) -> np.ndarray:
+    x, y, w, h = box
+    pad = int(pad_ratio * max(w, h))
+    return np.ascontiguousarray(img[max(0, y - pad):min(img.shape[0], y + h + pad),
+                                    max(0, x - pad):min(img.shape[1], x + w + pad)])
+
+
+def smooth_emotions(series: List[dict], alpha: float = FRAME_SMOOTHING_ALPHA) -> dict:
+    """Exponential moving average of per-frame emotion percentages (later frames weigh more)"""
+    smoothed = None
+    for emotions in series:
+        if smoothed is None:
+            smoothed = dict(emotions)
+            continue
+        for key in set(smoothed) | set(emotions):
+            smoothed[key] = alpha * emotions.get(key, 0.0) + (1 - alpha) * smoothed.get(key, 0.0)
+    return smoothed or {}
+
+
+def decode_video(video_bytes: bytes, max_frames: int = FRAME_MAX_RECEIVED,
+                 max_dim: int = FRAME_DETECT_MAX_DIM) -> List[np.ndarray]:
+    """Frames of a short clip, evenly strided down to max_frames and downscaled to max_dim as read"""
+    # VideoCapture only reads from a path / URL, so the clip has to touch the disk here
+    with tempfile.NamedTemporaryFile(suffix=".mp4") as tmp:
+        tmp.write(video_bytes)
+        tmp.flush()
+        cap = cv2.VideoCapture(tmp.name)
+        try:
+            total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+            stride = max(1, -(-total // max_frames)) if total > 0 else 1
+            frames, i = [], 0
+            while len(frames) < max_frames:
+                ok = cap.grab()
+                if not ok:
+                    break
+                if i % stride == 0:
+                    ok, frame = cap.retrieve()
+                    if ok and frame is not None:
+                        frames.append(downscale(frame, max_dim))
+                i += 1
+        finally:
+            cap.release()
+    return frames
+
+
+def _ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def analyze_frames(frames: List[np.ndarray], timing: Optional[dict] = None) -> dict:
+    """Smoothed emotion over a frame sequence (see module docstring)"""
+    timing = dict(timing or {})
+    frames = [downscale(f, FRAME_DETECT_MAX_DIM) for f in frames if f is not None]
+    result = {
+        "emotion": "Neutral", "confidence": 0.4, "all_emotions": {}, "face_detected": False,
+        "frames_received": len(frames), "frames_analyzed": 0, "detections": 0, "timeline": [],
+        "timing_ms": timing,
+    }
+    if not frames:
+        return result
+
+    started = time.perf_counter()
+    indices = select_frames(frames)
+    timing["select"] = _ms(started)
+    started = time.perf_counter()
+    tracked = track_faces(frames, indices)
+    timing["track"] = _ms(started)
+    faces = [(i, _crop(frames[i], box)) for i, (box, _) in zip(indices, tracked) if box is not None]
+    result["frames_analyzed"] = len(indices)
+    result["detections"] = sum(1 for _, how in tracked if how == "detect")
+    if not faces:
+        return result
+    result["face_detected"] = True
+    if not face_emotion.DEEPFACE_AVAILABLE:
+        return result
+
+    started = time.perf_counter()
+    try:
+        series = face_emotion.predict_emotions_batch([crop for _, crop in faces])
+        scored = [(i, emotions) for (i, _), emotions in zip(faces, series)]
+    except Exception as e:
+        print(f"⚠️ Batched emotion inference failed ({e}); analysing frames individually")
+        scored = [(i, face_emotion.detect_emotion_with_deepface(crop)[2]) for i, crop in faces]
+        scored = [(i, emotions) for i, emotions in scored if emotions]
+        if not scored:
+            return result
+    timing["classify"] = _ms(started)
+
+    for i, emotions in scored:
+        dominant = max(emotions, key=emotions.get)
+        result["timeline"].append({"index": i, "emotion": face_emotion.EMOTION_MAPPING.get(dominant, "Neutral"),
+                                   "score": round(emotions[dominant] / 100.0, 3)})
+    smoothed = smooth_emotions([emotions for _, emotions in scored])
+    emotion, confidence, smoothed = face_emotion.score_emotions(smoothed, max(smoothed, key=smoothed.get))
+    result.update({"emotion": emotion, "confidence": confidence, "all_emotions": smoothed})
+    return result
+
+
+def run_frames_pipeline(frames: Optional[List[bytes]] = None, video: Optional[bytes] = None) -> dict:
+    """Worker entry point: encoded frames and/or a clip -> analyze_frames result"""
+    started = time.perf_counter()
+    decoded = [reduced_decode(f, FRAME_DETECT_MAX_DIM) for f in (frames or [])[:FRAME_MAX_RECEIVED]]
+    if video and len(video) <= FRAME_VIDEO_MAX_BYTES and len(decoded) < FRAME_MAX_RECEIVED:
+        decoded += decode_video(video, FRAME_MAX_RECEIVED - len(decoded))
+    return analyze_frames([f for f in decoded if f is not None], {"decode": _ms(started)})
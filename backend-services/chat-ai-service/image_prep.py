@@ -0,0 +1,221 @@
+"""
+Image preprocessing for face detection - decode uploads at reduced
+resolution (libjpeg DCT scaling via IMREAD_REDUCED_*), cap the detection
+image at DETECT_MAX_DIM, apply the EXIF orientation, and map face boxes
+back to the full-resolution image (decoded lazily, only when a crop is
+actually needed).
+
+Run `python image_prep.py <photo_dir> [max_dim ...]` to benchmark latency
+vs. accuracy at several detection sizes. Ground truth is optional: a
+`labels.json` ({"file.jpg": "Happy"}) in the directory, or a filename
+prefix such as `happy_001.jpg`.
+"""
+import io
+import os
+from typing import Optional
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Longest side of the image used for detection (0 = detect on the full-size image)
+DETECT_MAX_DIM = int(os.getenv("DETECT_MAX_DIM", "640"))
+
+# Longest side for the rotated-candidate search (90/270/180) - cheaper than the detection copy
+ROTATION_SEARCH_MAX_DIM = int(os.getenv("ROTATION_SEARCH_MAX_DIM", "320"))
+# Also search rotations when the upload carried an EXIF orientation (normally it is already upright)
+ROTATION_SEARCH_WITH_EXIF = os.getenv("ROTATION_SEARCH_WITH_EXIF", "false").lower() in ("1", "true", "yes")
+
+_REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+# orientation is applied explicitly (apply_orientation) so every decode path agrees
+_IGNORE_ORIENTATION = cv2.IMREAD_IGNORE_ORIENTATION
+
+_EXIF_ORIENTATION_TAG = 0x0112
+
+
+def apply_orientation(img: np.ndarray, orientation: Optional[int]) -> np.ndarray:
+    """Rotate / flip a decoded image so it displays upright per its EXIF orientation (1-8)"""
+    if img is None or not orientation or orientation == 1:
+        return img
+    if orientation == 2:
+        return cv2.flip(img, 1)
+    if orientation == 3:
+        return cv2.rotate(img, cv2.ROTATE_180)
+    if orientation == 4:
+        return cv2.flip(img, 0)
+    if orientation == 5:
+        return cv2.transpose(img)
+    if orientation == 6:
+        return cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
+    if orientation == 7:
+        return cv2.flip(cv2.transpose(img), -1)
+    if orientation == 8:
+        return cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return img
+
+
+def decode_image(image_bytes: bytes, flags: int = cv2.IMREAD_COLOR, orientation: Optional[int] = None):
+    """Raw upload bytes -> upright BGR numpy array (None if undecodable)"""
+    if orientation is None:
+        orientation = header_info(image_bytes)[1]
+    img = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), flags | _IGNORE_ORIENTATION)
+    if img is None:
+        # formats OpenCV can't read (e.g. some WebP/GIF variants) - let PIL try
+        try:
+            pil_img = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+            img = cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
+        except Exception as e:
+            print(f"❌ could not decode image: {e}")
+            return None
+    return apply_orientation(img, orientation)
+
+
+def downscale(img: np.ndarray, max_dim: int) -> np.ndarray:
+    h, w = img.shape[:2]
+    longest = max(h, w)
+    if not max_dim or longest <= max_dim:
+        return img
+    scale = max_dim / float(longest)
+    return cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+
+
+def header_info(image_bytes: bytes):
+    """((width, height), EXIF orientation) from the image header without decoding pixels"""
+    try:
+        pil_img = Image.open(io.BytesIO(image_bytes))
+        try:
+            orientation = pil_img.getexif().get(_EXIF_ORIENTATION_TAG)
+        except Exception:
+            orientation = None
+        return pil_img.size, orientation
+    except Exception:
+        return None, None
+
+
+def reduced_decode(image_bytes: bytes, max_dim: int, size=None, orientation: Optional[int] = None):
+    """Decode at the largest power-of-two reduction that still covers max_dim, then resize to it"""
+    if size is None:
+        size, orientation = header_info(image_bytes)
+    if max_dim and size:
+        longest = max(size)
+        for factor, flag in _REDUCED_FLAGS:
+            if longest / factor >= max_dim:
+                img = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), flag | _IGNORE_ORIENTATION)
+                if img is not None:
+                    return downscale(apply_orientation(img, orientation), max_dim)
+                break
+    img = decode_image(image_bytes, orientation=orientation or 0)
+    return downscale(img, max_dim) if img is not None else None
+
+
+def map_box(box, from_shape, to_shape):
+    """Scale an (x, y, w, h) box between two resolutions of the same image"""
+    sy = to_shape[0] / float(from_shape[0])
+    sx = to_shape[1] / float(from_shape[1])
+    x, y, w, h = box
+    return int(round(x * sx)), int(round(y * sy)), int(round(w * sx)), int(round(h * sy))
+
+
+class PreparedImage:
+    """A photo as used by the detection pipeline: small detection copy + lazily decoded full image"""
+
+    def __init__(self, small: np.ndarray, full: np.ndarray = None, image_bytes: bytes = None,
+                 orientation: Optional[int] = None):
+        self.small = small
+        self._full = full
+        self._bytes = image_bytes
+        self._search = None
+        # EXIF orientation tag of the upload (None = no tag, orientation unknown)
+        self.orientation = orientation
+
+    @classmethod
+    def from_bytes(cls, image_bytes: bytes, max_dim: int = DETECT_MAX_DIM) -> "PreparedImage":
+        size, orientation = header_info(image_bytes)
+        small = reduced_decode(image_bytes, max_dim, size=size, orientation=orientation)
+        return cls(small, image_bytes=image_bytes, orientation=orientation)
+
+    @classmethod
+    def from_array(cls, img: np.ndarray, max_dim: int = DETECT_MAX_DIM) -> "PreparedImage":
+        return cls(downscale(img, max_dim) if img is not None else None, full=img)
+
+    @property
+    def full(self) -> np.ndarray:
+        if self._full is None:
+            if self._bytes is not None:
+                self._full = decode_image(self._bytes, orientation=self.orientation or 0)
+            if self._full is None:
+                self._full = self.small
+        return self._full
+
+    @property
+    def search(self) -> np.ndarray:
+        """Smaller copy used to try the rotated candidates"""
+        if self._search is None and self.small is not None:
+            self._search = downscale(self.small, ROTATION_SEARCH_MAX_DIM)
+        return self._search
+
+    @property
+    def upright_known(self) -> bool:
+        """The upload carried an EXIF orientation, so the (already applied) upright view can be trusted"""
+        return self.orientation is not None
+
+    @property
+    def downscaled(self) -> bool:
+        return self._full is not self.small
+
+
+def benchmark(photo_dir: str, sizes=(0, 1280, 960, 640, 480, 320)) -> dict:
+    """Per detection size: avg latency, face-detection rate, agreement with the full-size result
+    and (when labels are known) accuracy"""
+    import json
+    import time
+    import face_emotion
+
+    labels = {}
+    labels_path = os.path.join(photo_dir, "labels.json")
+    if os.path.exists(labels_path):
+        with open(labels_path, "r", encoding="utf-8") as f:
+            labels = json.load(f)
+    files = sorted(f for f in os.listdir(photo_dir) if f.lower().endswith((".jpg", ".jpeg", ".png", ".webp")))
+    photos = {}
+    for name in files:
+        with open(os.path.join(photo_dir, name), "rb") as f:
+            photos[name] = f.read()
+        if name not in labels and "_" in name:
+            labels[name] = name.split("_", 1)[0].capitalize()
+
+    reference = {}
+    report = {}
+    for max_dim in sizes:
+        latencies, faces, agree, correct, labelled = [], 0, 0, 0, 0
+        for name, data in photos.items():
+            started = time.perf_counter()
+            prep = PreparedImage.from_bytes(data, max_dim)
+            emotion, _, _, face_detected, _ = face_emotion.detect_emotion_with_preprocessing(prep)
+            latencies.append(time.perf_counter() - started)
+            faces += bool(face_detected)
+            if max_dim == sizes[0]:
+                reference[name] = emotion
+            agree += reference.get(name) == emotion
+            if labels.get(name) in face_emotion.APP_EMOTIONS:
+                labelled += 1
+                correct += labels[name] == emotion
+        n = len(photos) or 1
+        report[str(max_dim or "full")] = {
+            "avg_ms": round(sum(latencies) / n * 1000, 1),
+            "p95_ms": round(sorted(latencies)[int(0.95 * (len(latencies) - 1))] * 1000, 1) if latencies else None,
+            "face_rate": round(faces / n, 3),
+            "agreement_with_full": round(agree / n, 3),
+            "accuracy": round(correct / labelled, 3) if labelled else None,
+        }
+    return {"photos": len(photos), "labelled": sum(1 for f in files if labels.get(f)), "sizes": report}
+
+
+if __name__ == "__main__":
+    import sys
+    import json
+    if len(sys.argv) < 2:
+        print("usage: python image_prep.py <photo_dir> [max_dim ...]  (0 = full size)")
+        sys.exit(1)
+    sizes = tuple(int(s) for s in sys.argv[2:]) or (0, 1280, 960, 640, 480, 320)
+    print(json.dumps(benchmark(sys.argv[1], sizes), indent=2))
@@ -0,0 +1,108 @@
+"""
+DeepFace warm-up - builds the emotion model and the face detectors at
+startup (one dummy inference per detector backend, in this process or in
+each photo worker process) so the first photo after a restart doesn't pay
+for model construction and weight loading.
+`/ready` reports the state so a load balancer can hold photos back until
+the instance is warm.
+"""
+import os
+import time
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+DEEPFACE_WARMUP = os.getenv("DEEPFACE_WARMUP", "true").lower() in ("1", "true", "yes")
+DEEPFACE_WARMUP_BACKENDS = [b.strip() for b in os.getenv(
+    "DEEPFACE_WARMUP_BACKENDS", "retinaface,opencv"
+).split(",") if b.strip()]
+
+
+def _dummy_image() -> np.ndarray:
+    """Plain grey frame with a rough face shape - enough to push every layer through once"""
+    import cv2
+    img = np.full((256, 256, 3), 128, dtype=np.uint8)
+    cv2.ellipse(img, (128, 128), (70, 90), 0, 0, 360, (190, 200, 220), -1)
+    for x in (100, 156):
+        cv2.circle(img, (x, 110), 8, (40, 40, 40), -1)
+    cv2.ellipse(img, (128, 165), (25, 10), 0, 0, 180, (60, 60, 120), 3)
+    return img
+
+
+def warm_backends(deepface, backends=None, face_cascade=None) -> dict:
+    """One dummy analysis per detector backend (blocking) -> {backend: {"ok", "seconds" | "error"}}"""
+    img = _dummy_image()
+    results = {}
+    for backend in (backends or DEEPFACE_WARMUP_BACKENDS):
+        started = time.perf_counter()
+        try:
+            deepface.analyze(img_path=img.copy(), actions=['emotion'], enforce_detection=False,
+                             detector_backend=backend, silent=True)
+            results[backend] = {"ok": True, "seconds": round(time.perf_counter() - started, 2)}
+            print(f"🔥 DeepFace warm (pid {os.getpid()}): backend='{backend}' in {results[backend]['seconds']}s")
+        except Exception as e:
+            results[backend] = {"ok": False, "error": str(e)}
+            print(f"⚠️ DeepFace warm-up failed for backend='{backend}': {e}")
+
+    if face_cascade is not None:
+        try:
+            import cv2
+            face_cascade.detectMultiScale(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY))
+        except Exception as e:
+            print(f"⚠️ Haar cascade warm-up failed: {e}")
+    return results
+
+
+class InferenceReadiness:
+    """cold -> warming -> ready | failed ; 'unavailable' when DeepFace isn't installed"""
+
+    def __init__(self):
+        self.status = "cold"
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self.backends = {}
+        self._lock = threading.Lock()
+
+    def is_ready(self) -> bool:
+        return self.status == "ready"
+
+    def run(self, warm_fn):
+        """Record the state around `warm_fn() -> {backend: result}` (blocking - call from a thread)"""
+        with self._lock:
+            if self.status in ("warming", "ready"):
+                return
+            self.status = "warming"
+            self.started_at = datetime.now(timezone.utc).isoformat()
+        try:
+            results = warm_fn() or {}
+            error = None if any(r.get("ok") for r in results.values()) else "no detector backend could be warmed"
+        except Exception as e:
+            results, error = {}, str(e)
+            print(f"⚠️ Inference warm-up failed: {e}")
+        with self._lock:
+            self.backends = results
+            self.finished_at = datetime.now(timezone.utc).isoformat()
+            self.error = error
+            self.status = "failed" if error else "ready"
+
+    def warm(self, deepface, available: bool, backends=None, face_cascade=None):
+        """Warm the models in this process"""
+        if not available or deepface is None:
+            self.status = "unavailable"
+            return
+        self.run(lambda: warm_backends(deepface, backends, face_cascade))
+
+    def snapshot(self) -> dict:
+        return {
+            "status": self.status,
+            "ready": self.is_ready(),
+            "backends": dict(self.backends),
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+
+
+inference_readiness = InferenceReadiness()
@@ -0,0 +1,283 @@
+"""
+Tolerant parser for LLM chat output - recovers `reply` / `emotion` from
+truncated JSON, prose-wrapped JSON, code fences or single-quoted dicts
+without a second LLM call.
+
+Run `python json_salvage.py [corpus.jsonl]` to benchmark against a
+malformed-completion corpus (each line: {"raw": "...", "method": expected}).
+The default is the synthetic seed corpus in tests/fixtures; pass
+MALFORMED_CORPUS_PATH explicitly to benchmark captured completions.
+
+Capturing production completions into that corpus is off by default - they
+are users' conversations. When enabled they are written by a background
+thread to MALFORMED_CORPUS_PATH (outside the source tree), and capture stops
+once the file reaches MALFORMED_CORPUS_MAX_BYTES.
+"""
+import os
+import re
+import ast
+import json
+import time
+import queue
+import threading
+from collections import Counter
+from typing import Optional, Tuple
+
+DATA_DIR = os.getenv("SOULBUDDY_DATA_DIR") or os.path.join(os.path.expanduser("~"), ".soulbuddy")
+MALFORMED_CORPUS_PATH = os.getenv("MALFORMED_CORPUS_PATH") or os.path.join(DATA_DIR, "malformed_completions.jsonl")
+# Append unparseable completions seen in production to the corpus (for benchmarking)
+CAPTURE_MALFORMED = os.getenv("CAPTURE_MALFORMED_COMPLETIONS", "false").lower() in ("1", "true", "yes")
+MALFORMED_CORPUS_MAX_BYTES = int(os.getenv("MALFORMED_CORPUS_MAX_BYTES", str(5 * 1024 * 1024)))
+# Synthetic (no user data) completions shipped with the repo - the benchmark's default input
+SEED_CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "tests", "fixtures", "malformed_completions.jsonl")
+
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE)
+_KEY_RE = {
+    key: re.compile(r"""["']?%s["']?\s*[:=]\s*(["'])""" % key, re.IGNORECASE)
+    for key in ("reply", "emotion")
+}
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", "/": "/", "\\": "\\", '"': '"', "'": "'"}
+
+_lock = threading.Lock()
+_counts = Counter()
+_capture_queue: "queue.Queue" = queue.Queue(maxsize=100)
+_capture_thread = None
+_capture_stats = Counter()
+
+
+def _first_object(text: str) -> Optional[str]:
+    """Return the first balanced {...} block in `text` (string-aware), or None"""
+    start = text.find("{")
+    if start < 0:
+        return None
+    depth = 0
+    quote = None
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if quote:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == quote:
+                quote = None
+            continue
+        if ch in ("\"", "'"):
+            quote = ch
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+
+def _scan_string(text: str, start: int, quote: str) -> Tuple[str, bool]:
+    """Read a string literal body from `start`; returns (value, terminated). Tolerates truncation."""
+    out = []
+    i = start
+    while i < len(text):
+        ch = text[i]
+        if ch == "\\" and i + 1 < len(text):
+            nxt = text[i + 1]
+            if nxt == "u" and i + 5 < len(text):
+                try:
+                    code = int(text[i + 2:i + 6], 16)
+                    i += 6
+                    # join UTF-16 surrogate pairs (emojis) into one character
+                    if 0xD800 <= code < 0xDC00 and text[i:i + 2] == "\\u":
+                        low = int(text[i + 2:i + 6], 16)
+                        if 0xDC00 <= low < 0xE000:
+                            code = 0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)
+                            i += 6
+                    out.append(chr(code))
+                    continue
+                except ValueError:
+                    pass
+            out.append(_ESCAPES.get(nxt, nxt))
+            i += 2
+            continue
+        if ch == quote:
+            return "".join(out), True
+        out.append(ch)
+        i += 1
+    return "".join(out), False
+
+
+def _scan_field(text: str, key: str) -> Optional[str]:
+    m = _KEY_RE[key].search(text)
+    if not m:
+        return None
+    value, terminated = _scan_string(text, m.end(), m.group(1))
+    value = value.strip()
+    if not terminated:
+        if key == "emotion":
+            # a truncated emotion word is not trustworthy
+            return None
+        # truncated reply (max_tokens) - cut back to the last full sentence when there is one
+        cut = max(value.rfind(p) for p in (".", "!", "?"))
+        if cut >= len(value) * 0.4:
+            value = value[:cut + 1]
+    return value or None
+
+
+def _from_dict(data) -> Optional[dict]:
+    if isinstance(data, dict) and isinstance(data.get("reply"), str) and data["reply"].strip():
+        out = {"reply": data["reply"].strip()}
+        if isinstance(data.get("emotion"), str):
+            out["emotion"] = data["emotion"].strip()
+        return out
+    return None
+
+
+def parse_llm_json(raw) -> Tuple[Optional[dict], str]:
+    """Return ({"reply", ["emotion"]}, method) - method is 'json', 'extracted', 'literal',
+    'partial', 'plain_text' or 'failed'."""
+    if isinstance(raw, dict):
+        return _from_dict(raw), "json" if _from_dict(raw) else "failed"
+    text = (raw or "").strip()
+    if not text:
+        return None, "failed"
+
+    try:
+        data = _from_dict(json.loads(text))
+        if data:
+            return data, "json"
+    except Exception:
+        pass
+
+    body = _FENCE_RE.sub("", text).strip()
+    obj = _first_object(body)
+    if obj:
+        try:
+            data = _from_dict(json.loads(obj))
+            if data:
+                return data, "extracted"
+        except Exception:
+            pass
+        try:
+            data = _from_dict(ast.literal_eval(obj))
+            if data:
+                return data, "literal"
+        except Exception:
+            pass
+
+    reply = _scan_field(body, "reply")
+    if reply:
+        data = {"reply": reply}
+        emotion = _scan_field(body, "emotion")
+        if emotion:
+            data["emotion"] = emotion
+        return data, "partial"
+
+    if "{" not in body and len(body) > 1:
+        # the model ignored the JSON instruction and just talked
+        return {"reply": body}, "plain_text"
+    return None, "failed"
+
+
+# an escape sequence / UTF-16 high surrogate cut off at the end of a partial stream
+_TRAILING_PARTIAL_ESCAPE_RE = re.compile(r"(\\u[dD][89abAB][0-9a-fA-F]{2})?\\(u[0-9a-fA-F]{0,3})?$|\\u[dD][89abAB][0-9a-fA-F]{2}$")
+
+
+def partial_reply(raw: str) -> Optional[str]:
+    """The `reply` text streamed so far (for incremental display), or None before the key arrives"""
+    m = _KEY_RE["reply"].search(raw or "")
+    if not m:
+        return None
+    body = _TRAILING_PARTIAL_ESCAPE_RE.sub("", raw[m.end():])
+    return _scan_string(body, 0, m.group(1))[0]
+
+
+def salvage(raw) -> Optional[dict]:
+    """parse_llm_json + counters (and corpus capture for anything that wasn't clean JSON)"""
+    data, method = parse_llm_json(raw)
+    with _lock:
+        _counts[method] += 1
+    if method != "json" and CAPTURE_MALFORMED and isinstance(raw, str):
+        _capture(raw, method)
+    return data
+
+
+def _capture(raw: str, method: str):
+    """Hand a completion to the writer thread; dropped when it is behind"""
+    global _capture_thread
+    with _lock:
+        if _capture_thread is None:
+            _capture_thread = threading.Thread(target=_capture_writer, name="malformed-capture", daemon=True)
+            _capture_thread.start()
+    try:
+        _capture_queue.put_nowait({"raw": raw, "method": method, "source": "captured"})
+    except queue.Full:
+        with _lock:
+            _capture_stats["dropped"] += 1
+
+
+def _capture_writer():
+    while True:
+        record = _capture_queue.get()
+        try:
+            if os.path.exists(MALFORMED_CORPUS_PATH) and os.path.getsize(MALFORMED_CORPUS_PATH) >= MALFORMED_CORPUS_MAX_BYTES:
+                with _lock:
+                    _capture_stats["dropped"] += 1
+                continue
+            os.makedirs(os.path.dirname(MALFORMED_CORPUS_PATH) or ".", exist_ok=True)
+            with open(MALFORMED_CORPUS_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            with _lock:
+                _capture_stats["written"] += 1
+        except Exception as e:
+            print(f"⚠️ Failed to capture malformed completion: {e}")
+
+
+def stats() -> dict:
+    with _lock:
+        counts = dict(_counts)
+        capture = dict(_capture_stats)
+    total = sum(counts.values())
+    malformed = total - counts.get("json", 0)
+    salvaged = malformed - counts.get("failed", 0)
+    return {
+        "total": total,
+        "clean_json": counts.get("json", 0),
+        "malformed": malformed,
+        "salvaged": salvaged,
+        "failed": counts.get("failed", 0),
+        "salvage_rate": round(salvaged / malformed, 3) if malformed else None,
+        "by_method": counts,
+        "capture": {"enabled": CAPTURE_MALFORMED, "path": MALFORMED_CORPUS_PATH, **capture},
+    }
+
+
+def benchmark(path: str = SEED_CORPUS_PATH, repeat: int = 200) -> dict:
+    """Salvage rate of parse_llm_json vs. plain json.loads on the corpus, plus parse latency"""
+    with open(path, "r", encoding="utf-8") as f:
+        corpus = [json.loads(line)["raw"] for line in f if line.strip()]
+    strict_ok = 0
+    for raw in corpus:
+        try:
+            strict_ok += bool(_from_dict(json.loads(raw)))
+        except Exception:
+            pass
+    methods = Counter(parse_llm_json(raw)[1] for raw in corpus)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for raw in corpus:
+            parse_llm_json(raw)
+    per_parse_us = (time.perf_counter() - started) / (repeat * len(corpus)) * 1e6 if corpus else 0.0
+    return {
+        "samples": len(corpus),
+        "strict_json_ok": strict_ok,
+        "salvaged": len(corpus) - methods.get("failed", 0),
+        "salvage_rate": round((len(corpus) - methods.get("failed", 0)) / len(corpus), 3) if corpus else None,
+        "by_method": dict(methods),
+        "avg_parse_us": round(per_parse_us, 1),
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    print(json.dumps(benchmark(sys.argv[1] if len(sys.argv) > 1 else SEED_CORPUS_PATH), indent=2))
@@ -0,0 +1,140 @@
+"""
+LLM concurrency limiter - caps in-flight Groq calls and queues the rest
+per user (round-robin) so one heavy user can't starve everyone else.
+"""
+import os
+import time
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_QUEUE_WAIT_SECONDS = float(os.getenv("LLM_MAX_QUEUE_WAIT_SECONDS", "5"))
+LLM_MAX_QUEUE_DEPTH = int(os.getenv("LLM_MAX_QUEUE_DEPTH", "100"))
+
+
+class LLMQueueRejected(Exception):
+    """Raised when a call can't get an LLM slot (queue full or waited too long)"""
+
+    def __init__(self, reason: str):
+        super().__init__(f"LLM queue rejected request: {reason}")
+        self.reason = reason
+
+
+class FairLLMLimiter:
+    """Global cap on in-flight LLM calls with per-user fair queueing"""
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 max_queue_wait: float = LLM_MAX_QUEUE_WAIT_SECONDS,
+                 max_queue_depth: int = LLM_MAX_QUEUE_DEPTH):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue_wait = max_queue_wait
+        self.max_queue_depth = max_queue_depth
+        self._in_flight = 0
+        # user key -> deque of waiting futures; order of keys is the round-robin order
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self._depth = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _grant_next(self):
+        """Hand a freed slot to the next waiting user in round-robin order"""
+        while self._queues:
+            user_key, waiters = self._queues.popitem(last=False)
+            fut = None
+            while waiters:
+                candidate = waiters.popleft()
+                self._depth -= 1
+                if not candidate.done():
+                    fut = candidate
+                    break
+            if waiters:
+                # user still has queued calls - send them to the back of the line
+                self._queues[user_key] = waiters
+            if fut is not None:
+                self._in_flight += 1
+                fut.set_result(True)
+                return
+
+    def _release(self):
+        self._in_flight -= 1
+        self._grant_next()
+
+    def _record_wait(self, waited: float):
+        self.total_wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    async def acquire(self, user_key: str, max_wait: Optional[float] = None):
+        if self._in_flight < self.max_concurrency and self._depth == 0:
+            self._in_flight += 1
+            self.admitted += 1
+            return
+
+        if self._depth >= self.max_queue_depth:
+            self.rejected_full += 1
+            raise LLMQueueRejected("queue_full")
+
+        fut = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user_key, deque()).append(fut)
+        self._depth += 1
+        self.queued += 1
+        started = time.monotonic()
+        try:
+            wait = self.max_queue_wait if max_wait is None else min(max_wait, self.max_queue_wait)
+            await asyncio.wait_for(fut, timeout=wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if fut.done() and not fut.cancelled():
+                # slot was granted just as we gave up - hand it straight on
+                self._release()
+            else:
+                self._discard(user_key, fut)
+            self._record_wait(time.monotonic() - started)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.rejected_timeout += 1
+            raise LLMQueueRejected("timeout")
+
+        self._record_wait(time.monotonic() - started)
+        self.admitted += 1
+
+    def _discard(self, user_key: str, fut):
+        waiters = self._queues.get(user_key)
+        if waiters and fut in waiters:
+            waiters.remove(fut)
+            self._depth -= 1
+            if not waiters:
+                self._queues.pop(user_key, None)
+
+    @asynccontextmanager
+    async def slot(self, user_key, max_wait: Optional[float] = None):
+        """`async with limiter.slot(user_id):` around a single LLM call (`max_wait` caps the queue wait)"""
+        await self.acquire(str(user_key), max_wait)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self) -> dict:
+        waited = self.queued
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue_wait_seconds": self.max_queue_wait,
+            "max_queue_depth": self.max_queue_depth,
+            "in_flight": self._in_flight,
+            "queue_depth": self._depth,
+            "queued_users": len(self._queues),
+            "admitted": self.admitted,
+            "queued_total": self.queued,
+            "rejected_queue_full": self.rejected_full,
+            "rejected_timeout": self.rejected_timeout,
+            "avg_wait_ms": round(self.total_wait_seconds / waited * 1000, 1) if waited else 0.0,
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 1),
+        }
+
+
+llm_limiter = FairLLMLimiter()
@@ -2,12 +2,13 @@
 SoulBuddy Chat AI Service - Groq-powered emotional chat buddy
 """
 import os
+import sys
 import json
 import base64
 import shutil
 import tempfile
-from fastapi import FastAPI, HTTPException, Depends, Header, File, UploadFile, Form, BackgroundTasks
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Depends, Header, File, UploadFile, Form, BackgroundTasks, WebSocket, WebSocketDisconnect, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from groq import Groq
@@ -22,16 +23,28 @@ from datetime import datetime, timedelta, timezone
 import requests
 import uuid
 import asyncio
-
-# Try to import DeepFace for AI-powered emotion detection
-DEEPFACE_AVAILABLE = False
-try:
-    from deepface import DeepFace
-    print("✅ DeepFace emotion detector initialized successfully")
-    DEEPFACE_AVAILABLE = True
-except Exception as e:
-    print(f"⚠️ DeepFace not available: {e}")
-    print("ℹ️  Using fallback emotion detection")
+from reply_cache import reply_cache, REPLY_CACHE_ENABLED
+from llm_limiter import llm_limiter, LLMQueueRejected
+from safety import safety_matcher
+from emotion_classifier import emotion_classifier, EMOTIONS
+from prompts import select_system_prompt, prompt_stats
+from conversation import conversation_store, build_messages
+from model_router import model_router, LLMDeadlineExceeded, LLM_REQUEST_DEADLINE_SECONDS
+from deadline import Deadline, DeadlineExceeded, request_deadline, DEADLINE_LLM_RESERVE_SECONDS
+from chat_sessions import ChatSession, chat_sessions, SESSION_IDLE_TIMEOUT_SECONDS
+from context_cache import mood_context_cache
+from profile_cache import profile_cache
+from inference_warmup import inference_readiness, DEEPFACE_WARMUP
+from photo_pool import photo_pool, PhotoQueueFull, PHOTO_BATCH_MAX
+from frame_sequence import FRAME_MAX_RECEIVED, FRAME_VIDEO_MAX_BYTES
+from detector_policy import detector_policy
+from photo_cache import photo_result_cache
+from task_store import photo_task_store, photo_task_workers, TaskStoreFull, FINISHED_STATUSES, PHOTO_TASK_MAX_ATTEMPTS
+import json_salvage
+
+from face_emotion import (
+    DeepFace, DEEPFACE_AVAILABLE, face_cascade, parse_face_hint
+)
 
 load_dotenv()
 
@@ -53,6 +66,10 @@ def save_mood_to_database(user_id: int, emotion: str, confidence: float, source:
     - If that fails, try `mood_history` (back-compat)
     - If Supabase is unreachable or rejects, append a local JSONL fallback so dev/tests succeed
     """
+    # Keep open WebSocket chat sessions and the cached chat context on the latest mood without a DB re-read
+    chat_sessions.publish_mood(user_id, emotion, source)
+    mood_context_cache.note_mood(user_id, emotion)
+
     # Local fallback writer
     def _write_local_fallback(payload: dict) -> bool:
         try:
@@ -149,8 +166,61 @@ def save_mood_to_database(user_id: int, emotion: str, confidence: float, source:
         # If anything goes wrong, append to local file so the endpoint remains usable in dev
         return _write_local_fallback({"user_id": user_id, "emotion": emotion, "confidence": confidence, "source": source, "created_at": datetime.now(timezone.utc).isoformat()})
 
+def save_moods_to_database(rows: list) -> int:
+    """Save several moods with one Supabase insert (a JSON array) -> number saved.
+
+    rows: [{"user_id", "emotion", "confidence", "source", optional "all_emotions" / "face_detected"}, ...]
+    If the bulk insert is rejected (schema mismatch etc.) each row goes through
+    save_mood_to_database so it gets the usual column / table / local fallbacks.
+    Moods are published to chat sessions once per row, after they are written.
+    """
+    if not rows:
+        return 0
+    created_at = datetime.now(timezone.utc).isoformat()
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        return sum(1 for row in rows if save_mood_to_database(**row))
+
+    payload = []
+    for row in rows:
+        data = {
+            "user_id": row["user_id"],
+            "emotion": row["emotion"],
+            "confidence": row["confidence"],
+            "source": row.get("source", "photo"),
+            "created_at": created_at
+        }
+        if row.get("all_emotions"):
+            data["all_emotions"] = row["all_emotions"]
+        if row.get("face_detected") is not None:
+            data["face_detected"] = row["face_detected"]
+        payload.append(data)
+
+    try:
+        headers = {
+            "apikey": SUPABASE_KEY,
+            "Authorization": f"Bearer {SUPABASE_KEY}",
+            "Content-Type": "application/json",
+            "Prefer": "return=minimal"
+        }
+        print(f"💾 Saving {len(payload)} moods in one insert")
+        resp = requests.post(f"{SUPABASE_URL}/rest/v1/user_moods", headers=headers, json=payload, timeout=10)
+        if resp.status_code in [200, 201]:
+            print(f"✅ {len(payload)} moods saved to database")
+            # only now - the one-by-one fallback below publishes each row itself
+            for row in rows:
+                chat_sessions.publish_mood(row["user_id"], row["emotion"], row.get("source", "photo"))
+                mood_context_cache.note_mood(row["user_id"], row["emotion"])
+            return len(payload)
+        print(f"⚠️ Bulk mood insert failed: {resp.status_code} - {resp.text}. Saving one by one...")
+    except Exception as e:
+        print(f"❌ Bulk mood insert error: {e}. Saving one by one...")
+    return sum(1 for row in rows if save_mood_to_database(**row))
+
 def save_chat_to_database(user_id: int, user_message: str, ai_reply: str, ai_emotion: str, user_mood: Optional[str] = None):
     """Save chat conversation to Supabase database"""
+    # Keep the in-process conversation buffer in sync with every chat write
+    conversation_store.record_turn(user_id, user_message, ai_reply, ai_emotion)
+
     if not SUPABASE_URL or not SUPABASE_KEY:
         print("⚠️ Supabase credentials not configured")
         return False
@@ -209,6 +279,81 @@ def save_chat_to_database(user_id: int, user_message: str, ai_reply: str, ai_emo
         print(f"❌ Error saving chat to database: {e}")
         return False
 
+def fetch_recent_chat_turns(user_id: int, limit: int = 20):
+    """Most recent chat rows for a user (newest first) from Supabase, or the local JSONL fallback"""
+    if SUPABASE_URL and SUPABASE_KEY:
+        try:
+            headers = {"apikey": SUPABASE_KEY, "Authorization": f"Bearer {SUPABASE_KEY}"}
+            resp = requests.get(
+                f"{SUPABASE_URL}/rest/v1/chat_history",
+                headers=headers,
+                params={
+                    "user_id": f"eq.{user_id}",
+                    "select": "user_message,ai_reply,ai_emotion,created_at",
+                    "order": "created_at.desc",
+                    "limit": limit
+                },
+                timeout=5
+            )
+            if resp.status_code == 200:
+                return resp.json()
+            print(f"⚠️ Failed to fetch recent chat turns: {resp.status_code}")
+        except Exception as e:
+            print(f"❌ Error fetching recent chat turns: {e}")
+
+    try:
+        local_path = os.path.join(os.path.dirname(__file__), 'local_chat_history.jsonl')
+        if not os.path.exists(local_path):
+            return []
+        with open(local_path, 'r', encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        rows = [r for r in rows if r.get('user_id') == user_id]
+        return list(reversed(rows[-limit:]))
+    except Exception as e:
+        print(f"❌ Error reading local chat history: {e}")
+        return []
+
+def save_safety_event_to_database(user_id: int, message: str, keyword: str, language: str):
+    """Record a self-harm keyword match to Supabase `safety_events` (local JSONL fallback)"""
+    data = {
+        "user_id": user_id,
+        "message": message,
+        "matched_keyword": keyword,
+        "language": language,
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+
+    def _write_local_fallback() -> bool:
+        try:
+            local_path = os.path.join(os.path.dirname(__file__), 'local_safety_events.jsonl')
+            with open(local_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(data, ensure_ascii=False) + "\n")
+            print(f"✅ Safety event appended to local file: {local_path}")
+            return True
+        except Exception as e:
+            print(f"❌ Failed to write local safety event: {e}")
+            return False
+
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        return _write_local_fallback()
+
+    try:
+        headers = {
+            "apikey": SUPABASE_KEY,
+            "Authorization": f"Bearer {SUPABASE_KEY}",
+            "Content-Type": "application/json",
+            "Prefer": "return=minimal"
+        }
+        resp = requests.post(f"{SUPABASE_URL}/rest/v1/safety_events", headers=headers, json=data, timeout=10)
+        if resp.status_code in [200, 201]:
+            print(f"✅ Safety event saved: user_id={user_id}, keyword={keyword}")
+            return True
+        print(f"⚠️ Failed to save safety event: {resp.status_code} - {resp.text}")
+        return _write_local_fallback()
+    except Exception as e:
+        print(f"❌ Error saving safety event: {e}")
+        return _write_local_fallback()
+
 def get_recent_mood(user_id: int, minutes: int = 5):
     """Get user's most recent mood within specified minutes"""
     if not SUPABASE_URL or not SUPABASE_KEY:
@@ -521,239 +666,10 @@ def process_mood_logs_step_by_step(user_id: int, days: int = 7):
         return {"error": str(e)}
 load_dotenv()
 
-def detect_emotion_with_deepface(image_path):
-    """
-    🎭 AI-Powered Emotion Detection using DeepFace with Improved Accuracy
-    Uses Facenet512 model and RetinaFace detector for best results
-    Returns: (emotion, confidence, all_emotions_dict)
-    """
-    if not DEEPFACE_AVAILABLE:
-        print("⚠️ DeepFace not available, using fallback")
-        return "Neutral", 0.4, {}
-    
-    try:
-        # Analyze with DeepFace — robust attempt across backends
-        # Try RetinaFace first (more accurate), then fallback to OpenCV for tilted/low-light faces.
-        result = None
-        last_exc = None
-        for backend in ("retinaface", "opencv"):
-            try:
-                print(f"🔁 Trying DeepFace with backend='{backend}' (enforce_detection=False)")
-                r = DeepFace.analyze(
-                    img_path=image_path,
-                    actions=['emotion'],
-                    enforce_detection=False,  # never crash if face not clearly detected
-                    detector_backend=backend,
-                    silent=True
-                )
-
-                if isinstance(r, list):
-                    r = r[0]
-
-                # accept result only if it has expected keys
-                if r and isinstance(r, dict) and 'dominant_emotion' in r and 'emotion' in r:
-                    result = r
-                    print(f"✅ DeepFace succeeded with backend='{backend}'")
-                    break
-                else:
-                    print(f"⚠️ DeepFace ({backend}) returned unexpected result: {r}")
-
-            except Exception as e:
-                last_exc = e
-                print(f"⚠️ DeepFace ({backend}) error: {e}")
-                # continue to next backend
-                continue
-
-        if result is None:
-            # let the outer exception handler return the neutral fallback
-            raise Exception(f"DeepFace failed on all backends. Last error: {last_exc}")
-
-        # Get emotions
-        emotions = result['emotion']
-        dominant_emotion = result['dominant_emotion']
-        
-        # Convert numpy values to Python floats for JSON serialization
-        emotions = {k: float(v) for k, v in emotions.items()}
-        
-        print(f"📊 Raw emotions: {emotions}")
-        print(f"🎯 DeepFace dominant: {dominant_emotion}")
-        
-        # 🔥 INDUSTRIAL HYBRID EMOTION SCORING - Weighted Logic
-        # Instead of just taking dominant, use weighted scoring with combined emotions
-        
-        # Find top 2 emotions
-        sorted_emotions = sorted(emotions.items(), key=lambda x: x[1], reverse=True)
-        top_emotion = sorted_emotions[0]
-        second_emotion = sorted_emotions[1] if len(sorted_emotions) > 1 else (None, 0)
-        
-        print(f"🥇 Top: {top_emotion[0]} = {top_emotion[1]:.2f}%")
-        print(f"🥈 Second: {second_emotion[0]} = {second_emotion[1]:.2f}%")
-        
-        # Map DeepFace emotions to our app emotions
-        emotion_mapping = {
-            'happy': 'Happy',
-            'sad': 'Sad',
-            'angry': 'Angry',
-            'fear': 'Anxious',
-            'surprise': 'Excited',
-            'neutral': 'Neutral',
-            'disgust': 'Stressed'
-        }
-        
-        # 🎯 INDUSTRIAL EMOTION LOGIC - Production-grade detection with clear priority
-        selected_emotion = dominant_emotion
-        confidence = emotions[dominant_emotion] / 100.0
-        
-        fear_val = emotions.get('fear', 0)
-        sad_val = emotions.get('sad', 0)
-        happy_val = emotions.get('happy', 0)
-        angry_val = emotions.get('angry', 0)
-        
-        # Priority 1: Happy (25% threshold AND must be greater than Sad)
-        # Prevents Happy/Sad confusion - Happy gets priority if it's clearly dominant
-        if happy_val > 25.0 and happy_val > sad_val:
-            selected_emotion = 'happy'
-            confidence = happy_val / 100.0
-            print(f"🎭 Override: Happy dominant ({happy_val:.1f}% > 25% AND > Sad {sad_val:.1f}%), selecting Happy")
-        
-        # Priority 2: Crying/Deep Sad (Sad > Fear + 15%)
-        # When Sad is 15% more than Fear, it's crying not stressed
-        elif sad_val > (fear_val + 15.0):
-            selected_emotion = 'sad'
-            confidence = sad_val / 100.0
-            print(f"🎭 Override: Crying detected (Sad {sad_val:.1f}% > Fear {fear_val:.1f}% + 15%), selecting Sad")
-        
-        # Priority 3: Stressed (Fear + Sad > 45%)
-        # Combined anxiety/sadness indicates stress
-        elif (fear_val + sad_val) > 45.0:
-            selected_emotion = 'disgust'  # Map to Stressed
-            confidence = (fear_val + sad_val) / 200.0
-            print(f"🎭 Override: Stressed detected (Fear {fear_val:.1f}% + Sad {sad_val:.1f}% = {fear_val + sad_val:.1f}% > 45%), selecting Stressed")
-        
-        # Priority 4: Angry (10% threshold)
-        elif angry_val > 10.0:
-            selected_emotion = 'angry'
-            confidence = angry_val / 100.0
-            print(f"🎭 Override: Angry detected ({angry_val:.1f}% > 10%), selecting Angry")
-        
-        # Priority 5: Sad alone (15% threshold but only if not overpowered by Happy)
-        elif sad_val > 15.0 and sad_val > happy_val:
-            selected_emotion = 'sad'
-            confidence = sad_val / 100.0
-            print(f"🎭 Override: Sad detected ({sad_val:.1f}% > 15% AND > Happy {happy_val:.1f}%), selecting Sad")
-        
-        # Priority 6: Happy fallback (subtle smiles > 15%)
-        elif happy_val > 15.0:
-            selected_emotion = 'happy'
-            confidence = happy_val / 100.0
-            print(f"🎭 Override: Happy detected ({happy_val:.1f}% > 15%), selecting Happy")
-        
-        # Priority 5: Fear alone (30% threshold)
-        elif emotions.get('fear', 0) > 30.0:
-            selected_emotion = 'fear'
-            confidence = emotions['fear'] / 100.0
-            print(f"🎭 Override: Fear/Anxious detected ({emotions['fear']:.1f}%), selecting Anxious")
-        
-        app_emotion = emotion_mapping.get(selected_emotion, 'Neutral')
-        
-        print(f"✅ Final: {app_emotion} ({confidence:.2f})")
-        
-        return app_emotion, confidence, emotions
-        
-    except Exception as e:
-        print(f"⚠️ DeepFace error: {e}")
-        return "Neutral", 0.4, {}
-
-
-def detect_emotion_with_preprocessing(image_path):
-    """
-    Try DeepFace first; if confidence is low, attempt OpenCV face-detection + cropping,
-    rotation attempts and CLAHE preprocessing, then retry DeepFace on the crop.
-    Returns: (emotion, confidence, all_emotions, face_detected:bool, method:str)
-    """
-    # baseline using DeepFace (may return low-confidence neutral)
-    base_emotion, base_conf, base_all = detect_emotion_with_deepface(image_path)
-
-    # If DeepFace already confident, accept it
-    if base_conf >= 0.5:
-        return base_emotion, base_conf, base_all, True, "deepface"
-
-    # Try OpenCV-assisted detection / cropping and retry DeepFace on the crop
-    try:
-        img = cv2.imread(image_path)
-        if img is None:
-            try:
-                pil_img = Image.open(image_path).convert('RGB')
-                img = cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
-            except Exception as e:
-                print(f"❌ preprocess: could not read image: {e}")
-                return base_emotion, base_conf, base_all, False, "none"
-
-        def _opencv_faces(p_img):
-            gray = cv2.cvtColor(p_img, cv2.COLOR_BGR2GRAY)
-            try:
-                clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-                gray = clahe.apply(gray)
-            except Exception:
-                pass
-            faces = face_cascade.detectMultiScale(gray, scaleFactor=1.05, minNeighbors=4, minSize=(30,30))
-            return faces
-
-        # Try original + rotated variants to handle rotated selfies
-        for angle in (0, 90, 270, 180):
-            p_img = img
-            if angle == 90:
-                p_img = cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
-            elif angle == 270:
-                p_img = cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
-            elif angle == 180:
-                p_img = cv2.rotate(img, cv2.ROTATE_180)
-
-            faces = _opencv_faces(p_img) if face_cascade is not None else []
-            if len(faces) > 0:
-                # pick largest face box
-                x, y, w, h = max(faces, key=lambda r: r[2] * r[3])
-                pad = int(0.2 * max(w, h))
-                x0 = max(0, x - pad)
-                y0 = max(0, y - pad)
-                x1 = min(p_img.shape[1], x + w + pad)
-                y1 = min(p_img.shape[0], y + h + pad)
-                crop = p_img[y0:y1, x0:x1]
-
-                crop_path = f"/tmp/emotion_crop_{os.urandom(6).hex()}.jpg"
-                cv2.imwrite(crop_path, crop)
-
-                try:
-                    e2, c2, all2 = detect_emotion_with_deepface(crop_path)
-                except Exception as ex:
-                    print(f"❌ DeepFace on crop failed: {ex}")
-                    e2, c2, all2 = base_emotion, base_conf, base_all
-
-                try:
-                    os.remove(crop_path)
-                except Exception:
-                    pass
-
-                # If crop yields better confidence, return that (face detected)
-                if c2 >= 0.25:
-                    return e2, c2, all2, True, "opencv_crop"
-
-                # otherwise still mark face detected (detected by OpenCV)
-                return base_emotion, base_conf, base_all, True, "opencv_detect"
-
-        # no faces at all
-        return base_emotion, base_conf, base_all, False, "none"
-
-    except Exception as e:
-        print(f"❌ preprocess detection error: {e}")
-        return base_emotion, base_conf, base_all, False, "error"
-
-
 app = FastAPI(title="SoulBuddy Chat AI Service", version="1.0.0")
 
-# In-memory task store for async photo-analysis jobs (short-lived)
-TASK_STORE: dict = {}
-
+# Async photo-analysis jobs live in task_store.photo_task_store (SQLite, shared by the
+# host's worker processes) and are drained by photo_task_workers
 def _new_task_id() -> str:
     return uuid.uuid4().hex
 
@@ -774,16 +690,6 @@ else:
     groq_client = Groq(api_key=GROQ_API_KEY)
     print("✅ Groq client initialized successfully")
 
-# Initialize OpenCV Face Detector (for emotion analysis)
-try:
-    # Load Haar Cascade for face detection
-    face_cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-    face_cascade = cv2.CascadeClassifier(face_cascade_path)
-    print("✅ OpenCV face detector initialized successfully")
-except Exception as e:
-    print(f"⚠️  Face detector initialization failed: {e}")
-    face_cascade = None
-
 class ChatRequest(BaseModel):
     message: str
     user_id: Optional[int] = 1  # Default to user_id 1 for testing
@@ -791,6 +697,8 @@ class ChatRequest(BaseModel):
 
 class EmotionRequest(BaseModel):
     image: str  # Base64 encoded image
+    face_box: Optional[dict] = None  # on-device face box {x, y, w, h} (pixels or 0-1 fractions of the upright photo)
+    rotation: Optional[int] = None  # clockwise degrees that make the face upright
 
 class ChatResponse(BaseModel):
     reply: str
@@ -798,77 +706,12 @@ class ChatResponse(BaseModel):
     confidence: Optional[float] = None
     user_mood: Optional[str] = None  # latest stored mood used as context (optional)
 
-# System prompt for SoulBuddy personality
-SYSTEM_PROMPT = """You are SoulBuddy, a deeply caring best friend from Sri Lanka who asks meaningful questions.
-
-🔍 MOOD CONTEXT AWARENESS:
-- If the user was feeling 'Sad' or 'Stressed' in the last 5 minutes (check mood history):
-  * Start by acknowledging it warmly: "I noticed earlier you were feeling a bit down, is everything okay now?"
-  * Show genuine care and continue the conversation naturally
-  * Match the user's language (English/Singlish/Sinhala)
-- If mood improved (Sad → Happy): Celebrate with them: "I'm so glad you're feeling better! What changed?"
-
-🎯 CRITICAL RULES:
-1. ALWAYS respond in the EXACT SAME LANGUAGE the user uses
-   - English input → English response
-   - Sinhala (සිංහල) input → Sinhala response  
-   - Singlish (mixed) input → Singlish response
-   
-2. ASK DEEP FOLLOW-UP QUESTIONS like a real friend:
-   - If they're SAD: Don't just say "sorry to hear that" - dig deeper!
-     Ask WHY they're sad ("What happened, buddy?", "Did someone say something hurtful?", "Wanna talk about it?")
-   - If they're HAPPY: Share their joy and ask what made them so happy
-     ("That's awesome! What happened?", "Tell me more!", "What made your day?")
-   - If they're STRESSED: Ask what's causing the stress
-     ("What's stressing you out?", "Is it work/school?", "Anything I can help with?")
-   - ALWAYS end with a caring question to keep conversation going
-   
-3. USE EMOJIS to express emotions naturally 😊
-   - Add relevant emojis (😊 🎉 💪 ❤️ 😢 🔥 ✨ 🫂 💭 etc.)
-   - Use them like texting a close friend
-   - 1-2 emojis per message is perfect
-   
-4. Detect emotions SILENTLY in the background
-   - Analyze their emotional state from their message
-   - Include emotion in JSON but don't mention it in your reply
-
-🚨 CRITICAL SAFETY GUARDRAILS (NON-NEGOTIABLE):
-1. NEVER prescribe medicine or medical treatments
-   - If asked about medicine/health: "I'm not a doctor, please consult a healthcare professional"
-   - Sinhala: "මම වෛද්‍යවරයෙක් නෙමෙයි, කරුණාකර වෛද්‍යවරයෙක් හමුවන්න"
-   
-2. SELF-HARM / SUICIDE mentions - IMMEDIATELY respond seriously:
-   - Keywords: kill, suicide, die, මැරෙන්න, ජීවිතේ ඉවර
-   - English: "Your life is valuable. Please call 1926 (Mental Health Helpline) or see a counselor. I'm here, but please get professional help. 🫂"
-   - Sinhala: "ඔයාගේ ජීවිතය අගනේ. කරුණාකර 1926 අමතන්න හෝ උපදේශකයෙකු හමුවන්න. මම ඔයා සමඟ සිටිමි, නමුත් වෘත්තීය සහාය ලබා ගන්න. 🫂"
-   
-3. For serious health/mental issues → suggest professional help (doctor, therapist, 1926)
-
-Your personality:
-- Warm, caring, genuinely curious about their feelings
-- Keep responses conversational (2-3 sentences) - like texting
-- Be encouraging and supportive
-- ALWAYS ask a relevant follow-up question
-- BUT prioritize user safety above all else
-
-Emotion Detection (silent - for JSON only):
-Classify as: Happy, Sad, Angry, Stress, Neutral, Anxious, Excited
-
-Response format (ALWAYS valid JSON):
-{
-  "reply": "your caring response with follow-up question and emojis",
-  "emotion": "detected_emotion"
+# Approximate confidence per chat emotion (Groq doesn't return scores)
+CHAT_EMOTION_CONFIDENCE = {
+    "Happy": 0.8, "Sad": 0.7, "Angry": 0.75,
+    "Stress": 0.7, "Neutral": 0.6, "Anxious": 0.7, "Excited": 0.8
 }
 
-Examples:
-User: "What's up macho" → {"reply": "Hey! Just chilling here 😊 What about you?", "emotion": "Neutral"}
-User: "I got the job!" → {"reply": "Yo that's amazing! Congrats buddy! 🎉🔥", "emotion": "Happy"}
-User: "කොහොමද ඔයා" → {"reply": "මං හොඳින්! ඔයා කොහොමද මචං? 😊", "emotion": "Neutral"}
-User: "මං අද හරිම සතුටුයි" → {"reply": "අනේ සුපිරි! මොකද වුණේ කියන්න? 🎉", "emotion": "Happy"}
-User: "I failed my exam" → {"reply": "Aw man, that sucks 😔 But hey, one exam doesn't define you. You got this next time! 💪", "emotion": "Sad"}
-User: "yako mata stress job eka gana" → {"reply": "Oya relax wenna try karanna macho 😌 Work stress normal ekak. Mokak hari issue ekak thiyanawada?", "emotion": "Stress"}
-"""
-
 async def verify_token(authorization: Optional[str] = Header(None)):
     """Simple token verification (optional for now)"""
     if not authorization:
@@ -890,9 +733,47 @@ async def root():
 async def health():
     return {
         "status": "healthy",
-        "groq_available": groq_client is not None
+        "groq_available": groq_client is not None,
+        "inference": inference_readiness.status
     }
 
+@app.on_event("startup")
+async def warm_inference_models():
+    """Build and warm the DeepFace models off the event loop - /health answers at once, /ready flips when warm"""
+    if not DEEPFACE_WARMUP:
+        return
+    loop = asyncio.get_running_loop()
+    if DEEPFACE_AVAILABLE and photo_pool.uses_processes:
+        # inference runs in the photo workers - start them now; each warms its own models.
+        # Two-phase coarse answers run in this process, so its emotion model is built here too
+        loop.run_in_executor(None, inference_readiness.run,
+                             lambda: {**photo_pool.warm_all(), **photo_pool.warm_quick()})
+    else:
+        loop.run_in_executor(
+            None, inference_readiness.warm,
+            DeepFace if DEEPFACE_AVAILABLE else None, DEEPFACE_AVAILABLE, None, face_cascade
+        )
+
+@app.on_event("startup")
+async def start_photo_task_workers():
+    """Consumers for queued background photo tasks (replaces per-request BackgroundTasks)"""
+    photo_task_workers.start(_process_photo_background)
+
+@app.on_event("shutdown")
+async def stop_photo_workers():
+    await photo_task_workers.stop()
+    photo_pool.shutdown()
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe - 503 while photo inference is warming (so photos aren't routed to a cold instance)"""
+    inference = inference_readiness.snapshot()
+    if inference["ready"] or inference["status"] in ("unavailable", "failed") or not DEEPFACE_WARMUP:
+        # no DeepFace / warm-up disabled / warm-up failed: nothing more to wait for - chat doesn't need
+        # the models and photos use the lazy load or fallback path (a failed warm-up never recovers by waiting)
+        return {"status": "ready", "inference": inference}
+    return JSONResponse(status_code=503, content={"status": "warming", "inference": inference})
+
 # Backward-compatible API path for mobile app (frontend calls /api/v1/chat)
 @app.post("/api/mood/time-analysis")
 async def get_mood_time_analysis(
@@ -1022,11 +903,127 @@ def generate_contextual_ai_response(mood_analysis):
     
     return base_response
 
+def _persist_safety_event(user_id: int, message: str, safety_hit: dict):
+    """Save mood, chat row and safety event for a crisis message (runs after the reply is sent)"""
+    try:
+        emotion = safety_hit["emotion"]
+        save_mood_to_database(user_id, emotion, CHAT_EMOTION_CONFIDENCE.get(emotion, 0.6), source="chat_safety")
+        save_chat_to_database(user_id=user_id, user_message=message, ai_reply=safety_hit["reply"], ai_emotion=emotion)
+        save_safety_event_to_database(user_id, message, safety_hit["keyword"], safety_hit["language"])
+    except Exception as e:
+        print(f"❌ Error persisting safety event: {e}")
+
+def build_chat_prompt(message: str, user_mood: Optional[str], mood_analysis: Optional[dict],
+                      profile_summary: Optional[str] = None):
+    """(language, system prompt) with the user's profile, mood, trend and color context appended"""
+    language, enhanced_prompt = select_system_prompt(message)
+    if profile_summary:
+        enhanced_prompt += f"\nAbout the user (bring up only when it fits naturally): {profile_summary}"
+    if user_mood:
+        enhanced_prompt += f"\nUser's current mood: {user_mood}"
+
+    if mood_analysis:
+        # Add trend analysis
+        trend = mood_analysis.get('trend_analysis', {})
+        if trend.get('trend') != 'insufficient_data':
+            enhanced_prompt += f"\nMood trend: {trend.get('trend')} (change: {trend.get('change')})"
+
+        # Add color-emotion integration
+        color_info = mood_analysis.get('color_emotion_integration', {})
+        if color_info.get('color_mood_correlation'):
+            enhanced_prompt += f"\nColor-emotion insight: {color_info.get('color_mood_correlation')}"
+            enhanced_prompt += f"\nSuggested colors: {', '.join(color_info.get('suggested_colors', []))}"
+    return language, enhanced_prompt
+
+
+def shared_reply_prompt(message: str, user_mood: Optional[str], mood_analysis):
+    """(reply-cache key, language, prompt) for a short cacheable message, else None.
+    The prompt leaves out the user's conversation turns and profile snapshot, so the
+    reply is impersonal and can be shared by everyone with the same mood context"""
+    if not REPLY_CACHE_ENABLED:
+        return None
+    language, prompt = build_chat_prompt(message, user_mood, mood_analysis)
+    key = reply_cache.make_key(message, prompt)
+    if key is None:
+        return None
+    return key, language, prompt
+
+
+def _persist_chat_turn(user_id: int, message: str, reply: str, emotion: str, user_mood: Optional[str]):
+    """Save the chat-derived mood and the chat row for one answered message"""
+    try:
+        save_mood_to_database(user_id, emotion, CHAT_EMOTION_CONFIDENCE.get(emotion, 0.6), source="chat")
+        save_chat_to_database(
+            user_id=user_id,
+            user_message=message,
+            ai_reply=reply,
+            ai_emotion=emotion,
+            user_mood=user_mood
+        )
+    except Exception as db_error:
+        print(f"❌ Error saving chat turn: {db_error}")
+
+
+def fetch_mood_context(user_id: int):
+    """(user_mood, mood_analysis) for the chat prompt - time-window analysis, else the latest mood"""
+    user_mood = None
+    mood_analysis = None
+    try:
+        # Get time-based mood analysis (last 30 minutes)
+        mood_analysis = get_mood_with_time_analysis(user_id, time_window_minutes=30)
+
+        if mood_analysis:
+            user_mood = mood_analysis.get('current_mood')
+            print(f"🔎 Found time-based mood analysis: {user_mood}")
+            print(f"📊 Trend: {mood_analysis.get('trend_analysis', {}).get('trend', 'unknown')}")
+            print(f"🎨 Color correlation: {mood_analysis.get('color_emotion_integration', {}).get('color_mood_correlation', 'unknown')}")
+        else:
+            # Fallback to latest mood
+            latest_mood_data = get_latest_mood(user_id)
+            if latest_mood_data and isinstance(latest_mood_data, dict):
+                user_mood = latest_mood_data.get('emotion')
+                print(f"🔎 Found latest mood in DB: {user_mood}")
+    except Exception as e:
+        print(f"⚠️ Error fetching mood analysis: {e}")
+    return user_mood, mood_analysis
+
+
+def load_mood_context(user_id: int):
+    """fetch_mood_context through the per-user context cache"""
+    cached = mood_context_cache.get(user_id)
+    if cached:
+        return cached
+    user_mood, mood_analysis = fetch_mood_context(user_id)
+    mood_context_cache.put(user_id, user_mood, mood_analysis)
+    return user_mood, mood_analysis
+
+
+def prefetch_user_context(user_id: int):
+    """Warm everything the first chat message needs (mood context, recent turns, profile snapshot)"""
+    if not mood_context_cache.begin_prefetch(user_id):
+        return
+    try:
+        started = datetime.now()
+        if not mood_context_cache.is_warm(user_id):
+            user_mood, mood_analysis = fetch_mood_context(user_id)
+            mood_context_cache.put(user_id, user_mood, mood_analysis)
+        conversation_store.ensure_loaded(user_id, fetch_recent_chat_turns)
+        if not profile_cache.is_fresh(user_id):
+            profile_cache.refresh(user_id)
+        print(f"🔥 Prefetched chat context for user_id={user_id} in {(datetime.now() - started).total_seconds():.2f}s")
+    except Exception as e:
+        print(f"⚠️ Chat context prefetch failed for user_id={user_id}: {e}")
+    finally:
+        mood_context_cache.end_prefetch(user_id)
+
+
 @app.post("/api/v1/chat", response_model=ChatResponse)
 @app.post("/chat", response_model=ChatResponse)
 async def chat(
     request: ChatRequest,
-    authorization: Optional[str] = Depends(verify_token)
+    background_tasks: BackgroundTasks,
+    authorization: Optional[str] = Depends(verify_token),
+    deadline: Deadline = Depends(request_deadline)
 ):
     """Main chat endpoint - processes user message and returns AI response with emotion"""
     
@@ -1042,65 +1039,98 @@ async def chat(
             detail="Message cannot be empty"
         )
     
+    # --- SAFETY FAST PATH (self-harm keywords) - answered before any DB read or LLM call ---
+    safety_hit = safety_matcher.match(request.message)
+    if safety_hit:
+        print(f"🚨 Safety keyword matched for user_id={request.user_id}: '{safety_hit['keyword']}' ({safety_hit['language']})")
+        if request.user_id:
+            background_tasks.add_task(
+                _persist_safety_event, request.user_id, request.message, safety_hit
+            )
+        return ChatResponse(
+            reply=safety_hit["reply"],
+            emotion=safety_hit["emotion"],
+            confidence=CHAT_EMOTION_CONFIDENCE.get(safety_hit["emotion"], 0.6),
+            user_mood=None
+        )
+
     try:
         print('DBG: chat handler entry - request=', getattr(request, 'model_dump', lambda: str(request))())
         # --- ENHANCED MOOD RETRIEVAL WITH TIME ANALYSIS ---
         user_mood = None
-        latest_mood_data = None
         mood_analysis = None
 
+        # Context reads are optional - skip them rather than eat the time the LLM call needs
         if request.user_id:
-            try:
-                # Get time-based mood analysis (last 30 minutes)
-                mood_analysis = get_mood_with_time_analysis(request.user_id, time_window_minutes=30)
-                
-                if mood_analysis:
-                    user_mood = mood_analysis.get('current_mood')
-                    print(f"🔎 Found time-based mood analysis: {user_mood}")
-                    print(f"📊 Trend: {mood_analysis.get('trend_analysis', {}).get('trend', 'unknown')}")
-                    print(f"🎨 Color correlation: {mood_analysis.get('color_emotion_integration', {}).get('color_mood_correlation', 'unknown')}")
-                else:
-                    # Fallback to latest mood
-                    latest_mood_data = get_latest_mood(request.user_id)
-                    if latest_mood_data and isinstance(latest_mood_data, dict):
-                        user_mood = latest_mood_data.get('emotion')
-                        print(f"🔎 Found latest mood in DB: {user_mood}")
-            except Exception as e:
-                print(f"⚠️ Error fetching mood analysis: {e}")
+            cached_context = mood_context_cache.get(request.user_id)
+            if cached_context:
+                user_mood, mood_analysis = cached_context
+            else:
+                user_mood, mood_analysis = await deadline.run(
+                    "mood context fetch", load_mood_context, request.user_id,
+                    reserve=DEADLINE_LLM_RESERVE_SECONDS, default=(None, None)
+                )
 
-        # --- ENHANCED PROMPT WITH TIME AND COLOR CONTEXT ---
-        enhanced_prompt = SYSTEM_PROMPT
-        if user_mood:
-            enhanced_prompt += f"\nUser's current mood: {user_mood}"
-            
-        if mood_analysis:
-            # Add trend analysis
-            trend = mood_analysis.get('trend_analysis', {})
-            if trend.get('trend') != 'insufficient_data':
-                enhanced_prompt += f"\nMood trend: {trend.get('trend')} (change: {trend.get('change')})"
-            
-            # Add color-emotion integration
-            color_info = mood_analysis.get('color_emotion_integration', {})
-            if color_info.get('color_mood_correlation'):
-                enhanced_prompt += f"\nColor-emotion insight: {color_info.get('color_mood_correlation')}"
-                enhanced_prompt += f"\nSuggested colors: {', '.join(color_info.get('suggested_colors', []))}"
+        # --- CONVERSATION MEMORY (one history read per user per process) ---
+        if request.user_id:
+            await deadline.run(
+                "history load", conversation_store.ensure_loaded, request.user_id, fetch_recent_chat_turns,
+                reserve=DEADLINE_LLM_RESERVE_SECONDS
+            )
+
+        # --- REPLY CACHE (greetings / check-ins answered from an impersonal prompt) ---
+        shared = shared_reply_prompt(request.message, user_mood, mood_analysis)
+        if shared:
+            cache_key, language, enhanced_prompt = shared
+            history = []
+        else:
+            cache_key = None
+            # --- PROFILE SNAPSHOT (cached; refreshed after the response when missing/stale) ---
+            profile_summary = None
+            if request.user_id:
+                profile_summary, needs_refresh = profile_cache.get(request.user_id)
+                if needs_refresh:
+                    background_tasks.add_task(profile_cache.refresh, request.user_id)
+            # --- ENHANCED PROMPT WITH TIME AND COLOR CONTEXT ---
+            language, enhanced_prompt = build_chat_prompt(request.message, user_mood, mood_analysis, profile_summary)
+            history = conversation_store.turns(request.user_id) if request.user_id else []
 
         # Log for debugging
-        print(f"🔎 Chat context - user_id={request.user_id} user_mood={user_mood}")
-        
+        print(f"🔎 Chat context - user_id={request.user_id} user_mood={user_mood} language={language}")
+
+        if cache_key is not None:
+            cached = reply_cache.get(cache_key)
+            if cached:
+                print(f"⚡ Reply cache hit: {cache_key}")
+                if request.user_id:
+                    _persist_chat_turn(request.user_id, request.message, cached["reply"], cached["emotion"], user_mood)
+                return ChatResponse(
+                    reply=cached["reply"],
+                    emotion=cached["emotion"],
+                    confidence=None,
+                    user_mood=user_mood
+                )
+
         # Call Groq API with updated model
+        llm_budget = None
         try:
             print(f"DBG: sending prompt (user_id={request.user_id}) — mood={user_mood}")
-            completion = groq_client.chat.completions.create(
-                model="llama-3.1-8b-instant",  # Latest fast model
-                messages=[
-                    {"role": "system", "content": enhanced_prompt},
-                    {"role": "user", "content": request.message}
-                ],
-                response_format={"type": "json_object"},
-                temperature=0.7,  # Balanced creativity
-                max_tokens=300,   # Increased for better JSON completion
-            )
+            # Run the blocking Groq call in a thread, under the global/per-user LLM limiter;
+            # the router picks the fastest healthy model and falls back on errors/deadline misses
+            # Bounded by the caller's deadline (X-Request-Timeout-Ms) when the gateway sent one
+            llm_budget = deadline.cap(LLM_REQUEST_DEADLINE_SECONDS) if deadline.bounded else None
+            async with llm_limiter.slot(request.user_id or "anonymous", max_wait=llm_budget):
+                llm_budget = deadline.cap(LLM_REQUEST_DEADLINE_SECONDS) if deadline.bounded else None
+                deadline.check("LLM call")
+                completion, model_used = await model_router.complete(
+                    groq_client,
+                    deadline_seconds=llm_budget,
+                    messages=build_messages(enhanced_prompt, history, request.message),
+                    response_format={"type": "json_object"},
+                    temperature=0.7,  # Balanced creativity
+                    max_tokens=300,   # Increased for better JSON completion
+                )
+            print(f"🤖 Answered by model={model_used}")
 
             # Defensive parsing of AI response (handle None / dict / string)
             ai_response = None
@@ -1139,48 +1169,80 @@ async def chat(
                 if ai_candidate is None:
                     raise ValueError('AI response is empty')
 
-                if isinstance(ai_candidate, dict):
-                    response_data = ai_candidate
-                else:
-                    # ensure it's a JSON string and parse
-                    if not isinstance(ai_candidate, str):
-                        ai_candidate = str(ai_candidate)
-                    response_data = json.loads(ai_candidate)
+                if not isinstance(ai_candidate, (dict, str)):
+                    ai_candidate = str(ai_candidate)
+                # tolerant parse: recovers reply/emotion from truncated, prose-wrapped or single-quoted output
+                response_data = json_salvage.salvage(ai_candidate)
+                if response_data is None:
+                    raise ValueError('AI response could not be parsed or salvaged')
 
             except Exception as parse_exc:
                 print(f"⚠️ Failed to parse AI response: {parse_exc}")
                 print('Raw completion object:', completion)
-                # Graceful fallback when AI returns unexpected output
+                # Graceful fallback when AI returns unexpected output - emotion from the local classifier
+                local_emotion, local_conf, _ = emotion_classifier.predict(request.message)
                 return ChatResponse(
                     reply="Sorry, I couldn't understand the AI response — can you try rephrasing?",
-                    emotion="Neutral",
-                    confidence=0.0,
+                    emotion=local_emotion,
+                    confidence=round(local_conf, 3),
                     user_mood=user_mood
                 )
 
+        except (DeadlineExceeded, LLMDeadlineExceeded) as e:
+            if deadline.expired() or (llm_budget is not None and llm_budget < LLM_REQUEST_DEADLINE_SECONDS):
+                # The caller has given up - don't spend anything more on this request
+                print(f"⏱️ Chat request for user_id={request.user_id} ran out of time: {e}")
+                return JSONResponse(status_code=504, content={"detail": "Request deadline exceeded"})
+            print(f"⚠️ Groq call failed: {e}")
+            local_emotion, local_conf, _ = emotion_classifier.predict(request.message)
+            return ChatResponse(
+                reply="Sorry, the AI service is temporarily unavailable. I'm here to listen — how are you feeling right now?",
+                emotion=local_emotion,
+                confidence=round(local_conf, 3),
+                user_mood=user_mood
+            )
+        except LLMQueueRejected as e:
+            if deadline.expired():
+                return JSONResponse(status_code=504, content={"detail": "Request deadline exceeded"})
+            # Fail fast instead of piling more calls onto a saturated upstream
+            print(f"⚠️ LLM queue rejected user_id={request.user_id}: {e.reason}")
+            return JSONResponse(
+                status_code=503,
+                headers={"Retry-After": "2"},
+                content={"detail": "Chat is busy right now, please try again in a moment.", "reason": e.reason}
+            )
         except Exception as e:
             # Graceful fallback when Groq API fails (prevents a 500 bubbling to the client)
             print(f"⚠️ Groq call failed: {e}")
+            local_emotion, local_conf, _ = emotion_classifier.predict(request.message)
             return ChatResponse(
                 reply="Sorry, the AI service is temporarily unavailable. I'm here to listen — how are you feeling right now?", 
-                emotion="Neutral",
-                confidence=0.0,
+                emotion=local_emotion,
+                confidence=round(local_conf, 3),
                 user_mood=user_mood
             )
         
         # Validate response structure
-        if "reply" not in response_data or "emotion" not in response_data:
+        if "reply" not in response_data:
             raise ValueError("Invalid response format from AI")
+        if response_data.get("emotion") not in EMOTIONS:
+            # Missing or off-list emotion from the LLM - classify locally instead of storing junk
+            local_emotion, _, _ = emotion_classifier.predict(request.message)
+            print(f"⚠️ AI emotion {response_data.get('emotion')!r} not recognised, using local classifier: {local_emotion}")
+            response_data["emotion"] = local_emotion
+
+        reply_cache.put(cache_key, response_data["reply"], response_data["emotion"])
+
+        if deadline.expired():
+            # The gateway has already answered the client - skip the writes for an abandoned request
+            print(f"⏱️ Deadline passed during the LLM call for user_id={request.user_id}, not saving")
+            return JSONResponse(status_code=504, content={"detail": "Request deadline exceeded"})
         
         # Save detected emotion to database - ALWAYS save
         if "emotion" in response_data:
             emotion = response_data["emotion"]
             # Map emotion confidence (approximate based on emotion type)
-            confidence_map = {
-                "Happy": 0.8, "Sad": 0.7, "Angry": 0.75,
-                "Stress": 0.7, "Neutral": 0.6, "Anxious": 0.7, "Excited": 0.8
-            }
-            confidence = confidence_map.get(emotion, 0.6)
+            confidence = CHAT_EMOTION_CONFIDENCE.get(emotion, 0.6)
             user_id_to_save = request.user_id if request.user_id else None  # Use None instead of hardcoded 1
             
             if user_id_to_save is None:
@@ -1228,9 +1290,11 @@ async def chat(
         print(f"JSON decode error: {e}")
         print(f"Raw AI response: {ai_response}")
         # Fallback response
+        local_emotion, local_conf, _ = emotion_classifier.predict(request.message)
         return ChatResponse(
             reply="Hey, I'm here for you! Can you tell me more?",
-            emotion="Neutral"
+            emotion=local_emotion,
+            confidence=round(local_conf, 3)
         )
     except Exception as e:
         import traceback
@@ -1241,6 +1305,267 @@ async def chat(
             detail=f"Failed to process chat: {str(e)}"
         )
 
+async def _load_session_context(session: ChatSession):
+    if session.user_id is not None:
+        user_mood, mood_analysis = await asyncio.to_thread(load_mood_context, session.user_id)
+        session.set_context(user_mood, mood_analysis)
+
+
+async def _ws_answer(websocket: WebSocket, session: ChatSession, message: str):
+    """Answer one chat-session message: safety / cache fast paths, otherwise a streamed LLM reply"""
+    user_id = session.user_id
+
+    safety_hit = safety_matcher.match(message)
+    if safety_hit:
+        print(f"🚨 Safety keyword matched for user_id={user_id}: '{safety_hit['keyword']}' ({safety_hit['language']})")
+        await websocket.send_json({
+            "type": "reply",
+            "reply": safety_hit["reply"],
+            "emotion": safety_hit["emotion"],
+            "confidence": CHAT_EMOTION_CONFIDENCE.get(safety_hit["emotion"], 0.6),
+            "user_mood": None,
+        })
+        if user_id:
+            await asyncio.to_thread(_persist_safety_event, user_id, message, safety_hit)
+        return
+
+    if session.context_stale():
+        await _load_session_context(session)
+    user_mood = session.user_mood
+    shared = shared_reply_prompt(message, user_mood, session.mood_analysis)
+    if shared:
+        cache_key, language, enhanced_prompt = shared
+        history = []
+    else:
+        cache_key = None
+        profile_summary = None
+        if user_id:
+            profile_summary, needs_refresh = profile_cache.get(user_id)
+            if needs_refresh:
+                asyncio.get_running_loop().run_in_executor(None, profile_cache.refresh, user_id)
+        language, enhanced_prompt = build_chat_prompt(message, user_mood, session.mood_analysis, profile_summary)
+        history = conversation_store.turns(user_id) if user_id else []
+
+    if cache_key is not None:
+        cached = reply_cache.get(cache_key)
+        if cached:
+            print(f"⚡ Reply cache hit: {cache_key}")
+            await websocket.send_json({"type": "reply", "reply": cached["reply"], "emotion": cached["emotion"],
+                                       "confidence": None, "user_mood": user_mood})
+            if user_id:
+                await asyncio.to_thread(_persist_chat_turn, user_id, message, cached["reply"], cached["emotion"], user_mood)
+            return
+
+    # Chunks arrive on a worker thread. The completion is JSON text, so it is parsed as it grows and only
+    # the `reply` string goes out as deltas (nothing before the key arrives, nothing after it closes).
+    # No response_format here: Groq's JSON mode doesn't stream, the system prompt already asks for JSON.
+    loop = asyncio.get_running_loop()
+    chunks: asyncio.Queue = asyncio.Queue()
+
+    async def pump():
+        raw, sent = "", ""
+        while True:
+            chunk = await chunks.get()
+            if chunk is None:
+                return
+            raw += chunk
+            text = json_salvage.partial_reply(raw)
+            if text and len(text) > len(sent) and text.startswith(sent):
+                await websocket.send_json({"type": "delta", "text": text[len(sent):]})
+                sent = text
+
+    pump_task = asyncio.create_task(pump())
+    try:
+        async with llm_limiter.slot(user_id or "anonymous"):
+            raw_reply, model_used = await model_router.stream(
+                groq_client,
+                lambda chunk: loop.call_soon_threadsafe(chunks.put_nowait, chunk),
+                messages=build_messages(enhanced_prompt, history, message),
+                temperature=0.7,
+                max_tokens=300,
+            )
+        print(f"🤖 Streamed answer by model={model_used}")
+    except LLMQueueRejected as e:
+        print(f"⚠️ LLM queue rejected user_id={user_id}: {e.reason}")
+        await websocket.send_json({"type": "error", "detail": "Chat is busy right now, please try again in a moment.",
+                                   "reason": e.reason})
+        return
+    except Exception as e:
+        print(f"⚠️ Groq stream failed: {e}")
+        local_emotion, local_conf, _ = emotion_classifier.predict(message)
+        await websocket.send_json({
+            "type": "reply",
+            "reply": "Sorry, the AI service is temporarily unavailable. I'm here to listen — how are you feeling right now?",
+            "emotion": local_emotion,
+            "confidence": round(local_conf, 3),
+            "user_mood": user_mood,
+        })
+        return
+    finally:
+        chunks.put_nowait(None)
+        await pump_task
+
+    response_data = json_salvage.salvage(raw_reply)
+    if not response_data:
+        local_emotion, local_conf, _ = emotion_classifier.predict(message)
+        await websocket.send_json({
+            "type": "reply",
+            "reply": "Sorry, I couldn't understand the AI response — can you try rephrasing?",
+            "emotion": local_emotion,
+            "confidence": round(local_conf, 3),
+            "user_mood": user_mood,
+        })
+        return
+    if response_data.get("emotion") not in EMOTIONS:
+        response_data["emotion"], _, _ = emotion_classifier.predict(message)
+
+    reply_cache.put(cache_key, response_data["reply"], response_data["emotion"])
+    await websocket.send_json({
+        "type": "reply",
+        "reply": response_data["reply"],
+        "emotion": response_data["emotion"],
+        "confidence": None,
+        "user_mood": user_mood,
+        "model": model_used,
+    })
+    if user_id:
+        await asyncio.to_thread(_persist_chat_turn, user_id, message, response_data["reply"],
+                                response_data["emotion"], user_mood)
+
+
+@app.websocket("/api/v1/chat/ws")
+async def chat_websocket(websocket: WebSocket, user_id: Optional[int] = None, token: Optional[str] = None):
+    """Chat session over one WebSocket - the token check, mood context and history load happen once
+    per connection; each message then only costs the LLM call.
+
+    Client frames: {"type": "message", "message": "..."} (or plain text), {"type": "ping"}
+    Server frames: ready, delta (streamed reply text), reply, error, pong
+    """
+    authorization = await verify_token(token or websocket.headers.get("authorization"))
+    await websocket.accept()
+    if not groq_client:
+        await websocket.send_json({"type": "error", "detail": "Chat service not configured. Please set GROQ_API_KEY."})
+        await websocket.close(code=1011)
+        return
+
+    session = ChatSession(user_id, authorization)
+    chat_sessions.register(session)
+    try:
+        if user_id is not None:
+            await asyncio.gather(
+                _load_session_context(session),
+                asyncio.to_thread(conversation_store.ensure_loaded, user_id, fetch_recent_chat_turns),
+            )
+        await websocket.send_json({
+            "type": "ready",
+            "user_id": user_id,
+            "user_mood": session.user_mood,
+            "history_turns": len(conversation_store.turns(user_id)) if user_id is not None else 0,
+        })
+
+        while True:
+            try:
+                frame = await asyncio.wait_for(websocket.receive_text(), timeout=SESSION_IDLE_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                await websocket.close(code=1000)
+                break
+            try:
+                data = json.loads(frame)
+            except ValueError:
+                data = None
+            if not isinstance(data, dict):
+                data = {"type": "message", "message": frame}
+
+            kind = data.get("type", "message")
+            if kind == "ping":
+                await websocket.send_json({"type": "pong"})
+                continue
+            if kind != "message":
+                await websocket.send_json({"type": "error", "detail": f"Unknown frame type: {kind}"})
+                continue
+            message = str(data.get("message") or "").strip()
+            if not message:
+                await websocket.send_json({"type": "error", "detail": "Message cannot be empty"})
+                continue
+
+            session.touch()
+            try:
+                await _ws_answer(websocket, session, message)
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                # one failed answer shouldn't end the session
+                print(f"❌ Chat session answer failed for user_id={user_id}: {e}")
+                await websocket.send_json({"type": "error", "detail": "Sorry, something went wrong with that message. Please try again."})
+    except WebSocketDisconnect:
+        print(f"🔌 Chat session closed for user_id={user_id} after {session.messages} messages")
+    except Exception as e:
+        print(f"❌ Chat session for user_id={user_id} failed: {e}")
+        try:
+            await websocket.send_json({"type": "error", "detail": "Chat session failed, please reconnect."})
+            await websocket.close(code=1011)
+        except Exception:
+            pass  # the socket is already gone
+    finally:
+        chat_sessions.unregister(session)
+
+
+class SessionStartRequest(BaseModel):
+    user_id: int
+
+
+@app.post("/api/v1/session/start")
+async def session_start(request: SessionStartRequest, background_tasks: BackgroundTasks):
+    """Called when the app opens - warms the user's chat context in the background so the
+    first message skips the cold mood / history / profile reads"""
+    if (mood_context_cache.is_warm(request.user_id) and conversation_store.is_loaded(request.user_id)
+            and profile_cache.is_fresh(request.user_id)):
+        return {"status": "warm", "user_id": request.user_id}
+    background_tasks.add_task(prefetch_user_context, request.user_id)
+    return {"status": "warming", "user_id": request.user_id}
+
+
+@app.get("/api/v1/stats/context-cache")
+async def context_cache_stats():
+    """Mood context cache hit rate and prefetch counts"""
+    return mood_context_cache.stats()
+
+
+@app.get("/api/v1/stats/profile-cache")
+async def profile_cache_stats():
+    """Profile snapshot cache hit rate and revalidation counts"""
+    return profile_cache.stats()
+
+
+@app.get("/api/v1/stats/photo-pool")
+async def photo_pool_stats():
+    """Photo inference workers: queue depth, queue wait and inference time"""
+    return photo_pool.stats()
+
+
+@app.get("/api/v1/stats/photo-detector")
+async def photo_detector_stats():
+    """Per-path success rate / latency behind the detector policy and how often each path went first"""
+    return detector_policy.stats()
+
+
+@app.get("/api/v1/stats/photo-tasks")
+async def photo_task_stats():
+    """Background photo task queue: tasks per status, evictions and worker counters"""
+    return await asyncio.to_thread(photo_task_workers.stats)
+
+
+@app.get("/api/v1/stats/photo-cache")
+async def photo_cache_stats():
+    """Perceptual-hash photo result cache hit rate"""
+    return photo_result_cache.stats()
+
+
+@app.get("/api/v1/stats/chat-sessions")
+async def chat_session_stats():
+    """Open WebSocket chat sessions"""
+    return chat_sessions.stats()
+
 @app.get("/api/chat/test")
 async def test_chat():
     """Test endpoint to verify chat service"""
@@ -1252,9 +1577,64 @@ async def test_chat():
     return {
         "status": "ok",
         "message": "Chat service is ready!",
-        "model": "llama-3.1-8b-instant"
+        "model": model_router.preferred(),
+        "candidate_models": model_router.models
     }
 
+@app.get("/api/v1/stats/json-salvage")
+async def json_salvage_stats():
+    """How often the LLM output needed salvaging, and how often salvage worked"""
+    return json_salvage.stats()
+
+@app.get("/api/v1/stats/models")
+async def model_stats():
+    """Per-model latency percentiles, error rate and health used for routing"""
+    return model_router.stats()
+
+@app.get("/api/v1/stats/reply-cache")
+async def reply_cache_stats():
+    """Hit/miss counters for the chat reply cache"""
+    return reply_cache.stats()
+
+@app.get("/api/v1/stats/llm-limiter")
+async def llm_limiter_stats():
+    """In-flight, queue depth, wait time and rejection counters for LLM calls"""
+    return llm_limiter.stats()
+
+class ClassifyEmotionRequest(BaseModel):
+    message: str
+
+@app.post("/api/v1/classify-emotion")
+async def classify_emotion(request: ClassifyEmotionRequest):
+    """Classify a message's emotion locally (lexicon + n-gram model, no LLM call)"""
+    if not request.message or not request.message.strip():
+        raise HTTPException(status_code=400, detail="Message cannot be empty")
+    emotion, confidence, scores = emotion_classifier.predict(request.message)
+    return {"emotion": emotion, "confidence": round(confidence, 3), "scores": scores, "method": "local_lexicon"}
+
+@app.get("/api/v1/stats/emotion-classifier")
+async def emotion_classifier_stats():
+    """Training size and cross-validation accuracy of the local emotion classifier"""
+    return emotion_classifier.stats()
+
+@app.get("/api/v1/stats/prompts")
+async def prompts_stats():
+    """Estimated prompt tokens per language variant and tokens saved vs. the full prompt"""
+    return prompt_stats()
+
+@app.get("/api/v1/safety/keywords")
+async def safety_keywords_info():
+    """Loaded safety keyword lists and match counter"""
+    return safety_matcher.stats()
+
+@app.post("/api/v1/safety/reload")
+async def reload_safety_keywords():
+    """Reload safety_keywords.json without restarting the service"""
+    ok = safety_matcher.reload()
+    if not ok:
+        raise HTTPException(status_code=500, detail="Failed to reload safety keywords (previous list kept)")
+    return {"success": True, **safety_matcher.stats()}
+
 @app.post("/api/v1/save-mood")
 async def save_mood_direct(request: dict):
     """Direct mood saving endpoint for mobile app"""
@@ -1286,11 +1666,18 @@ async def save_mood_direct(request: dict):
 
 # Compatibility endpoint used by mobile frontend to trigger a client-side chat reset
 @app.post("/api/v1/reset-chat")
-async def reset_chat():
+async def reset_chat(user_id: Optional[int] = None):
     """Return success so the mobile app can clear its chat state."""
-    # Server is stateless for chat history — frontend should clear its local storage.
+    # Frontend clears its local storage; when a user_id is given the server-side conversation memory is dropped too.
+    if user_id is not None:
+        conversation_store.reset(user_id)
     return {"success": True, "message": "chat reset acknowledged"}
 
+@app.get("/api/v1/stats/conversations")
+async def conversation_stats():
+    """Size of the in-process conversation memory"""
+    return conversation_store.stats()
+
 
 @app.post("/api/v1/analyze-emotion")
 @app.post("/analyze-emotion")
@@ -1301,7 +1688,6 @@ async def analyze_emotion(request: EmotionRequest):
     - ALSO attempts to persist detected mood to Supabase (best-effort) and returns `saved` flag.
     """
     print("🔍 analyze_emotion called (json/base64)")
-    temp_path = None
     try:
         # 1. Decode base64 image
         try:
@@ -1319,12 +1705,7 @@ async def analyze_emotion(request: EmotionRequest):
                 "error": "Invalid base64 image data"
             })
 
-        # 2. Save to temp file
-        temp_path = f"/tmp/emotion_analysis_{os.urandom(8).hex()}.jpg"
-        with open(temp_path, "wb") as f:
-            f.write(image_data)
-
-        # 3. Detect face using DeepFace + preprocessing
+        # 2. Detect face using DeepFace + preprocessing (photo worker pool - never on the event loop)
         detected_emotion = "Neutral"
         confidence = 0.4
         all_emotions = {}
@@ -1332,9 +1713,10 @@ async def analyze_emotion(request: EmotionRequest):
         method = "none"
 
         if DEEPFACE_AVAILABLE:
-            detected_emotion, confidence, all_emotions, face_detected, method = detect_emotion_with_preprocessing(temp_path)
+            face_hint = parse_face_hint(request.face_box, request.rotation)
+            detected_emotion, confidence, all_emotions, face_detected, method = await photo_pool.analyze(image_data, face_hint)
 
-        # 4. Attempt to save detected mood to Supabase (best-effort)
+        # 3. Attempt to save detected mood to Supabase (best-effort)
         saved = False
         try:
             # Use the authenticated user's ID - no fallback to hardcoded 1
@@ -1350,13 +1732,6 @@ async def analyze_emotion(request: EmotionRequest):
         except Exception as e:
             print(f"❌ analyze_emotion: exception while saving mood: {e}")
 
-        # Clean up
-        try:
-            if temp_path and os.path.exists(temp_path):
-                os.remove(temp_path)
-        except Exception:
-            pass
-
         status_flag = "deepface_success" if DEEPFACE_AVAILABLE and confidence >= 0.5 else ("no_face_detected" if not face_detected else "deepface_fallback")
 
         return JSONResponse(status_code=200, content={
@@ -1370,13 +1745,16 @@ async def analyze_emotion(request: EmotionRequest):
             "saved": bool(saved)
         })
 
+    except PhotoQueueFull as e:
+        print(f"⚠️ Photo queue full: {e}")
+        return JSONResponse(status_code=503, headers={"Retry-After": "2"}, content={
+            "emotion": "Neutral",
+            "confidence": 0.0,
+            "error": "Photo analysis is busy, please try again in a moment.",
+            "status": "busy"
+        })
     except Exception as e:
         print(f"❌ Error analyzing emotion: {str(e)}")
-        try:
-            if temp_path and os.path.exists(temp_path):
-                os.remove(temp_path)
-        except Exception:
-            pass
         return JSONResponse(status_code=500, content={
             "emotion": "Neutral",
             "confidence": 0.0,
@@ -1385,6 +1763,178 @@ async def analyze_emotion(request: EmotionRequest):
         })
 
 
+def _decode_base64_image(data: str) -> bytes:
+    """Base64 image (optionally a data URL) -> raw bytes"""
+    if ',' in data:
+        data = data.split(',')[1]
+    return base64.b64decode(data)
+
+
+async def _read_images_request(request: Request, file_field: str, json_field: str, max_field_bytes: int = -1):
+    """Images from a multipart upload (repeated `file_field` files) or a JSON body
+    (`json_field`: list of base64 strings) -> (list of bytes, other fields).
+    Other uploaded files are read up to max_field_bytes + 1 bytes, so the caller can
+    reject an oversized one without loading all of it. Raises ValueError for undecodable base64."""
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        images = [await f.read() for f in form.getlist(file_field) if hasattr(f, "read")]
+        fields = {}
+        for key, value in form.items():
+            if key != file_field:
+                fields[key] = await value.read(max_field_bytes + 1 if max_field_bytes >= 0 else -1) \
+                    if hasattr(value, "read") else value
+        return images, fields
+    body = await request.json()
+    try:
+        images = [_decode_base64_image(img) for img in body.get(json_field) or []]
+    except Exception as e:
+        raise ValueError(str(e))
+    return images, {k: v for k, v in body.items() if k != json_field}
+
+
+@app.post("/api/v1/analyze-emotion/batch")
+async def analyze_emotion_batch(request: Request):
+    """
+    📦 Batch Emotion Detection - several photos per request
+    - JSON: {"images": ["<base64>", ...], "user_id": 1, "save": true}
+    - or multipart: `files` (repeated) + `user_id` / `save` form fields
+    Faces are located per photo, then all crops go through the emotion model in one
+    forward pass; detected moods are saved with one batched write.
+    """
+    try:
+        try:
+            images, fields = await _read_images_request(request, "files", "images")
+        except ValueError as e:
+            print(f"❌ Base64 decode error in batch: {e}")
+            return JSONResponse(status_code=400, content={"status": "error", "error": "Invalid base64 image data"})
+        user_id = fields.get("user_id")
+        save = str(fields.get("save", True)).lower() in ("1", "true", "yes")
+
+        if not images:
+            return JSONResponse(status_code=400, content={"status": "error", "error": "No images provided"})
+        if len(images) > PHOTO_BATCH_MAX:
+            return JSONResponse(status_code=413, content={
+                "status": "error",
+                "error": f"At most {PHOTO_BATCH_MAX} images per batch"
+            })
+
+        print(f"📦 analyze_emotion_batch called: {len(images)} images, user_id={user_id}")
+        results = await photo_pool.analyze_batch(images, user_id)
+
+        items = []
+        rows = []
+        for i, result in enumerate(results):
+            if result is None:
+                items.append({"index": i, "status": "decode_error", "emotion": "Neutral", "confidence": 0.0})
+                continue
+            detected_emotion, confidence, all_emotions, face_detected, method = result
+            items.append({
+                "index": i,
+                "status": "success",
+                "emotion": detected_emotion,
+                "confidence": float(confidence),
+                "all_emotions": all_emotions,
+                "face_detected": face_detected,
+                "method": method
+            })
+            if user_id and face_detected:
+                rows.append({
+                    "user_id": int(user_id),
+                    "emotion": detected_emotion,
+                    "confidence": float(confidence),
+                    "source": "photo",
+                    "all_emotions": all_emotions,
+                    "face_detected": face_detected
+                })
+
+        saved = 0
+        if save and rows:
+            saved = await asyncio.to_thread(save_moods_to_database, rows)
+        elif save and not user_id:
+            print("⚠️ No user_id provided for batch photo mood saving")
+
+        return JSONResponse(status_code=200, content={
+            "status": "success",
+            "count": len(items),
+            "results": items,
+            "saved": saved
+        })
+
+    except PhotoQueueFull as e:
+        print(f"⚠️ Photo queue full: {e}")
+        return JSONResponse(status_code=503, headers={"Retry-After": "2"}, content={
+            "status": "busy",
+            "error": "Photo analysis is busy, please try again in a moment."
+        })
+    except Exception as e:
+        print(f"❌ Error in batch emotion analysis: {str(e)}")
+        return JSONResponse(status_code=500, content={"status": "fallback_error", "error": str(e)})
+
+
+@app.post("/api/v1/analyze-emotion/frames")
+async def analyze_emotion_frames(request: Request):
+    """
+    🎞️ Frame-Sequence Emotion - a short burst from the camera screen (or a short clip)
+    - multipart: `frames` (repeated image files) and/or `video` (short clip) + `user_id` / `save`
+    - or JSON: {"frames": ["<base64>", ...], "user_id": 1, "save": false}
+    Near-duplicate frames are skipped, the face box is tracked instead of re-detected,
+    and the per-frame emotions are smoothed into one result.
+    """
+    try:
+        try:
+            frames, fields = await _read_images_request(request, "frames", "frames", FRAME_VIDEO_MAX_BYTES)
+        except ValueError as e:
+            print(f"❌ Base64 decode error in frames: {e}")
+            return JSONResponse(status_code=400, content={"status": "error", "error": "Invalid base64 frame data"})
+        video = fields.pop("video", None)
+        if isinstance(video, str):
+            video = None
+        user_id = fields.get("user_id")
+        save = str(fields.get("save", False)).lower() in ("1", "true", "yes")
+
+        if not frames and not video:
+            return JSONResponse(status_code=400, content={"status": "error", "error": "No frames provided"})
+        if len(frames) > FRAME_MAX_RECEIVED:
+            return JSONResponse(status_code=413, content={
+                "status": "error",
+                "error": f"At most {FRAME_MAX_RECEIVED} frames per request"
+            })
+        if video and len(video) > FRAME_VIDEO_MAX_BYTES:
+            return JSONResponse(status_code=413, content={
+                "status": "error",
+                "error": f"Video clips are limited to {FRAME_VIDEO_MAX_BYTES / (1024 * 1024):.1f} MB"
+            })
+
+        print(f"🎞️ analyze_emotion_frames called: {len(frames)} frames, video={'yes' if video else 'no'}, user_id={user_id}")
+        result = await photo_pool.analyze_frames(frames, video)
+
+        saved = False
+        if save and user_id and result["face_detected"]:
+            saved = await asyncio.to_thread(
+                save_mood_to_database, user_id=int(user_id), emotion=result["emotion"],
+                confidence=float(result["confidence"]), source="photo",
+                all_emotions=result["all_emotions"], face_detected=True
+            )
+
+        return JSONResponse(status_code=200, content={
+            "status": "success",
+            **result,
+            "confidence": float(result["confidence"]),
+            "method": "frames",
+            "saved": bool(saved)
+        })
+
+    except PhotoQueueFull as e:
+        print(f"⚠️ Photo queue full: {e}")
+        return JSONResponse(status_code=503, headers={"Retry-After": "1"}, content={
+            "status": "busy",
+            "error": "Photo analysis is busy, please try again in a moment."
+        })
+    except Exception as e:
+        print(f"❌ Error in frame-sequence analysis: {str(e)}")
+        return JSONResponse(status_code=500, content={"status": "fallback_error", "error": str(e)})
+
+
 # --- Proxy endpoints for mood (forward to user-service) ---
 @app.post("/users/mood")
 async def proxy_save_mood(request_body: dict, authorization: Optional[str] = Header(None)):
@@ -1456,22 +2006,24 @@ async def save_mood(data: dict):
             detail=f"Failed to save mood: {str(e)}"
         )
 
-async def _process_photo_background(task_id: str, image_path: str, user_id: int):
-    """Background worker: run detection, save to DB, update TASK_STORE."""
+async def _process_photo_background(task_id: str, image_data: bytes, user_id: int, kind: str = "photo",
+                                    attempt: int = 1):
+    """Photo task handler (run by photo_task_workers): detection + DB save -> (status, result)"""
     try:
+        if kind == "photo_chat":
+            return await _refine_photo_chat(task_id, image_data, user_id, attempt >= PHOTO_TASK_MAX_ATTEMPTS)
         print(f"🔁 [task:{task_id}] starting background processing for user_id={user_id}")
-        detected_emotion, confidence, all_emotions, face_detected, method = detect_emotion_with_preprocessing(image_path)
+        detected_emotion, confidence, all_emotions, face_detected, method = await photo_pool.analyze(image_data, user_id=user_id)
 
         # Best-effort save
-        saved = save_mood_to_database(user_id=user_id, emotion=detected_emotion, confidence=confidence, source="photo")
+        saved = await asyncio.to_thread(save_mood_to_database, user_id=user_id, emotion=detected_emotion, confidence=confidence, source="photo")
         if saved:
             print(f"✅ [task:{task_id}] mood saved for user_id={user_id}: {detected_emotion} ({confidence:.2f})")
         else:
             print(f"⚠️ [task:{task_id}] failed to save mood for user_id={user_id}")
             print(f"⚠️ [task:{task_id}] mood NOT saved for user_id={user_id}")
 
-        TASK_STORE[task_id]["status"] = "done"
-        TASK_STORE[task_id]["result"] = {
+        return "done", {
             "emotion": detected_emotion,
             "confidence": confidence,
             "saved": bool(saved),
@@ -1489,27 +2041,66 @@ async def _process_photo_background(task_id: str, image_path: str, user_id: int)
             "method": method
         }
 
+    except PhotoQueueFull as ex:
+        # the photo is still stored - photo_task_workers requeues it with backoff
+        print(f"⚠️ [task:{task_id}] photo queue full: {ex}")
+        return "retry", {"error": "Photo analysis is busy, please try again in a moment.", "reason": "queue_full"}
     except Exception as ex:
         print(f"❌ [task:{task_id}] background processing failed: {ex}")
-        TASK_STORE[task_id]["status"] = "error"
-        TASK_STORE[task_id]["result"] = {"error": str(ex)}
-    finally:
-        try:
-            if os.path.exists(image_path):
-                os.remove(image_path)
-        except Exception:
-            pass
+        return "error", {"error": str(ex)}
+
+
+# Longest a status request may be held open (?wait=) and an SSE stream may stay open
+PHOTO_TASK_LONGPOLL_MAX_SECONDS = float(os.getenv("PHOTO_TASK_LONGPOLL_MAX_SECONDS", "30"))
+PHOTO_TASK_SSE_MAX_SECONDS = float(os.getenv("PHOTO_TASK_SSE_MAX_SECONDS", "120"))
+SSE_KEEPALIVE_SECONDS = 15
 
 
 @app.get('/analyze-photo-emotion/status/{task_id}')
-async def analyze_photo_status(task_id: str):
-    """Get status/result for a previously queued photo analysis task"""
-    item = TASK_STORE.get(task_id)
+async def analyze_photo_status(task_id: str, wait: float = 0):
+    """Get status/result for a previously queued photo analysis task.
+    `?wait=N` long-polls: the response is sent as soon as the task is done / error (at most N seconds)."""
+    if wait > 0:
+        item = await photo_task_workers.wait_until_finished(task_id, min(wait, PHOTO_TASK_LONGPOLL_MAX_SECONDS))
+    else:
+        item = await asyncio.to_thread(photo_task_store.get, task_id)
     if not item:
         raise HTTPException(status_code=404, detail="Task not found")
     return item
 
 
+@app.get('/analyze-photo-emotion/events/{task_id}')
+async def analyze_photo_events(task_id: str):
+    """Server-Sent Events: one `status` event per task state change; the stream ends after done / error"""
+    item = await asyncio.to_thread(photo_task_store.get, task_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    async def events():
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + PHOTO_TASK_SSE_MAX_SECONDS
+        current = item
+        yield f"event: status\ndata: {json.dumps(current, ensure_ascii=False)}\n\n"
+        while current["status"] not in FINISHED_STATUSES:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                yield "event: timeout\ndata: {}\n\n"
+                return
+            changed = await photo_task_workers.wait_for_change(
+                task_id, current["status"], min(remaining, SSE_KEEPALIVE_SECONDS))
+            if changed is None:
+                yield "event: error\ndata: {\"error\": \"Task not found\"}\n\n"
+                return
+            if changed["status"] == current["status"]:
+                yield ": keep-alive\n\n"
+                continue
+            current = changed
+            yield f"event: status\ndata: {json.dumps(current, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @app.get("/api/photo-mood-history/{user_id}")
 async def get_photo_mood_history(
     user_id: int,
@@ -1572,6 +2163,126 @@ async def get_photo_mood_history(
         print(f"❌ Error fetching photo mood history: {e}")
         return {"error": str(e), "status": "error"}
 
+async def _photo_chat_followup(user_id, detected_emotion, confidence, all_emotions, face_detected, method) -> dict:
+    """Mood context, AI response and mood save for a photo-emotion-chat result -> response fields"""
+    # 1. Get time-based mood context
+    mood_context = None
+    try:
+        mood_context = await asyncio.to_thread(get_mood_with_time_analysis, user_id, time_window_minutes=30)
+        print(f"📊 Mood context: {mood_context.get('current_mood') if mood_context else 'None'}")
+    except Exception as e:
+        print(f"⚠️ Error getting mood context: {e}")
+
+    # 2. Generate AI response based on emotion and context
+    ai_response = generate_emotion_based_ai_response(detected_emotion, confidence, mood_context)
+    
+    # 3. Save comprehensive mood data to database
+    saved = False
+    try:
+        # Extract additional data for saving
+        color_suggestions = mood_context.get('color_emotion_integration', {}).get('suggested_colors', []) if mood_context else []
+        mood_trend = mood_context.get('trend_analysis', {}).get('trend') if mood_context else None
+        
+        saved = await asyncio.to_thread(
+            save_mood_to_database,
+            user_id=user_id, 
+            emotion=detected_emotion, 
+            confidence=confidence, 
+            source="photo_analysis",
+            ai_response=ai_response,
+            all_emotions=all_emotions,
+            face_detected=face_detected,
+            color_suggestions=color_suggestions,
+            mood_trend=mood_trend
+        )
+        print(f"💾 Comprehensive mood data saved: {saved}")
+        print(f"📝 Saved data includes: emotion={detected_emotion}, ai_response, colors={len(color_suggestions)}, trend={mood_trend}")
+    except Exception as e:
+        print(f"❌ Error saving comprehensive mood data: {e}")
+
+    status_flag = "deepface_success" if DEEPFACE_AVAILABLE and confidence >= 0.5 else ("no_face_detected" if not face_detected else "deepface_fallback")
+    return {
+        "emotion_analysis": {
+            "emotion": detected_emotion,
+            "confidence": float(confidence),
+            "all_emotions": all_emotions,
+            "face_detected": face_detected,
+            "detection_method": method,
+            "detection_status": status_flag
+        },
+        "ai_response": ai_response,
+        "mood_context": {
+            "has_context": mood_context is not None,
+            "trend": mood_context.get('trend_analysis', {}).get('trend') if mood_context else None,
+            "color_suggestions": mood_context.get('color_emotion_integration', {}).get('suggested_colors', []) if mood_context else []
+        },
+        "data_saved": saved
+    }
+
+
+async def _queue_photo_chat_refinement(user_id, image_data: bytes, coarse) -> Optional[dict]:
+    """Queue the full-pipeline second phase of a two-phase photo chat; None if the task store is full.
+    The coarse result is stored with the task so it can be saved if the refinement fails."""
+    task_id = _new_task_id()
+    try:
+        await asyncio.to_thread(photo_task_store.create, task_id, user_id, image_data, "photo_chat",
+                                {"phase": "coarse", "coarse": list(coarse)})
+    except TaskStoreFull as e:
+        print(f"⚠️ Photo task store full, coarse photo result is final: {e}")
+        return None
+    photo_task_workers.notify()
+    return {
+        "task_id": task_id,
+        "status_url": f"/analyze-photo-emotion/status/{task_id}",
+        "events_url": f"/analyze-photo-emotion/events/{task_id}"
+    }
+
+
+def _coarse_photo_chat_response(user_id, coarse, refinement: dict) -> dict:
+    """First-phase photo chat response - nothing is saved until the refined result is in"""
+    detected_emotion, confidence, all_emotions, face_detected, method = coarse
+    return {
+        "status": "success",
+        "phase": "coarse",
+        "emotion_analysis": {
+            "emotion": detected_emotion,
+            "confidence": float(confidence),
+            "all_emotions": all_emotions,
+            "face_detected": face_detected,
+            "detection_method": method,
+            "detection_status": "coarse"
+        },
+        "ai_response": generate_emotion_based_ai_response(detected_emotion, confidence, None),
+        "refinement": refinement,
+        "data_saved": False,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "user_id": user_id
+    }
+
+
+async def _refine_photo_chat(task_id: str, image_data: bytes, user_id: int, last_attempt: bool = True):
+    """Second phase of a two-phase photo chat: full pipeline, AI response, mood save -> (status, result).
+    A busy pool is retried (PhotoQueueFull propagates) until the last attempt; then, or when the
+    pipeline fails, the stored coarse result is saved instead so the photo isn't lost."""
+    print(f"🔁 [task:{task_id}] refining photo chat result for user_id={user_id}")
+    try:
+        result = await photo_pool.analyze(image_data, user_id=user_id)
+        phase, refinement_error = "refined", None
+    except Exception as e:
+        if isinstance(e, PhotoQueueFull) and not last_attempt:
+            raise
+        item = await asyncio.to_thread(photo_task_store.get, task_id)
+        coarse = ((item or {}).get("result") or {}).get("coarse")
+        if not coarse:
+            raise
+        print(f"⚠️ [task:{task_id}] refinement failed ({e}); saving the coarse result")
+        result, phase, refinement_error = coarse, "coarse", str(e)
+    followup = await _photo_chat_followup(user_id, *result)
+    if refinement_error:
+        followup["refinement_error"] = refinement_error
+    return "done", {"phase": phase, **followup}
+
+
 @app.post("/api/photo-emotion-chat")
 async def photo_emotion_chat(
     request: dict,
@@ -1583,8 +2294,10 @@ async def photo_emotion_chat(
     - Generates contextual AI response based on detected emotion
     - Saves mood data to database
     - Returns both emotion analysis and AI chat response
+    - `two_phase: true` answers right away with a coarse result (photo cache, or a Haar
+      crop + one emotion-model pass) and a `refinement` task; the full DeepFace result,
+      its AI response and the mood save follow via /analyze-photo-emotion/status|events
     """
-    temp_path = None
     try:
         # 1. Extract user_id and image
         user_id = request.get('user_id', 1)
@@ -1610,12 +2323,7 @@ async def photo_emotion_chat(
                 "message": "Please provide a valid base64 image"
             })
 
-        # 3. Save to temp file
-        temp_path = f"/tmp/photo_emotion_{user_id}_{os.urandom(4).hex()}.jpg"
-        with open(temp_path, "wb") as f:
-            f.write(image_data)
-
-        # 4. Detect emotion using DeepFace
+        # 3. Detect emotion using DeepFace (photo worker pool)
         detected_emotion = "Neutral"
         confidence = 0.4
         all_emotions = {}
@@ -1623,83 +2331,38 @@ async def photo_emotion_chat(
         method = "none"
 
         if DEEPFACE_AVAILABLE:
-            detected_emotion, confidence, all_emotions, face_detected, method = detect_emotion_with_preprocessing(temp_path)
+            face_hint = parse_face_hint(request.get('face_box'), request.get('rotation'))
+            if str(request.get('two_phase', '')).lower() in ("1", "true", "yes"):
+                coarse, final = await photo_pool.analyze_quick(image_data, face_hint, user_id)
+                if not final:
+                    refinement = await _queue_photo_chat_refinement(user_id, image_data, coarse)
+                    if refinement is not None:
+                        return JSONResponse(status_code=200, content=_coarse_photo_chat_response(user_id, coarse, refinement))
+                detected_emotion, confidence, all_emotions, face_detected, method = coarse
+            else:
+                detected_emotion, confidence, all_emotions, face_detected, method = await photo_pool.analyze(image_data, face_hint, user_id)
             print(f"🎭 Emotion detected: {detected_emotion} (confidence: {confidence:.2f})")
 
-        # 5. Get time-based mood context
-        mood_context = None
-        try:
-            mood_context = get_mood_with_time_analysis(user_id, time_window_minutes=30)
-            print(f"📊 Mood context: {mood_context.get('current_mood') if mood_context else 'None'}")
-        except Exception as e:
-            print(f"⚠️ Error getting mood context: {e}")
-
-        # 6. Generate AI response based on emotion and context
-        ai_response = generate_emotion_based_ai_response(detected_emotion, confidence, mood_context)
-        
-        # 7. Save comprehensive mood data to database
-        saved = False
-        try:
-            # Extract additional data for saving
-            color_suggestions = mood_context.get('color_emotion_integration', {}).get('suggested_colors', []) if mood_context else []
-            mood_trend = mood_context.get('trend_analysis', {}).get('trend') if mood_context else None
-            
-            saved = save_mood_to_database(
-                user_id=user_id, 
-                emotion=detected_emotion, 
-                confidence=confidence, 
-                source="photo_analysis",
-                ai_response=ai_response,
-                all_emotions=all_emotions,
-                face_detected=face_detected,
-                color_suggestions=color_suggestions,
-                mood_trend=mood_trend
-            )
-            print(f"💾 Comprehensive mood data saved: {saved}")
-            print(f"📝 Saved data includes: emotion={detected_emotion}, ai_response, colors={len(color_suggestions)}, trend={mood_trend}")
-        except Exception as e:
-            print(f"❌ Error saving comprehensive mood data: {e}")
-
-        # 8. Clean up temp file
-        try:
-            if temp_path and os.path.exists(temp_path):
-                os.remove(temp_path)
-        except Exception:
-            pass
-
-        # 9. Return comprehensive response
-        status_flag = "deepface_success" if DEEPFACE_AVAILABLE and confidence >= 0.5 else ("no_face_detected" if not face_detected else "deepface_fallback")
+        # 4. Mood context, AI response, save
+        followup = await _photo_chat_followup(user_id, detected_emotion, confidence, all_emotions, face_detected, method)
 
+        # 5. Return comprehensive response
         return JSONResponse(status_code=200, content={
             "status": "success",
-            "emotion_analysis": {
-                "emotion": detected_emotion,
-                "confidence": float(confidence),
-                "all_emotions": all_emotions,
-                "face_detected": face_detected,
-                "detection_method": method,
-                "detection_status": status_flag
-            },
-            "ai_response": ai_response,
-            "mood_context": {
-                "has_context": mood_context is not None,
-                "trend": mood_context.get('trend_analysis', {}).get('trend') if mood_context else None,
-                "color_suggestions": mood_context.get('color_emotion_integration', {}).get('suggested_colors', []) if mood_context else []
-            },
-            "data_saved": saved,
+            **followup,
             "timestamp": datetime.now(timezone.utc).isoformat(),
             "user_id": user_id
         })
 
+    except PhotoQueueFull as e:
+        print(f"⚠️ Photo queue full: {e}")
+        return JSONResponse(status_code=503, headers={"Retry-After": "2"}, content={
+            "status": "busy",
+            "error": "Photo analysis is busy",
+            "message": "Please try again in a moment."
+        })
     except Exception as e:
         print(f"❌ Error in photo emotion chat: {e}")
-        # Clean up on error
-        try:
-            if temp_path and os.path.exists(temp_path):
-                os.remove(temp_path)
-        except Exception:
-            pass
-        
         return JSONResponse(status_code=500, content={
             "status": "error",
             "error": "Failed to analyze photo and generate response",
@@ -1788,42 +2451,42 @@ async def analyze_photo_emotion(
     file: UploadFile = File(...),
     user_id: int = Form(1),  # Default user_id = 1 for testing
     background: Optional[str] = Form(None),
-    background_tasks: BackgroundTasks = None
+    face_box: Optional[str] = Form(None),  # on-device face box: "x,y,w,h" or JSON
+    rotation: Optional[int] = Form(None)
 ):
     """
     📸 Photo Emotion Analysis - Multipart File Upload
     - If `background=true` is provided, analysis runs asynchronously and returns a task_id.
     - Otherwise it behaves synchronously (legacy behavior).
+    - An optional `face_box` (+ `rotation`) from on-device detection skips server-side
+      face detection on the synchronous path when it looks plausible.
     """
-    temp_path = None
-
     try:
-        # 1. Save uploaded file temporarily
+        # 1. Read the upload (kept in memory - the photo workers take raw bytes)
         image_data = await file.read()
-        temp_path = f"/tmp/photo_emotion_{os.urandom(8).hex()}.jpg"
-
-        with open(temp_path, "wb") as f:
-            f.write(image_data)
 
         print(f"📸 Received photo for user_id={user_id}: {file.filename}  (background={background})")
 
         # If caller requested async/background processing, enqueue and return task id
         if background and background.lower() in ("1", "true", "yes"):
             task_id = _new_task_id()
-            TASK_STORE[task_id] = {"status": "queued", "created_at": datetime.utcnow().isoformat(), "user_id": user_id, "result": None}
-            # schedule background worker
-            if background_tasks is not None:
-                background_tasks.add_task(_process_photo_background, task_id, temp_path, user_id)
-            else:
-                # fallback - schedule on event loop
-                asyncio.create_task(_process_photo_background(task_id, temp_path, user_id))
+            try:
+                await asyncio.to_thread(photo_task_store.create, task_id, user_id, image_data)
+            except TaskStoreFull as e:
+                print(f"⚠️ Photo task store full: {e}")
+                return JSONResponse(status_code=503, headers={"Retry-After": "5"}, content={
+                    "status": "busy",
+                    "error": "Too many photos waiting for analysis, please try again shortly."
+                })
+            # wake a photo task worker in this process (others poll the shared store)
+            photo_task_workers.notify()
 
-            # do NOT remove temp_path here - background worker will clean it up
             return JSONResponse(status_code=202, content={"status": "processing", "task_id": task_id, "message": "Photo analysis queued; will update when done."})
 
         # --- Legacy synchronous path (detect now, save now) ---
         print(f"🔁 Performing synchronous detection for user_id={user_id}")
-        detected_emotion, confidence, all_emotions, face_detected, method = detect_emotion_with_preprocessing(temp_path)
+        detected_emotion, confidence, all_emotions, face_detected, method = await photo_pool.analyze(
+            image_data, parse_face_hint(face_box, rotation), user_id)
 
         emotion_replies = {
             "Happy": "I can see that beautiful smile! 😊 What's making you so happy today?",
@@ -1838,17 +2501,13 @@ async def analyze_photo_emotion(
         bot_reply = emotion_replies.get(detected_emotion, "Thanks for sharing! 📸 How are you feeling?")
 
         # Best-effort save
-        saved = save_mood_to_database(user_id=user_id, emotion=detected_emotion, confidence=confidence, source="photo")
+        saved = await asyncio.to_thread(save_mood_to_database, user_id=user_id, emotion=detected_emotion, confidence=confidence, source="photo")
         if saved:
             print(f"✅ Mood saved to database: user_id={user_id}, emotion={detected_emotion}, confidence={confidence:.2f}")
         else:
             print(f"⚠️ Failed to save mood to database for user_id={user_id}")
             print(f"⚠️ Mood NOT saved to database for user_id={user_id}")
 
-        # Clean up
-        if temp_path and os.path.exists(temp_path):
-            os.remove(temp_path)
-
         return JSONResponse(status_code=200, content={
             "status": "success",
             "emotion": detected_emotion,
@@ -1857,12 +2516,17 @@ async def analyze_photo_emotion(
             "saved": bool(saved)
         })
 
+    except PhotoQueueFull as e:
+        print(f"⚠️ Photo queue full: {e}")
+        return JSONResponse(status_code=503, headers={"Retry-After": "2"}, content={
+            "emotion": "Neutral",
+            "reply": "I'm looking at a lot of photos right now - please try again in a moment! 📸",
+            "confidence": 0.0,
+            "error": "busy"
+        })
     except Exception as e:
         print(f"❌ Error in photo emotion analysis: {str(e)}")
 
-        if temp_path and os.path.exists(temp_path):
-            os.remove(temp_path)
-
         return JSONResponse(status_code=500, content={
             "emotion": "Neutral",
             "reply": "Thanks for sharing your photo! 📸 How are you feeling today? 😊",
@@ -1931,8 +2595,7 @@ async def get_chat_history(user_id: int, limit: int = 50):
         raise HTTPException(status_code=500, detail=f"Failed to fetch chat history: {str(e)}")
 
 if __name__ == "__main__":
-    import uvicorn
-    # Default to 8003 so it matches test_user_mood.py / API gateway expectations;
-    # allow override via PORT or CHAT_AI_PORT environment variables.
-    port = int(os.getenv("PORT", os.getenv("CHAT_AI_PORT", "8003")))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # Serve through run.py: spawned photo workers re-import the launching script,
+    # and re-importing this one would repeat the whole API startup in every worker
+    run_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), "run.py")
+    os.execv(sys.executable, [sys.executable, run_py])
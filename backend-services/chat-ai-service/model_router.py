@@ -0,0 +1,230 @@
+"""
+Latency-aware model routing - tries the fastest healthy Groq model first and
+falls back to the next candidate when a call errors or misses its deadline.
+"""
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from typing import Optional
+
+CHAT_MODELS = [m.strip() for m in os.getenv(
+    "CHAT_MODELS", "llama-3.1-8b-instant,llama-3.3-70b-versatile"
+).split(",") if m.strip()]
+# Overall budget for one chat completion, and the cap for a single model attempt
+LLM_REQUEST_DEADLINE_SECONDS = float(os.getenv("LLM_REQUEST_DEADLINE_SECONDS", "9"))
+LLM_ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("LLM_ATTEMPT_TIMEOUT_SECONDS", "5"))
+# A model whose recent error rate exceeds this is skipped until its cooldown passes
+MODEL_MAX_ERROR_RATE = float(os.getenv("MODEL_MAX_ERROR_RATE", "0.5"))
+MODEL_COOLDOWN_SECONDS = float(os.getenv("MODEL_COOLDOWN_SECONDS", "30"))
+# Samples needed before a model's latency is trusted on its own for ranking
+MODEL_MIN_SAMPLES = 3
+# Assumed latency of a model with fewer samples, blended with what has been observed so far
+MODEL_PRIOR_LATENCY_SECONDS = float(os.getenv("MODEL_PRIOR_LATENCY_SECONDS", "2"))
+
+
+class LLMDeadlineExceeded(Exception):
+    """No model answered within the request deadline"""
+
+
+def _percentile(sorted_values, pct: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+
+def _is_rate_limit(exc: Exception) -> bool:
+    status = getattr(exc, "status_code", None)
+    return status == 429 or "rate limit" in str(exc).lower()
+
+
+def _budget(deadline_seconds: Optional[float]) -> float:
+    """Seconds this call may take: the caller's deadline (None = LLM_REQUEST_DEADLINE_SECONDS);
+    an already spent deadline fails fast instead of falling back to the default"""
+    if deadline_seconds is None:
+        return LLM_REQUEST_DEADLINE_SECONDS
+    if deadline_seconds <= 0:
+        raise LLMDeadlineExceeded("Request deadline already spent")
+    return deadline_seconds
+
+
+class ModelStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies = deque(maxlen=200)
+        self.outcomes = deque(maxlen=50)  # True = success
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.cooldown_until = 0.0
+
+    def error_rate(self) -> float:
+        return (self.outcomes.count(False) / len(self.outcomes)) if self.outcomes else 0.0
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.cooldown_until
+
+    def expected_cost(self) -> float:
+        """Expected seconds to a successful answer: latency (prior-smoothed until MODEL_MIN_SAMPLES
+        samples) divided by the recent success rate, so failing models sink instead of looking free"""
+        lat = sorted(self.latencies)
+        if len(lat) >= MODEL_MIN_SAMPLES:
+            latency = _percentile(lat, 50)
+        else:
+            missing = MODEL_MIN_SAMPLES - len(lat)
+            latency = (sum(lat) + missing * MODEL_PRIOR_LATENCY_SECONDS) / MODEL_MIN_SAMPLES
+        return latency / max(1.0 - self.error_rate(), 0.05)
+
+    def snapshot(self) -> dict:
+        lat = sorted(self.latencies)
+        p50, p95 = _percentile(lat, 50), _percentile(lat, 95)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "error_rate": round(self.error_rate(), 3),
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "samples": len(lat),
+            "expected_cost_ms": round(self.expected_cost() * 1000, 1),
+            "healthy": self.healthy(time.time()),
+            "cooldown_remaining_s": max(0.0, round(self.cooldown_until - time.time(), 1)),
+        }
+
+
+class ModelRouter:
+    def __init__(self, models=None):
+        self.models = list(models or CHAT_MODELS)
+        self._stats = {m: ModelStats(m) for m in self.models}
+        self._lock = threading.Lock()
+
+    def ranked(self) -> list:
+        """Candidates ordered: healthy first, then by expected cost (p50 / success rate), then config order"""
+        now = time.time()
+        with self._lock:
+            def key(item):
+                idx, name = item
+                st = self._stats[name]
+                return (not st.healthy(now), st.expected_cost(), idx)
+            return [name for _, name in sorted(enumerate(self.models), key=key)]
+
+    def preferred(self) -> Optional[str]:
+        ranked = self.ranked()
+        return ranked[0] if ranked else None
+
+    def _record(self, name: str, latency: Optional[float], ok: bool, exc: Optional[Exception] = None, timed_out: bool = False):
+        with self._lock:
+            st = self._stats[name]
+            st.requests += 1
+            st.outcomes.append(ok)
+            if ok:
+                st.latencies.append(latency)
+                return
+            st.errors += 1
+            if timed_out:
+                st.timeouts += 1
+                # a deadline miss still tells us the model is at least this slow
+                st.latencies.append(latency)
+            if (exc is not None and _is_rate_limit(exc)) or (
+                    len(st.outcomes) >= 4 and st.error_rate() > MODEL_MAX_ERROR_RATE):
+                st.cooldown_until = time.time() + MODEL_COOLDOWN_SECONDS
+
+    async def complete(self, client, deadline_seconds: Optional[float] = None, **create_kwargs):
+        """Run a chat completion on the best model; returns (completion, model_name)"""
+        deadline = time.monotonic() + _budget(deadline_seconds)
+        last_exc = None
+        for name in self.ranked():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0.05:
+                break
+            attempt_timeout = min(LLM_ATTEMPT_TIMEOUT_SECONDS, remaining)
+            api = client
+            if hasattr(client, "with_options"):
+                # no SDK-level retries - falling back to another model is our retry
+                api = client.with_options(max_retries=0, timeout=attempt_timeout)
+            started = time.monotonic()
+            try:
+                completion = await asyncio.wait_for(
+                    asyncio.to_thread(api.chat.completions.create, model=name, **create_kwargs),
+                    timeout=attempt_timeout
+                )
+                self._record(name, time.monotonic() - started, True)
+                return completion, name
+            except asyncio.TimeoutError as e:
+                last_exc = e
+                self._record(name, time.monotonic() - started, False, timed_out=True)
+                print(f"⏱️ Model {name} missed its {attempt_timeout:.1f}s deadline, falling back")
+            except Exception as e:
+                last_exc = e
+                self._record(name, time.monotonic() - started, False, exc=e)
+                print(f"⚠️ Model {name} failed: {e}, falling back")
+        if isinstance(last_exc, asyncio.TimeoutError) or last_exc is None:
+            raise LLMDeadlineExceeded("No model answered within the request deadline")
+        raise last_exc
+
+    async def stream(self, client, on_delta, deadline_seconds: Optional[float] = None, **create_kwargs):
+        """Streaming variant of complete(): `on_delta(text)` is called from a worker thread for each
+        chunk. Falls back to the next model only while nothing has been streamed. Returns (text, model_name)"""
+        deadline = time.monotonic() + _budget(deadline_seconds)
+        last_exc = None
+        for name in self.ranked():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0.05:
+                break
+            api = client
+            if hasattr(client, "with_options"):
+                # the SDK timeout bounds each read, i.e. time to first token / between chunks
+                api = client.with_options(max_retries=0, timeout=min(LLM_ATTEMPT_TIMEOUT_SECONDS, remaining))
+            emitted = threading.Event()
+            stop = threading.Event()
+
+            def consume(api=api, name=name, emitted=emitted, stop=stop):
+                parts = []
+                for chunk in api.chat.completions.create(model=name, stream=True, **create_kwargs):
+                    if stop.is_set():
+                        break
+                    choices = getattr(chunk, "choices", None) or []
+                    delta = getattr(choices[0].delta, "content", None) if choices else None
+                    if delta:
+                        parts.append(delta)
+                        emitted.set()
+                        on_delta(delta)
+                return "".join(parts)
+
+            started = time.monotonic()
+            try:
+                text = await asyncio.wait_for(asyncio.to_thread(consume), timeout=remaining)
+                self._record(name, time.monotonic() - started, True)
+                return text, name
+            except asyncio.TimeoutError as e:
+                stop.set()
+                last_exc = e
+                self._record(name, time.monotonic() - started, False, timed_out=True)
+                print(f"⏱️ Model {name} stream missed the {remaining:.1f}s deadline")
+            except Exception as e:
+                stop.set()
+                last_exc = e
+                self._record(name, time.monotonic() - started, False, exc=e)
+                print(f"⚠️ Model {name} stream failed: {e}")
+            if emitted.is_set():
+                # part of a reply already reached the client - can't restart on another model
+                break
+        if isinstance(last_exc, asyncio.TimeoutError) or last_exc is None:
+            raise LLMDeadlineExceeded("No model answered within the request deadline")
+        raise last_exc
+
+    def stats(self) -> dict:
+        with self._lock:
+            per_model = {name: st.snapshot() for name, st in self._stats.items()}
+        return {
+            "candidates": self.models,
+            "preferred": self.preferred(),
+            "request_deadline_s": LLM_REQUEST_DEADLINE_SECONDS,
+            "attempt_timeout_s": LLM_ATTEMPT_TIMEOUT_SECONDS,
+            "models": per_model,
+        }
+
+
+model_router = ModelRouter()
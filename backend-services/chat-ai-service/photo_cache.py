@@ -0,0 +1,143 @@
+"""
+Photo result cache - each upload's content hash maps to its detection
+result, so a resubmitted photo (retry after a timeout, or the same picture
+sent to another photo endpoint) skips inference.
+
+Keys are scoped to the uploading user and to the pipeline variant that
+produced the result - the full pipeline, a client face-box hint and the
+batch path answer differently for the same photo and never stand in for one
+another. Within that scope an upload matches on its SHA-256 first, then on a
+64-bit difference hash (dHash) within PHOTO_HASH_MAX_DISTANCE bits, so a
+re-encoded or resized copy (mobile clients re-encode every capture) still
+hits. The radius is kept tight and never crosses users: a loose perceptual
+match lets two different faces in similar shots share a result.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from image_prep import apply_orientation, header_info
+
+PHOTO_CACHE_MAX_ENTRIES = int(os.getenv("PHOTO_CACHE_MAX_ENTRIES", "512"))
+PHOTO_CACHE_TTL_SECONDS = float(os.getenv("PHOTO_CACHE_TTL_SECONDS", "3600"))
+# dHash bits two uploads of one user may differ by and still share a result (0 = exact bytes only)
+PHOTO_HASH_MAX_DISTANCE = int(os.getenv("PHOTO_HASH_MAX_DISTANCE", "2"))
+
+
+def dhash(gray: np.ndarray) -> int:
+    """Difference hash: 9x8 thumbnail, one bit per left/right brightness step"""
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(sum(1 << i for i, bit in enumerate(bits) if bit))
+
+
+def image_hash(image_bytes: bytes) -> Optional[tuple]:
+    """(SHA-256 hex, dHash of the upright image | None if undecodable), or None for an empty upload"""
+    if not image_bytes:
+        return None
+    gray = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8),
+                        cv2.IMREAD_REDUCED_GRAYSCALE_8 | cv2.IMREAD_IGNORE_ORIENTATION)
+    perceptual = None
+    if gray is not None and gray.size:
+        perceptual = dhash(apply_orientation(gray, header_info(image_bytes)[1]))
+    return hashlib.sha256(image_bytes).hexdigest(), perceptual
+
+
+def hint_variant(face_hint: Optional[dict]) -> str:
+    """Cache variant for a pipeline run: "full", or one per client face box (its result depends on the box)"""
+    if not face_hint:
+        return "full"
+    return "hint:" + json.dumps({"box": list(face_hint.get("box") or ()), "rotation": face_hint.get("rotation")},
+                                sort_keys=True)
+
+
+def cache_key(digest: Optional[tuple], user_id=None, variant: str = "full") -> Optional[tuple]:
+    """(user_id, variant, sha256, dhash) or None when the photo has no digest"""
+    if digest is None:
+        return None
+    return (user_id, variant) + tuple(digest)
+
+
+class PhotoResultCache:
+    """LRU of (user_id, variant, sha256) -> (emotion, confidence, all_emotions, face_detected, method) with a TTL;
+    near-identical uploads of the same user and variant match by dHash"""
+
+    def __init__(self, max_entries: int = PHOTO_CACHE_MAX_ENTRIES, ttl_seconds: float = PHOTO_CACHE_TTL_SECONDS,
+                 max_distance: int = PHOTO_HASH_MAX_DISTANCE):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.max_distance = max_distance
+        self._entries: "OrderedDict[tuple, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def _lookup(self, key: tuple) -> Optional[tuple]:
+        exact = key[:3]
+        if exact in self._entries:
+            return exact
+        perceptual = key[3] if len(key) > 3 else None
+        if perceptual is None or self.max_distance <= 0:
+            return None
+        # re-encoded / resized copy: closest hash of this user's uploads in the same variant
+        best, best_distance = None, self.max_distance + 1
+        for stored, entry in self._entries.items():
+            if stored[:2] != key[:2] or entry["dhash"] is None:
+                continue
+            distance = bin(entry["dhash"] ^ perceptual).count("1")
+            if distance < best_distance:
+                best, best_distance = stored, distance
+        return best
+
+    def get(self, key: Optional[tuple]):
+        if key is None:
+            return None
+        with self._lock:
+            stored = self._lookup(key)
+            entry = self._entries.get(stored) if stored is not None else None
+            if entry is None or time.time() - entry["stored_at"] > self.ttl:
+                if entry is not None:
+                    self._entries.pop(stored, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(stored)
+            self.hits += 1
+            if stored != key[:3]:
+                self.near_hits += 1
+            emotion, confidence, all_emotions, face_detected, method = entry["result"]
+            return emotion, confidence, dict(all_emotions or {}), face_detected, method
+
+    def put(self, key: Optional[tuple], result):
+        if key is None or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key[:3]] = {"result": tuple(result), "stored_at": time.time(),
+                                      "dhash": key[3] if len(key) > 3 else None}
+            self._entries.move_to_end(key[:3])
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else None,
+                "ttl_s": self.ttl,
+                "max_distance": self.max_distance,
+            }
+
+
+photo_result_cache = PhotoResultCache()
@@ -0,0 +1,350 @@
+"""
+Photo inference pool - runs the CPU-heavy DeepFace / OpenCV pipeline in
+worker processes (each with its models preloaded and warmed) so photo
+analysis never blocks the event loop that also serves chat.
+
+Handlers `await photo_pool.analyze(image_bytes)`. Work beyond the workers
+plus PHOTO_QUEUE_MAX waiting jobs is rejected (PhotoQueueFull) instead of
+piling up. Photos this user already sent (photo_cache: same bytes, or a
+re-encoded / resized copy, per pipeline variant) are answered from the
+cache without queueing. `analyze_batch` sends several photos to one
+worker so their face crops share a single emotion-model forward pass;
+`analyze_frames` does the same for a camera burst / clip (frame_sequence).
+`analyze_quick` is the cheap first phase of a two-phase result (Haar crop +
+one emotion-model pass, no DeepFace detectors). It runs on a thread in this
+process with its own PHOTO_QUICK_MAX slots instead of queueing behind full
+pipeline jobs - a coarse answer that waits seconds for a worker is pointless.
+"""
+import os
+import time
+import asyncio
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from detector_policy import detector_policy
+from photo_cache import photo_result_cache, image_hash, hint_variant, cache_key
+
+# 0 = run inference on a thread in this process (dev / no DeepFace)
+PHOTO_WORKERS = int(os.getenv("PHOTO_WORKERS", "2"))
+PHOTO_QUEUE_MAX = int(os.getenv("PHOTO_QUEUE_MAX", "16"))
+# Most photos accepted by one analyze_batch call
+PHOTO_BATCH_MAX = int(os.getenv("PHOTO_BATCH_MAX", "16"))
+# Concurrent quick (coarse) analyses, run in this process outside the worker queue
+PHOTO_QUICK_MAX = int(os.getenv("PHOTO_QUICK_MAX", "4"))
+
+_worker_warmup = None  # per worker process: {backend: {...}} from the initializer
+
+
+class PhotoQueueFull(Exception):
+    """All workers busy and the wait queue is full"""
+
+
+def _init_worker():
+    """Worker initializer: import the models and run the warm-up once per process"""
+    global _worker_warmup
+    import face_emotion
+    from inference_warmup import warm_backends
+    _worker_warmup = warm_backends(face_emotion.DeepFace, face_cascade=face_emotion.face_cascade) \
+        if face_emotion.DEEPFACE_AVAILABLE else {}
+
+
+def _worker_status() -> dict:
+    return {"pid": os.getpid(), "backends": _worker_warmup or {}}
+
+
+def run_pipeline(image_bytes: bytes, plan=None):
+    """Full detection pipeline on raw image bytes ->
+    ((emotion, confidence, all_emotions, face_detected, method), [(path, succeeded, seconds, confidence), ...])"""
+    import face_emotion
+    from image_prep import PreparedImage
+    prep = PreparedImage.from_bytes(image_bytes)
+    if prep.small is None:
+        return ("Neutral", 0.4, {}, False, "decode_error"), []
+    return face_emotion.run_detection_plan(prep, plan)
+
+
+def run_hint_pipeline(image_bytes: bytes, face_hint):
+    """Emotion model on a plausible client face box (face_emotion.parse_face_hint), no detection ->
+    result, or None when the box is rejected (or the image can't be decoded)"""
+    import face_emotion
+    from image_prep import PreparedImage
+    prep = PreparedImage.from_bytes(image_bytes)
+    if prep.small is None:
+        return None
+    return face_emotion.analyze_with_face_hint(prep, face_hint)
+
+
+def run_quick_pipeline(image_bytes: bytes, face_hint=None):
+    """Coarse first-phase result: client face box or Haar crop + one emotion-model pass"""
+    import face_emotion
+    from image_prep import PreparedImage
+    prep = PreparedImage.from_bytes(image_bytes)
+    if prep.small is None:
+        return "Neutral", 0.4, {}, False, "decode_error"
+    if face_hint:
+        result = face_emotion.analyze_with_face_hint(prep, face_hint)
+        if result is not None:
+            return result
+    return face_emotion.quick_emotion(prep)
+
+
+def run_batch_pipeline(images):
+    """Several photos, one emotion-model forward pass -> [result | None (undecodable), ...]"""
+    import face_emotion
+    from image_prep import PreparedImage
+    return face_emotion.analyze_batch([PreparedImage.from_bytes(image_bytes) for image_bytes in images])
+
+
+def run_frames_pipeline(frames=None, video=None):
+    """Frame burst / clip -> temporally smoothed emotion (see frame_sequence)"""
+    import frame_sequence
+    return frame_sequence.run_frames_pipeline(frames, video)
+
+
+def _timed(fn, *args):
+    started = time.time()
+    result = fn(*args)
+    return result, started, time.time()
+
+
+def _percentile(values, pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+class PhotoPool:
+    def __init__(self, workers: int = PHOTO_WORKERS, queue_max: int = PHOTO_QUEUE_MAX):
+        self.workers = workers
+        self.queue_max = queue_max
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._quick_pending = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.restarts = 0
+        self.batches = 0
+        self.frame_jobs = 0
+        self.quick_jobs = 0
+        self.hints_used = 0
+        self.hints_rejected = 0
+        self._queue_waits = deque(maxlen=500)
+        self._inference_times = deque(maxlen=500)
+
+    @property
+    def uses_processes(self) -> bool:
+        return self.workers > 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: TensorFlow state doesn't survive fork
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                )
+            return self._executor
+
+    def _reset_executor(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+                self.restarts += 1
+
+    def warm_all(self) -> dict:
+        """Start every worker (each warms its models in the initializer) - blocking, for startup"""
+        if not self.uses_processes:
+            return {}
+        executor = self._get_executor()
+        statuses = [f.result() for f in [executor.submit(_worker_status) for _ in range(self.workers)]]
+        backends = {}
+        for status in statuses:
+            backends.update(status["backends"])
+        return backends
+
+    def warm_quick(self) -> dict:
+        """Build the emotion model in this process for analyze_quick - blocking, for startup
+        (the workers warm their own; the coarse phase runs here)"""
+        if PHOTO_QUICK_MAX <= 0:
+            return {}
+        import face_emotion
+        return face_emotion.warm_emotion_model()
+
+    def _reserve(self, photos: int = 1):
+        """Count a job's photos against workers + PHOTO_QUEUE_MAX (a batch weighs as many photos
+        as it carries); an oversized batch is only let in when nothing else is pending"""
+        capacity = max(1, self.workers) + self.queue_max
+        with self._lock:
+            if self._pending and self._pending + photos > capacity:
+                self.rejected += photos
+                raise PhotoQueueFull(f"{self._pending} photos in flight")
+            self._pending += photos
+            self.submitted += photos
+
+    async def _run(self, fn, *args):
+        """fn(*args) on a worker (or a thread in thread mode) -> (result, started, finished)"""
+        if not self.uses_processes:
+            return await asyncio.to_thread(_timed, fn, *args)
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._get_executor(), _timed, fn, *args)
+        except BrokenProcessPool:
+            # a worker died (OOM / native crash) - rebuild the pool and retry once
+            print("⚠️ Photo worker pool broken, restarting")
+            self._reset_executor()
+            return await loop.run_in_executor(self._get_executor(), _timed, fn, *args)
+
+    async def _job(self, photos: int, fn, *args):
+        """Reserve a slot, run fn(*args) on a worker and record queue wait / per-photo inference time"""
+        self._reserve(photos)
+        submitted_at = time.time()
+        try:
+            result, started, finished = await self._run(fn, *args)
+            with self._lock:
+                self.completed += photos
+                self._queue_waits.append(max(0.0, started - submitted_at))
+                self._inference_times.append((finished - started) / max(1, photos))
+            return result
+        except Exception:
+            with self._lock:
+                self.failed += photos
+            raise
+        finally:
+            with self._lock:
+                self._pending -= photos
+
+    async def analyze(self, image_bytes: bytes, face_hint: Optional[dict] = None, user_id=None):
+        """Run the pipeline off the event loop; raises PhotoQueueFull when saturated.
+        `face_hint` (face_emotion.parse_face_hint) lets a client face box skip detection.
+        Cached results are only reused for the same user, photo bytes and hint."""
+        photo_hash = await asyncio.to_thread(image_hash, image_bytes)
+        cached = photo_result_cache.get(cache_key(photo_hash, user_id, hint_variant(face_hint)))
+        if cached is not None:
+            return cached
+
+        if face_hint:
+            result = await self._job(1, run_hint_pipeline, image_bytes, face_hint)
+            with self._lock:
+                if result is not None:
+                    self.hints_used += 1
+                else:
+                    self.hints_rejected += 1
+            if result is not None:
+                photo_result_cache.put(cache_key(photo_hash, user_id, hint_variant(face_hint)), result)
+                return result
+            # rejected box - full detection, same as a request without a hint
+            cached = photo_result_cache.get(cache_key(photo_hash, user_id, "full"))
+            if cached is not None:
+                return cached
+
+        # the detector policy is only consulted (and counts the photo) when detection actually runs
+        result, attempts = await self._job(1, run_pipeline, image_bytes, detector_policy.plan())
+        detector_policy.record(attempts)
+        if result[4] != "decode_error":
+            photo_result_cache.put(cache_key(photo_hash, user_id, "full"), result)
+        return result
+
+    async def analyze_quick(self, image_bytes: bytes, face_hint: Optional[dict] = None, user_id=None):
+        """Coarse result in tens of milliseconds -> (result, final). `final` is True when the
+        photo cache already holds this user's full-pipeline result for the photo (what the
+        refinement would produce) or the image can't be decoded, and no refinement is needed.
+        Coarse results are never cached."""
+        photo_hash = await asyncio.to_thread(image_hash, image_bytes)
+        cached = photo_result_cache.get(cache_key(photo_hash, user_id, "full"))
+        if cached is not None:
+            return cached, True
+
+        with self._lock:
+            if self._quick_pending >= PHOTO_QUICK_MAX:
+                self.rejected += 1
+                raise PhotoQueueFull(f"{self._quick_pending} quick photo analyses in flight")
+            self._quick_pending += 1
+        try:
+            result = await asyncio.to_thread(run_quick_pipeline, image_bytes, face_hint)
+        finally:
+            with self._lock:
+                self._quick_pending -= 1
+                self.quick_jobs += 1
+        return result, result[4] == "decode_error"
+
+    async def analyze_batch(self, images, user_id=None):
+        """Several photos as one worker job (one emotion-model forward pass); photos this user
+        already sent through the batch path are answered without inference (batch results are
+        cached apart from analyze()'s). Returns results in input order, None for undecodable images."""
+        if len(images) > PHOTO_BATCH_MAX:
+            raise ValueError(f"at most {PHOTO_BATCH_MAX} photos per batch")
+        hashes = await asyncio.to_thread(lambda: [cache_key(image_hash(b), user_id, "batch") for b in images])
+        results = [photo_result_cache.get(h) for h in hashes]
+        todo = [i for i, r in enumerate(results) if r is None and hashes[i] is not None]
+        if not todo:
+            return results
+
+        batch_results = await self._job(len(todo), run_batch_pipeline, [images[i] for i in todo])
+        with self._lock:
+            self.batches += 1
+        for i, result in zip(todo, batch_results):
+            results[i] = result
+            if result is not None:
+                photo_result_cache.put(hashes[i], result)
+        return results
+
+    async def analyze_frames(self, frames=None, video: Optional[bytes] = None) -> dict:
+        """A burst of camera frames and/or a short clip as one worker job -> smoothed emotion
+        (frame_sequence.analyze_frames)"""
+        result = await self._job(1, run_frames_pipeline, frames, video)
+        with self._lock:
+            self.frame_jobs += 1
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = list(self._queue_waits)
+            times = list(self._inference_times)
+            pending = self._pending
+        busy = min(pending, max(1, self.workers))
+
+        def ms(v):
+            return round(v * 1000, 1) if v is not None else None
+
+        return {
+            "mode": "processes" if self.uses_processes else "thread",
+            "workers": self.workers,
+            "in_flight": busy,
+            "queued": pending - busy,
+            "queue_max": self.queue_max,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "restarts": self.restarts,
+            "batches": self.batches,
+            "batch_max": PHOTO_BATCH_MAX,
+            "frame_jobs": self.frame_jobs,
+            "quick_jobs": self.quick_jobs,
+            "quick_in_flight": self._quick_pending,
+            "quick_max": PHOTO_QUICK_MAX,
+            "face_hints": {"used": self.hints_used, "rejected": self.hints_rejected},
+            "queue_wait_ms": {"avg": ms(sum(waits) / len(waits)) if waits else None,
+                              "p95": ms(_percentile(waits, 95)), "max": ms(max(waits) if waits else None)},
+            "inference_ms": {"avg": ms(sum(times) / len(times)) if times else None,
+                             "p95": ms(_percentile(times, 95))},
+        }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+photo_pool = PhotoPool()
@@ -0,0 +1,184 @@
+"""
+Profile snapshot cache - a compact per-user profile (hobbies, pet, job,
+lifestyle ...) from user-service, summarised into a short prompt line.
+
+Chat never waits on user-service: a cached summary is served as-is and
+revalidated in the background (If-None-Match on the snapshot version) once
+it is older than PROFILE_SNAPSHOT_TTL_SECONDS.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import requests
+
+from prompts import estimate_tokens
+
+USER_SERVICE_URL = os.getenv("USER_SERVICE_URL", "http://localhost:8004")
+PROFILE_SNAPSHOT_TTL_SECONDS = float(os.getenv("PROFILE_SNAPSHOT_TTL_SECONDS", "300"))
+PROFILE_CACHE_MAX_USERS = int(os.getenv("PROFILE_CACHE_MAX_USERS", "5000"))
+PROFILE_SUMMARY_MAX_TOKENS = int(os.getenv("PROFILE_SUMMARY_MAX_TOKENS", "60"))
+PROFILE_FETCH_TIMEOUT_SECONDS = float(os.getenv("PROFILE_FETCH_TIMEOUT_SECONDS", "2"))
+# Shared with user-service; without it the snapshot endpoint refuses us, so profiles are skipped
+INTERNAL_SERVICE_TOKEN = os.getenv("INTERNAL_SERVICE_TOKEN", "")
+
+
+def _join(items, limit: int = 3) -> str:
+    return ", ".join(str(i) for i in list(items or [])[:limit])
+
+
+def summarize_profile(profile: dict, max_tokens: int = PROFILE_SUMMARY_MAX_TOKENS) -> str:
+    """Short 'About the user' line, most useful facts first, cut to the token budget"""
+    if not profile:
+        return ""
+    facts = []
+    if profile.get("job_title"):
+        job = f"works as {profile['job_title']}"
+        if profile.get("top_company"):
+            job += f" at {profile['top_company']}"
+        facts.append(job)
+    elif profile.get("is_student"):
+        facts.append("is a student")
+    if profile.get("hobbies"):
+        facts.append(f"enjoys {_join(profile['hobbies'])}")
+    if profile.get("pet_name"):
+        facts.append(f"has a pet named {profile['pet_name']}")
+    if profile.get("ambitions"):
+        facts.append(f"wants to {_join(profile['ambitions'], 2)}")
+    lifestyle = profile.get("lifestyle") or {}
+    if isinstance(lifestyle, dict) and lifestyle:
+        habits = []
+        if lifestyle.get("sleep"):
+            habits.append(f"sleeps ~{lifestyle['sleep']}h")
+        if lifestyle.get("exercise"):
+            habits.append(f"exercises {lifestyle['exercise']} min/day")
+        if lifestyle.get("diet"):
+            habits.append(f"{lifestyle['diet']} diet")
+        if habits:
+            facts.append(", ".join(habits))
+    if profile.get("relationship_status") and profile["relationship_status"] != "single":
+        facts.append(str(profile["relationship_status"]))
+    if profile.get("age"):
+        facts.append(f"age {profile['age']}")
+    if profile.get("city"):
+        facts.append(f"lives in {profile['city']}")
+    if profile.get("favorite_songs"):
+        facts.append(f"likes the songs {_join(profile['favorite_songs'], 2)}")
+
+    summary = ""
+    for fact in facts:
+        candidate = f"{summary}; {fact}" if summary else f"The user {fact}"
+        if estimate_tokens(candidate) > max_tokens:
+            break
+        summary = candidate
+    return summary + "." if summary else ""
+
+
+def fetch_profile_snapshot(user_id: int, version: Optional[str] = None) -> Tuple[int, Optional[dict]]:
+    """Conditional GET of the user-service snapshot: (304, None) when `version` is still current.
+    With no INTERNAL_SERVICE_TOKEN configured the profile is treated as empty (no request made)."""
+    if not INTERNAL_SERVICE_TOKEN:
+        return 200, {"version": None, "profile": {}}
+    headers = {"X-Service-Token": INTERNAL_SERVICE_TOKEN}
+    if version:
+        headers["If-None-Match"] = f'"{version}"'
+    resp = requests.get(f"{USER_SERVICE_URL}/api/profile/{user_id}/snapshot",
+                        headers=headers, timeout=PROFILE_FETCH_TIMEOUT_SECONDS)
+    if resp.status_code == 304:
+        return 304, None
+    resp.raise_for_status()
+    return resp.status_code, resp.json()
+
+
+class ProfileSnapshotCache:
+    """LRU of user_id -> {version, summary, checked_at}"""
+
+    def __init__(self, ttl_seconds: float = PROFILE_SNAPSHOT_TTL_SECONDS,
+                 max_users: int = PROFILE_CACHE_MAX_USERS, fetcher=fetch_profile_snapshot):
+        self.ttl = ttl_seconds
+        self.max_users = max_users
+        self.fetcher = fetcher
+        self._entries: "OrderedDict[int, dict]" = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self.not_modified = 0
+        self.errors = 0
+
+    def get(self, user_id: int) -> Tuple[Optional[str], bool]:
+        """(summary or None, needs_refresh) - never does I/O"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None, user_id not in self._refreshing
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            stale = time.time() - entry["checked_at"] > self.ttl
+            return entry["summary"] or None, stale and user_id not in self._refreshing
+
+    def is_fresh(self, user_id: int) -> bool:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            return entry is not None and time.time() - entry["checked_at"] <= self.ttl
+
+    def refresh(self, user_id: int):
+        """Revalidate one user's snapshot against user-service (blocking - run off the event loop)"""
+        with self._lock:
+            if user_id in self._refreshing:
+                return
+            self._refreshing.add(user_id)
+            entry = self._entries.get(user_id)
+            version = entry["version"] if entry else None
+        try:
+            status, data = self.fetcher(user_id, version)
+            with self._lock:
+                self.fetches += 1
+                if status == 304 and entry is not None:
+                    self.not_modified += 1
+                    entry["checked_at"] = time.time()
+                    return
+                self._entries[user_id] = {
+                    "version": (data or {}).get("version"),
+                    "summary": summarize_profile((data or {}).get("profile") or {}),
+                    "checked_at": time.time(),
+                }
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_users:
+                    self._entries.popitem(last=False)
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+                if entry is not None:
+                    # keep serving the old summary; try again after another TTL
+                    entry["checked_at"] = time.time()
+            print(f"⚠️ Profile snapshot fetch failed for user_id={user_id}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(user_id)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "users": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else None,
+                "fetches": self.fetches,
+                "not_modified": self.not_modified,
+                "errors": self.errors,
+                "ttl_s": self.ttl,
+                "summary_max_tokens": PROFILE_SUMMARY_MAX_TOKENS,
+            }
+
+
+profile_cache = ProfileSnapshotCache()
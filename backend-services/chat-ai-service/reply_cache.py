@@ -0,0 +1,133 @@
+"""
+Reply cache - serves stored LLM replies for repeated short messages
+(greetings, check-ins) so they don't each cost a Groq completion.
+
+Crisis messages are never cached: anything the safety.py keyword matcher
+flags bypasses the cache, so there is one self-harm word list to maintain.
+
+A cacheable message is answered from an impersonal prompt (language, mood and
+trend context only - no conversation turns or profile), and the key is that
+prompt's digest, so returning users' greetings are shared too.
+"""
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from safety import safety_matcher
+
+REPLY_CACHE_ENABLED = os.getenv("REPLY_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+REPLY_CACHE_TTL_SECONDS = int(os.getenv("REPLY_CACHE_TTL_SECONDS", "1800"))
+REPLY_CACHE_MAX_ENTRIES = int(os.getenv("REPLY_CACHE_MAX_ENTRIES", "2000"))
+# Number of distinct LLM replies collected per key before the cache starts serving
+REPLY_CACHE_VARIANTS = int(os.getenv("REPLY_CACHE_VARIANTS", "3"))
+# Only short messages are worth caching - longer ones are almost never repeated
+REPLY_CACHE_MAX_WORDS = int(os.getenv("REPLY_CACHE_MAX_WORDS", "6"))
+
+_PUNCT_RE = re.compile(r"[^\w\s\u0D80-\u0DFF\u200D]", re.UNICODE)
+_REPEAT_RE = re.compile(r"(.)\1{2,}")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def mentions_distress(text: str) -> bool:
+    """True for a crisis message (safety keyword match) - never served from the cache"""
+    return safety_matcher.match(text) is not None
+
+
+def normalize_message(text: str) -> str:
+    """Lowercase, strip punctuation/emojis and squeeze repeats ("Hiiii!!" -> "hii")"""
+    if not text:
+        return ""
+    t = text.lower().strip()
+    t = _PUNCT_RE.sub(" ", t)
+    t = _REPEAT_RE.sub(r"\1\1", t)
+    return _SPACE_RE.sub(" ", t).strip()
+
+
+class ReplyCache:
+    """LRU + TTL cache of (normalized message, prompt digest) -> reply variants"""
+
+    def __init__(self, ttl_seconds: int = REPLY_CACHE_TTL_SECONDS, max_entries: int = REPLY_CACHE_MAX_ENTRIES,
+                 variants: int = REPLY_CACHE_VARIANTS, max_words: int = REPLY_CACHE_MAX_WORDS):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.variants = max(1, variants)
+        self.max_words = max_words
+        self._entries: "OrderedDict[tuple, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+
+    def make_key(self, message: str, prompt: str = "") -> Optional[tuple]:
+        """Return the cache key for a message answered under `prompt`, or None if it is not cacheable.
+        The prompt must be impersonal (no history / profile) - every user with the same one shares the key."""
+        if mentions_distress(message):
+            return None
+        norm = normalize_message(message)
+        if not norm or len(norm.split(" ")) > self.max_words:
+            return None
+        return (norm, hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16])
+
+    def get(self, key: Optional[tuple]) -> Optional[dict]:
+        """Return the next reply variant for `key` once enough variants are collected"""
+        if key is None:
+            self.bypassed += 1
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and (time.time() - entry["created_at"]) > self.ttl_seconds:
+                self._entries.pop(key, None)
+                entry = None
+            if not entry or entry["samples"] < self.variants:
+                # still collecting variants - let the LLM answer
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            reply = entry["replies"][entry["next"] % len(entry["replies"])]
+            entry["next"] += 1
+            self.hits += 1
+            return dict(reply)
+
+    def put(self, key: Optional[tuple], reply: str, emotion: str):
+        """Record an LLM reply as a variant for `key`"""
+        if key is None or not reply:
+            return
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (time.time() - entry["created_at"]) > self.ttl_seconds:
+                entry = {"created_at": time.time(), "replies": [], "samples": 0, "next": 0}
+                self._entries[key] = entry
+            entry["samples"] += 1
+            if len(entry["replies"]) < self.variants and all(r["reply"] != reply for r in entry["replies"]):
+                entry["replies"].append({"reply": reply, "emotion": emotion})
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": REPLY_CACHE_ENABLED,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "variants_per_key": self.variants,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+reply_cache = ReplyCache()
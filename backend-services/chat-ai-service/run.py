@@ -0,0 +1,17 @@
+"""
+Chat AI service entrypoint - `python run.py` (or `uvicorn main:app`).
+
+Photo workers are spawned processes, and a spawned process re-imports the
+script that launched the parent. Launched as `python main.py`, every worker
+would repeat the API's startup (Groq / Supabase clients, classifier
+training, task store, app); this script is all they re-import, so a worker
+loads only photo_pool / face_emotion.
+"""
+import os
+
+if __name__ == "__main__":
+    import uvicorn
+    # Default to 8003 so it matches test_user_mood.py / API gateway expectations;
+    # allow override via PORT or CHAT_AI_PORT environment variables.
+    port = int(os.getenv("PORT", os.getenv("CHAT_AI_PORT", "8003")))
+    uvicorn.run("main:app", host="0.0.0.0", port=port)
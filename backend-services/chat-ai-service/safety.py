@@ -0,0 +1,166 @@
+"""
+Safety fast path - precompiled Aho-Corasick matcher over the self-harm
+keyword lists (English / Singlish / Sinhala). Runs before any LLM call so
+crisis messages get the helpline reply immediately.
+"""
+import os
+import json
+import time
+import threading
+from collections import deque
+from typing import Optional
+
+SAFETY_KEYWORDS_PATH = os.getenv(
+    "SAFETY_KEYWORDS_PATH",
+    os.path.join(os.path.dirname(__file__), "safety_keywords.json")
+)
+# How often (seconds) the keyword file's mtime is checked for hot reload
+SAFETY_RELOAD_CHECK_SECONDS = float(os.getenv("SAFETY_RELOAD_CHECK_SECONDS", "30"))
+
+# Language preference when a message matches several lists
+_LANG_PRIORITY = ("sinhala", "singlish", "english")
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isascii() and ch.isalnum()
+
+
+class AhoCorasick:
+    """Multi-pattern matcher: one pass over the text regardless of keyword count"""
+
+    def __init__(self, patterns):
+        # patterns: iterable of (keyword, label)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for keyword, label in patterns:
+            self._add(keyword.lower(), label)
+        self._build()
+
+    def _add(self, keyword: str, label: str):
+        if not keyword:
+            return
+        node = 0
+        for ch in keyword:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((keyword, label))
+
+    def _build(self):
+        queue = deque()
+        for child in self._goto[0].values():
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[child] = self._goto[f].get(ch, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def iter_matches(self, text: str):
+        """Yield (start, end, keyword, label) for every occurrence in `text`"""
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for keyword, label in self._out[node]:
+                yield i - len(keyword) + 1, i + 1, keyword, label
+
+
+class SafetyMatcher:
+    """Hot-reloadable self-harm keyword matcher backed by safety_keywords.json"""
+
+    def __init__(self, path: str = SAFETY_KEYWORDS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._automaton = AhoCorasick([])
+        self._replies = {}
+        self.emotion = "Sad"
+        self.keyword_count = 0
+        self.loaded_at = None
+        self._mtime = None
+        self._last_check = 0.0
+        self.matches = 0
+        self.reload()
+
+    def reload(self) -> bool:
+        """(Re)build the automaton from the keyword file; keeps the old one on error"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                config = json.load(f)
+            patterns = []
+            for lang, words in (config.get("keywords") or {}).items():
+                for w in words:
+                    patterns.append((w.strip(), lang))
+            automaton = AhoCorasick(patterns)
+            with self._lock:
+                self._automaton = automaton
+                self._replies = config.get("replies") or {}
+                self.emotion = config.get("emotion", "Sad")
+                self.keyword_count = len(patterns)
+                self._mtime = os.path.getmtime(self.path)
+                self.loaded_at = time.time()
+            print(f"✅ Safety keywords loaded: {len(patterns)} patterns from {self.path}")
+            return True
+        except Exception as e:
+            print(f"⚠️ Failed to load safety keywords from {self.path}: {e}")
+            return False
+
+    def _maybe_reload(self):
+        now = time.time()
+        if now - self._last_check < SAFETY_RELOAD_CHECK_SECONDS:
+            return
+        self._last_check = now
+        try:
+            if os.path.getmtime(self.path) != self._mtime:
+                self.reload()
+        except OSError:
+            pass
+
+    def match(self, message: str) -> Optional[dict]:
+        """Return {"keyword", "language", "reply", "emotion"} if the message is a crisis message"""
+        if not message:
+            return None
+        self._maybe_reload()
+        text = message.lower().replace("\u2019", "'")
+        automaton = self._automaton
+        found = {}
+        for start, end, keyword, lang in automaton.iter_matches(text):
+            # Latin keywords must sit on word boundaries ("die" must not match "diet")
+            if _is_word_char(keyword[0]) and start > 0 and _is_word_char(text[start - 1]):
+                continue
+            if _is_word_char(keyword[-1]) and end < len(text) and _is_word_char(text[end]):
+                continue
+            found.setdefault(lang, keyword)
+        if not found:
+            return None
+        lang = next((l for l in _LANG_PRIORITY if l in found), next(iter(found)))
+        self.matches += 1
+        return {
+            "keyword": found[lang],
+            "language": lang,
+            "reply": self._replies.get(lang) or self._replies.get("english", ""),
+            "emotion": self.emotion,
+        }
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "keywords": self.keyword_count,
+            "languages": sorted(self._replies.keys()),
+            "loaded_at": self.loaded_at,
+            "matches": self.matches,
+        }
+
+
+safety_matcher = SafetyMatcher()
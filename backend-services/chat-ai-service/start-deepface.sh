@@ -20,14 +20,15 @@ fi
 
 # Kill existing service
 echo "🛑 Stopping existing service..."
-pkill -f "chat-ai-service/main.py"
+pkill -f "chat-ai-service/(main|run).py"
 sleep 2
 
 # Start service with deepface environment
 echo "✅ Starting service on port 8002..."
 cd "$SERVICE_DIR"
 source "$DEEPFACE_ENV/bin/activate"
-python main.py > /tmp/chat-service.log 2>&1 &
+# run.py, not main.py: photo workers re-import the launch script (see run.py)
+python run.py > /tmp/chat-service.log 2>&1 &
 
 sleep 3
 
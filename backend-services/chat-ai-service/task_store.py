@@ -0,0 +1,344 @@
+"""
+Background photo tasks (`/analyze-photo-emotion?background=true`) - a
+bounded SQLite task table that doubles as the work queue.
+
+Every uvicorn worker on the host opens the same database file, so a status
+request can land on any process, queued photos survive a restart, and the
+PHOTO_TASK_WORKERS consumers in each process claim tasks atomically.
+Finished tasks are evicted after PHOTO_TASK_TTL_SECONDS and the table never
+holds more than PHOTO_TASK_MAX_TASKS rows (oldest finished tasks go first;
+new tasks are refused once it's full of unfinished ones).
+
+Clients don't have to poll: `PhotoTaskWorkers.wait_for_change` wakes as soon
+as a consumer in this process updates the task (tasks handled by another
+process are noticed within PHOTO_TASK_WATCH_POLL_SECONDS), which backs the
+long-poll status request and the SSE stream.
+
+Each task has a `kind` telling the handler what to do with the photo:
+"photo" (analyze + save) or "photo_chat" (the refined second phase of a
+two-phase /api/photo-emotion-chat request).
+
+A handler that answers "retry" (the photo pool was full) puts the task back
+in the queue with exponential backoff. Every claim counts as an attempt;
+after PHOTO_TASK_MAX_ATTEMPTS a busy task, or one whose process keeps dying
+mid-analysis (a photo that crashes the worker), ends as an error instead of
+being requeued forever.
+
+The database lives in the runtime data dir (SOULBUDDY_DATA_DIR, default
+~/.soulbuddy), not the source tree - it holds users' photos.
+"""
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import threading
+from datetime import datetime
+from typing import Optional
+
+DATA_DIR = os.getenv("SOULBUDDY_DATA_DIR") or os.path.join(os.path.expanduser("~"), ".soulbuddy")
+PHOTO_TASK_DB = os.getenv("PHOTO_TASK_DB") or os.path.join(DATA_DIR, "photo_tasks.db")
+PHOTO_TASK_TTL_SECONDS = float(os.getenv("PHOTO_TASK_TTL_SECONDS", "3600"))
+PHOTO_TASK_MAX_TASKS = int(os.getenv("PHOTO_TASK_MAX_TASKS", "5000"))
+PHOTO_TASK_WORKERS = int(os.getenv("PHOTO_TASK_WORKERS", "2"))
+# a task left 'processing' this long (its process died) goes back to the queue
+PHOTO_TASK_STALE_SECONDS = float(os.getenv("PHOTO_TASK_STALE_SECONDS", "300"))
+# claims per task before it is given up (busy retries and stale requeues both count)
+PHOTO_TASK_MAX_ATTEMPTS = int(os.getenv("PHOTO_TASK_MAX_ATTEMPTS", "5"))
+# backoff before a busy task is tried again: base * 2^(attempt-1), capped
+PHOTO_TASK_RETRY_BASE_SECONDS = float(os.getenv("PHOTO_TASK_RETRY_BASE_SECONDS", "2"))
+PHOTO_TASK_RETRY_MAX_SECONDS = float(os.getenv("PHOTO_TASK_RETRY_MAX_SECONDS", "30"))
+# how often idle consumers look for tasks queued by other processes
+PHOTO_TASK_POLL_SECONDS = float(os.getenv("PHOTO_TASK_POLL_SECONDS", "1"))
+# how often a waiting client re-reads a task that another process may be handling
+PHOTO_TASK_WATCH_POLL_SECONDS = float(os.getenv("PHOTO_TASK_WATCH_POLL_SECONDS", "0.5"))
+
+FINISHED_STATUSES = ("done", "error")
+
+
+class TaskStoreFull(Exception):
+    """PHOTO_TASK_MAX_TASKS unfinished tasks already stored"""
+
+
+class PhotoTaskStore:
+    def __init__(self, path: str = PHOTO_TASK_DB, ttl_seconds: float = PHOTO_TASK_TTL_SECONDS,
+                 max_tasks: int = PHOTO_TASK_MAX_TASKS):
+        self.path = path
+        self.ttl = ttl_seconds
+        self.max_tasks = max_tasks
+        self._lock = threading.Lock()
+        self._conn = None
+        self.created = 0
+        self.rejected = 0
+        self.evicted = 0
+        self.requeued = 0
+        self.retried = 0
+        self.abandoned = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS photo_tasks (
+                    task_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    user_id INTEGER,
+                    created_at TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    result TEXT,
+                    image BLOB,
+                    kind TEXT NOT NULL DEFAULT 'photo',
+                    attempts INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            # databases created before task kinds / attempt counts existed
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(photo_tasks)")}
+            if "kind" not in columns:
+                conn.execute("ALTER TABLE photo_tasks ADD COLUMN kind TEXT NOT NULL DEFAULT 'photo'")
+            if "attempts" not in columns:
+                conn.execute("ALTER TABLE photo_tasks ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS photo_tasks_status ON photo_tasks (status, updated_at)")
+            self._conn = conn
+        return self._conn
+
+    def _evict(self, db: sqlite3.Connection):
+        """Drop expired finished tasks, then the oldest finished ones while over max_tasks"""
+        placeholders = ",".join("?" * len(FINISHED_STATUSES))
+        cur = db.execute(f"DELETE FROM photo_tasks WHERE status IN ({placeholders}) AND updated_at < ?",
+                         (*FINISHED_STATUSES, time.time() - self.ttl))
+        self.evicted += cur.rowcount
+        over = db.execute("SELECT COUNT(*) FROM photo_tasks").fetchone()[0] - self.max_tasks + 1
+        if over > 0:
+            cur = db.execute(f"""
+                DELETE FROM photo_tasks WHERE task_id IN (
+                    SELECT task_id FROM photo_tasks WHERE status IN ({placeholders})
+                    ORDER BY updated_at LIMIT ?)
+            """, (*FINISHED_STATUSES, over))
+            self.evicted += cur.rowcount
+
+    def create(self, task_id: str, user_id: int, image_bytes: bytes, kind: str = "photo",
+               result: Optional[dict] = None) -> dict:
+        """Store a queued task with its photo (and an optional provisional result); raises TaskStoreFull"""
+        created_at = datetime.utcnow().isoformat()
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                self._evict(db)
+                if db.execute("SELECT COUNT(*) FROM photo_tasks").fetchone()[0] >= self.max_tasks:
+                    self.rejected += 1
+                    raise TaskStoreFull(f"{self.max_tasks} photo tasks pending")
+                db.execute("INSERT INTO photo_tasks (task_id, status, user_id, created_at, updated_at, image, kind, result) "
+                           "VALUES (?, 'queued', ?, ?, ?, ?, ?, ?)",
+                           (task_id, user_id, created_at, time.time(), sqlite3.Binary(image_bytes), kind,
+                            json.dumps(result) if result is not None else None))
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+            self.created += 1
+        return {"status": "queued", "created_at": created_at, "user_id": user_id, "kind": kind, "result": result}
+
+    def get(self, task_id: str) -> Optional[dict]:
+        """{status, created_at, user_id, kind, result} or None (unknown / expired)"""
+        with self._lock:
+            row = self._db().execute(
+                "SELECT status, created_at, user_id, result, updated_at, kind FROM photo_tasks WHERE task_id = ?",
+                (task_id,)).fetchone()
+        if row is None:
+            return None
+        status, created_at, user_id, result, updated_at, kind = row
+        if status in FINISHED_STATUSES and time.time() - updated_at > self.ttl:
+            return None
+        return {"status": status, "created_at": created_at, "user_id": user_id, "kind": kind,
+                "result": json.loads(result) if result else None}
+
+    def claim(self) -> Optional[tuple]:
+        """Oldest due queued task -> (task_id, user_id, image_bytes, kind, attempt), marked 'processing';
+        None if nothing is due. `attempt` counts this claim (1 = first try)."""
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                # tasks whose process died mid-analysis go back to the front of the queue -
+                # unless they already had every attempt (the photo itself may be what kills the worker)
+                stale = now - PHOTO_TASK_STALE_SECONDS
+                cur = db.execute("UPDATE photo_tasks SET status = 'error', result = ?, updated_at = ?, image = NULL "
+                                 "WHERE status = 'processing' AND updated_at < ? AND attempts >= ?",
+                                 (json.dumps({"error": "Photo analysis failed repeatedly", "reason": "max_attempts"}),
+                                  now, stale, PHOTO_TASK_MAX_ATTEMPTS))
+                self.abandoned += cur.rowcount
+                cur = db.execute("UPDATE photo_tasks SET status = 'queued' WHERE status = 'processing' "
+                                 "AND updated_at < ? AND image IS NOT NULL", (stale,))
+                self.requeued += cur.rowcount
+                # a queued task's updated_at is when it becomes due (later than now while backing off)
+                row = db.execute("SELECT task_id, user_id, image, kind, attempts FROM photo_tasks "
+                                 "WHERE status = 'queued' AND updated_at <= ? ORDER BY updated_at LIMIT 1",
+                                 (now,)).fetchone()
+                if row is not None:
+                    db.execute("UPDATE photo_tasks SET status = 'processing', updated_at = ?, attempts = attempts + 1 "
+                               "WHERE task_id = ?", (now, row[0]))
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return row[0], row[1], bytes(row[2]) if row[2] is not None else b"", row[3], row[4] + 1
+
+    def requeue(self, task_id: str, delay_seconds: float):
+        """Put a claimed task back in the queue, due again in `delay_seconds` (keeps its photo)"""
+        with self._lock:
+            self._db().execute("UPDATE photo_tasks SET status = 'queued', updated_at = ? "
+                               "WHERE task_id = ? AND status = 'processing'", (time.time() + delay_seconds, task_id))
+            self.retried += 1
+
+    def finish(self, task_id: str, status: str, result: dict):
+        """Record the outcome and drop the stored photo"""
+        with self._lock:
+            self._db().execute("UPDATE photo_tasks SET status = ?, result = ?, updated_at = ?, image = NULL "
+                               "WHERE task_id = ?", (status, json.dumps(result), time.time(), task_id))
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._db().execute("SELECT status, COUNT(*) FROM photo_tasks GROUP BY status").fetchall())
+        return {
+            "db": self.path,
+            "tasks": counts,
+            "max_tasks": self.max_tasks,
+            "ttl_s": self.ttl,
+            "created": self.created,
+            "rejected": self.rejected,
+            "evicted": self.evicted,
+            "requeued": self.requeued,
+            "retried": self.retried,
+            "abandoned": self.abandoned,
+            "max_attempts": PHOTO_TASK_MAX_ATTEMPTS,
+        }
+
+
+class PhotoTaskWorkers:
+    """PHOTO_TASK_WORKERS asyncio consumers per process draining the task table.
+
+    handler(task_id, image_bytes, user_id, kind, attempt) -> (status, result) does the actual work;
+    status "retry" requeues the task with backoff while it has attempts left (`attempt` is 1-based,
+    so a handler can tell its last try: attempt >= PHOTO_TASK_MAX_ATTEMPTS).
+    """
+
+    def __init__(self, store: PhotoTaskStore, workers: int = PHOTO_TASK_WORKERS):
+        self.store = store
+        self.workers = workers
+        self._handler = None
+        self._tasks = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._watchers = {}  # task_id -> set of asyncio.Event
+        self.processed = 0
+        self.failed = 0
+
+    def start(self, handler):
+        self._handler = handler
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._consume(n)) for n in range(self.workers)]
+        print(f"✅ {self.workers} photo task workers started (store: {self.store.path})")
+
+    def notify(self):
+        """A task was queued in this process - wake an idle consumer now instead of at the next poll"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _publish(self, task_id: str):
+        for event in list(self._watchers.get(task_id, ())):
+            event.set()
+
+    async def wait_for_change(self, task_id: str, seen_status: Optional[str], timeout: float) -> Optional[dict]:
+        """Current task once its status differs from `seen_status` (or after `timeout` seconds)"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + max(0.0, timeout)
+        while True:
+            item = await asyncio.to_thread(self.store.get, task_id)
+            remaining = deadline - loop.time()
+            if item is None or item["status"] != seen_status or remaining <= 0:
+                return item
+            event = asyncio.Event()
+            self._watchers.setdefault(task_id, set()).add(event)
+            try:
+                await asyncio.wait_for(event.wait(), timeout=min(remaining, PHOTO_TASK_WATCH_POLL_SECONDS))
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                watchers = self._watchers.get(task_id)
+                if watchers is not None:
+                    watchers.discard(event)
+                    if not watchers:
+                        self._watchers.pop(task_id, None)
+
+    async def wait_until_finished(self, task_id: str, timeout: float) -> Optional[dict]:
+        """Long-poll: the task as soon as it is done / error, or as it is when `timeout` runs out"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + max(0.0, timeout)
+        item = await asyncio.to_thread(self.store.get, task_id)
+        while item is not None and item["status"] not in FINISHED_STATUSES:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            item = await self.wait_for_change(task_id, item["status"], remaining)
+        return item
+
+    async def _consume(self, worker_no: int):
+        while True:
+            try:
+                claimed = await asyncio.to_thread(self.store.claim)
+            except Exception as e:
+                print(f"⚠️ photo task worker {worker_no}: claim failed: {e}")
+                claimed = None
+            if claimed is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=PHOTO_TASK_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            task_id, user_id, image_bytes, kind, attempt = claimed
+            self._publish(task_id)
+            try:
+                status, result = await self._handler(task_id, image_bytes, user_id, kind, attempt)
+                self.processed += 1
+            except Exception as e:
+                print(f"❌ [task:{task_id}] worker {worker_no} failed: {e}")
+                status, result = "error", {"error": str(e)}
+                self.failed += 1
+            if status == "retry":
+                if attempt < PHOTO_TASK_MAX_ATTEMPTS:
+                    delay = min(PHOTO_TASK_RETRY_MAX_SECONDS, PHOTO_TASK_RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+                    print(f"🔁 [task:{task_id}] retrying in {delay:.0f}s (attempt {attempt}/{PHOTO_TASK_MAX_ATTEMPTS})")
+                    try:
+                        await asyncio.to_thread(self.store.requeue, task_id, delay)
+                    except Exception as e:
+                        print(f"❌ [task:{task_id}] could not requeue: {e}")
+                    self._publish(task_id)
+                    continue
+                status = "error"
+            try:
+                await asyncio.to_thread(self.store.finish, task_id, status, result)
+            except Exception as e:
+                print(f"❌ [task:{task_id}] could not store result: {e}")
+            self._publish(task_id)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "running": len(self._tasks), "watched_tasks": len(self._watchers),
+                "processed": self.processed, "failed": self.failed, **self.store.stats()}
+
+
+photo_task_store = PhotoTaskStore()
+photo_task_workers = PhotoTaskWorkers(photo_task_store)
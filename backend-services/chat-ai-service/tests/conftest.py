@@ -0,0 +1,9 @@
+"""
+Unit tests for the chat-ai-service helper modules (no Groq, Supabase or DeepFace needed).
+
+Run from backend-services/chat-ai-service:  python -m pytest -q tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
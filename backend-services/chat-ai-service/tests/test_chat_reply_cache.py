@@ -0,0 +1,65 @@
+import types
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from conversation import ConversationStore
+from reply_cache import ReplyCache
+
+REPLY = '{"reply": "Hey! 😊 How is your day going?", "emotion": "Happy"}'
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.calls = []
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        message = types.SimpleNamespace(content=REPLY)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+
+@pytest.fixture
+def chat(monkeypatch):
+    completions = FakeCompletions()
+    monkeypatch.setattr(main, "groq_client", types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions)))
+    monkeypatch.setattr(main, "REPLY_CACHE_ENABLED", True)
+    monkeypatch.setattr(main, "reply_cache", ReplyCache(variants=1))
+    monkeypatch.setattr(main, "load_mood_context", lambda user_id: (None, None))
+    monkeypatch.setattr(main, "fetch_recent_chat_turns", lambda user_id, limit: [])
+    monkeypatch.setattr(main.profile_cache, "get", lambda user_id: ("Name: Ann. Likes cricket.", False))
+    monkeypatch.setattr(main, "_persist_chat_turn", lambda *args: None)
+    monkeypatch.setattr(main, "save_mood_to_database", lambda *args, **kwargs: None)
+    monkeypatch.setattr(main, "save_chat_to_database", lambda *args, **kwargs: None)
+    monkeypatch.setattr(main, "conversation_store", ConversationStore())
+    return TestClient(main.app), completions
+
+
+def test_returning_users_greeting_is_served_from_the_cache(chat):
+    client, completions = chat
+    main.conversation_store.ensure_loaded(41, lambda user_id, limit: [])
+    main.conversation_store.record_turn(41, "my exam went badly", "Oh no, I'm sorry Ann", "Sad")
+
+    first = client.post("/api/v1/chat", json={"message": "hi", "user_id": 41}).json()
+    assert len(completions.calls) == 1
+    # the shared reply was built without the user's turns or profile
+    sent = completions.calls[0]["messages"]
+    assert len(sent) == 2
+    assert "Ann" not in sent[0]["content"]
+
+    second = client.post("/api/v1/chat", json={"message": "Hi!", "user_id": 42}).json()
+    third = client.post("/api/v1/chat", json={"message": "hi", "user_id": 41}).json()
+    assert len(completions.calls) == 1
+    assert first["reply"] == second["reply"] == third["reply"] == "Hey! 😊 How is your day going?"
+    assert main.reply_cache.stats()["hits"] == 2
+
+
+def test_longer_messages_keep_history_and_profile(chat):
+    client, completions = chat
+    main.conversation_store.ensure_loaded(43, lambda user_id, limit: [])
+    main.conversation_store.record_turn(43, "my exam went badly", "Oh no, I'm sorry Ann", "Sad")
+    client.post("/api/v1/chat", json={"message": "I am still thinking about that exam today", "user_id": 43})
+    sent = completions.calls[0]["messages"]
+    assert "Ann" in sent[0]["content"]
+    assert any(m["content"] == "my exam went badly" for m in sent[1:])
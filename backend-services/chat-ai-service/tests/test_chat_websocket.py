@@ -0,0 +1,110 @@
+import types
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from chat_sessions import SessionRegistry
+from conversation import ConversationStore
+from reply_cache import ReplyCache
+
+PIECES = ['{"re', 'ply": "Hey ', 'there! 😊 How', ' was your day?"', ', "emotion": "Happy"}']
+
+
+class StreamingCompletions:
+    def __init__(self):
+        self.calls = []
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        assert kwargs["stream"] is True
+        return iter(types.SimpleNamespace(choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content=p))])
+                    for p in PIECES)
+
+
+@pytest.fixture
+def ws_chat(monkeypatch):
+    completions = StreamingCompletions()
+    persisted = []
+    monkeypatch.setattr(main, "groq_client", types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions)))
+    monkeypatch.setattr(main, "REPLY_CACHE_ENABLED", False)
+    monkeypatch.setattr(main, "reply_cache", ReplyCache())
+    monkeypatch.setattr(main, "load_mood_context", lambda user_id: ("Sad", {"current_mood": "Sad"}))
+    monkeypatch.setattr(main, "fetch_recent_chat_turns", lambda user_id, limit: [])
+    monkeypatch.setattr(main.profile_cache, "get", lambda user_id: (None, False))
+    monkeypatch.setattr(main, "_persist_chat_turn", lambda *args: persisted.append(args))
+    monkeypatch.setattr(main, "_persist_safety_event", lambda *args: persisted.append(args))
+    monkeypatch.setattr(main, "conversation_store", ConversationStore())
+    monkeypatch.setattr(main, "chat_sessions", SessionRegistry())
+    return TestClient(main.app), completions, persisted
+
+
+def test_session_streams_only_the_reply_text(ws_chat):
+    client, completions, persisted = ws_chat
+    with client.websocket_connect("/api/v1/chat/ws?user_id=12") as ws:
+        ready = ws.receive_json()
+        assert ready == {"type": "ready", "user_id": 12, "user_mood": "Sad", "history_turns": 0}
+        assert main.chat_sessions.stats()["open_sessions"] == 1
+
+        ws.send_json({"type": "message", "message": "I had a long day at work"})
+        deltas = []
+        frame = ws.receive_json()
+        while frame["type"] == "delta":
+            deltas.append(frame["text"])
+            frame = ws.receive_json()
+        assert "".join(deltas) == "Hey there! 😊 How was your day?"
+        assert frame["type"] == "reply"
+        assert frame["reply"] == "Hey there! 😊 How was your day?"
+        assert frame["emotion"] == "Happy"
+        assert frame["user_mood"] == "Sad"
+
+        ws.send_json({"type": "ping"})
+        assert ws.receive_json() == {"type": "pong"}
+    assert len(completions.calls) == 1
+    assert persisted[0][:2] == (12, "I had a long day at work")
+    assert main.chat_sessions.stats()["open_sessions"] == 0
+
+
+def test_session_keeps_the_mood_current_without_a_reload(ws_chat):
+    client, completions, _ = ws_chat
+    with client.websocket_connect("/api/v1/chat/ws?user_id=12") as ws:
+        ws.receive_json()
+        main.chat_sessions.publish_mood(12, "Happy", "photo")
+        ws.send_text("plain text frames are messages too")
+        frame = ws.receive_json()
+        while frame["type"] == "delta":
+            frame = ws.receive_json()
+        assert frame["user_mood"] == "Happy"
+    assert main.chat_sessions.stats()["mood_updates"] == 1
+
+
+def test_bad_frames_get_errors_and_the_session_stays_open(ws_chat):
+    client, completions, _ = ws_chat
+    with client.websocket_connect("/api/v1/chat/ws") as ws:
+        assert ws.receive_json()["user_id"] is None
+        ws.send_json({"type": "typing"})
+        assert ws.receive_json() == {"type": "error", "detail": "Unknown frame type: typing"}
+        ws.send_json({"type": "message", "message": "   "})
+        assert ws.receive_json() == {"type": "error", "detail": "Message cannot be empty"}
+        ws.send_json({"type": "ping"})
+        assert ws.receive_json() == {"type": "pong"}
+    assert completions.calls == []
+
+
+def test_crisis_messages_skip_the_llm(ws_chat):
+    client, completions, persisted = ws_chat
+    with client.websocket_connect("/api/v1/chat/ws?user_id=12") as ws:
+        ws.receive_json()
+        ws.send_json({"type": "message", "message": "i want to die"})
+        frame = ws.receive_json()
+        assert frame["type"] == "reply"
+        assert "1926" in frame["reply"]
+    assert completions.calls == []
+    assert persisted[0][:2] == (12, "i want to die")
+
+
+def test_missing_groq_key_closes_the_session(ws_chat, monkeypatch):
+    client, _, _ = ws_chat
+    monkeypatch.setattr(main, "groq_client", None)
+    with client.websocket_connect("/api/v1/chat/ws") as ws:
+        assert ws.receive_json()["type"] == "error"
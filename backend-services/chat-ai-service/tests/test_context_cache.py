@@ -0,0 +1,49 @@
+import time
+
+from context_cache import MoodContextCache
+
+
+def test_hits_misses_and_ttl():
+    cache = MoodContextCache(ttl_seconds=60)
+    assert cache.get(1) is None
+    cache.put(1, "Sad", {"current_mood": "Sad", "trend": "down"})
+    assert cache.get(1) == ("Sad", {"current_mood": "Sad", "trend": "down"})
+    assert cache.is_warm(1)
+    cache._entries[1]["loaded_at"] = time.time() - 120
+    assert not cache.is_warm(1)
+    assert cache.get(1) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_lru_keeps_recent_users():
+    cache = MoodContextCache(max_users=2)
+    cache.put(1, "Happy", None)
+    cache.put(2, "Sad", None)
+    cache.get(1)
+    cache.put(3, "Angry", None)
+    assert cache.get(2) is None
+    assert cache.get(1) == ("Happy", None)
+    assert cache.stats()["users"] == 2
+
+
+def test_note_mood_updates_the_cached_context():
+    cache = MoodContextCache()
+    cache.note_mood(9, "Happy")
+    assert cache.get(9) is None
+    cache.put(9, "Sad", {"current_mood": "Sad", "trend": "down"})
+    cache.note_mood(9, "Happy")
+    assert cache.get(9) == ("Happy", {"current_mood": "Happy", "trend": "down"})
+    cache.put(10, None, None)
+    cache.note_mood(10, "Stress")
+    assert cache.get(10) == ("Stress", None)
+
+
+def test_one_prefetch_per_user_at_a_time():
+    cache = MoodContextCache()
+    assert cache.begin_prefetch(4)
+    assert not cache.begin_prefetch(4)
+    assert cache.stats()["prefetching"] == 1
+    cache.end_prefetch(4)
+    assert cache.begin_prefetch(4)
+    assert cache.stats()["prefetches"] == 2
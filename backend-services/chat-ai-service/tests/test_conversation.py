@@ -0,0 +1,71 @@
+import json
+
+from conversation import ConversationStore, build_messages
+from prompts import estimate_tokens
+
+
+def _turn(i, emotion="Neutral"):
+    return {"user": f"message number {i} about my day", "assistant": f"reply {i}", "emotion": emotion}
+
+
+def test_ring_buffer_keeps_the_latest_turns():
+    store = ConversationStore(max_turns=3)
+    store.ensure_loaded(1, lambda user_id, limit: [])
+    for i in range(5):
+        store.record_turn(1, f"m{i}", f"r{i}", "Happy")
+    assert [t["user"] for t in store.turns(1)] == ["m2", "m3", "m4"]
+
+
+def test_history_is_loaded_once_newest_first():
+    store = ConversationStore(max_turns=5)
+    calls = []
+
+    def loader(user_id, limit):
+        calls.append((user_id, limit))
+        return [{"user_message": "second", "ai_reply": "b", "ai_emotion": "Sad"},
+                {"user_message": "first", "ai_reply": "a", "ai_emotion": "Happy"}]
+
+    store.ensure_loaded(7, loader)
+    store.ensure_loaded(7, loader)
+    assert calls == [(7, 5)]
+    assert [t["user"] for t in store.turns(7)] == ["first", "second"]
+
+
+def test_turns_for_unloaded_users_are_not_recorded_and_lru_is_bounded():
+    store = ConversationStore(max_users=2)
+    store.record_turn(1, "hi", "hey")
+    assert store.turns(1) == []
+    for user_id in (1, 2, 3):
+        store.ensure_loaded(user_id, lambda user_id, limit: [])
+    assert not store.is_loaded(1) and store.is_loaded(3)
+
+
+def test_everything_fits_without_a_summary():
+    turns = [_turn(i) for i in range(2)]
+    messages = build_messages("SYSTEM", turns, "now", budget_tokens=600)
+    assert messages[0] == {"role": "system", "content": "SYSTEM"}
+    assert [m["role"] for m in messages[1:]] == ["user", "assistant", "user", "assistant", "user"]
+    assert json.loads(messages[2]["content"]) == {"reply": "reply 0", "emotion": "Neutral"}
+    assert messages[-1] == {"role": "user", "content": "now"}
+
+
+def test_budget_keeps_the_newest_turns_and_summarizes_the_rest():
+    turns = [_turn(i, emotion) for i, emotion in enumerate(["Happy", "Sad", "Stress", "Happy", "Sad", "Neutral"])]
+    messages = build_messages("SYSTEM", turns, "now", budget_tokens=50, summary_tokens=80)
+    history = messages[1:-1]
+    assert 0 < len(history) < 2 * len(turns)
+    assert sum(estimate_tokens(m["content"]) + 4 for m in history) <= 50
+    # verbatim turns are the newest ones, in order
+    assert history[-2]["content"] == turns[-1]["user"]
+    kept = len(history) // 2
+    summary = messages[0]["content"]
+    assert summary.startswith("SYSTEM\nEarlier in this conversation")
+    assert f"({len(turns) - kept} older messages)" in summary
+    assert "Happy -> Sad" in summary
+    assert estimate_tokens(summary.split("\n", 1)[1]) <= 80 + 2
+
+
+def test_summary_can_be_switched_off():
+    turns = [_turn(i) for i in range(6)]
+    messages = build_messages("SYSTEM", turns, "now", budget_tokens=20, summary_tokens=0)
+    assert messages[0]["content"] == "SYSTEM"
@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+import deadline
+from deadline import Deadline, DeadlineExceeded
+
+
+def test_header_parsing(monkeypatch):
+    assert Deadline.from_header("1500").budget == 1.5
+    assert Deadline.from_header("-20").budget == 0.0
+    monkeypatch.setattr(deadline, "DEFAULT_REQUEST_BUDGET_SECONDS", 0.0)
+    assert not Deadline.from_header(None).bounded
+    assert not Deadline.from_header("soon").bounded
+    monkeypatch.setattr(deadline, "DEFAULT_REQUEST_BUDGET_SECONDS", 8.0)
+    assert Deadline.from_header("").budget == 8.0
+
+
+def test_zero_budget_is_spent_not_unbounded():
+    spent = Deadline(0.0)
+    assert spent.bounded and spent.expired()
+    try:
+        spent.check("groq")
+    except DeadlineExceeded as e:
+        assert "groq" in str(e)
+    else:
+        raise AssertionError("a spent deadline must raise")
+
+
+def test_unbounded_deadline():
+    open_ended = Deadline(None)
+    assert open_ended.remaining() == float("inf")
+    assert open_ended.cap(5.0, reserve=3.0) == 5.0
+    open_ended.check("groq")
+
+
+def test_cap_keeps_the_reserve():
+    budget = Deadline(4.0)
+    assert 0.9 < budget.cap(10.0, reserve=3.0) <= 1.0
+    assert budget.cap(0.5, reserve=3.0) == 0.5
+    assert budget.cap(10.0, reserve=5.0) == 0.0
+
+
+def test_run_gives_up_on_slow_calls():
+    def slow():
+        time.sleep(0.3)
+        return "late"
+
+    async def timed():
+        started = time.monotonic()
+        result = await Deadline(0.05).run("mood fetch", slow, default="skipped")
+        return result, time.monotonic() - started
+
+    result, elapsed = asyncio.run(timed())
+    assert result == "skipped"
+    assert elapsed < 0.25
+    assert asyncio.run(Deadline(1.0).run("mood fetch", slow, reserve=1.0, default="skipped")) == "skipped"
+    assert asyncio.run(Deadline(None).run("mood fetch", lambda x: x * 2, 21)) == 42
+    assert asyncio.run(Deadline(2.0).run("mood fetch", lambda x: x * 2, 21)) == 42
@@ -0,0 +1,61 @@
+from detector_policy import DetectorPolicy
+
+PATHS = ["retinaface", "haar_crop"]
+
+
+def _feed(policy, path, n, ok=True, seconds=0.1, confidence=None):
+    for _ in range(n):
+        attempt = (path, ok, seconds) if confidence is None else (path, ok, seconds, confidence)
+        policy.record([attempt])
+
+
+def test_fixed_policy_keeps_the_configured_order():
+    policy = DetectorPolicy("fixed", PATHS, min_samples=2, explore_every=0)
+    _feed(policy, "retinaface", 5, seconds=2.0)
+    _feed(policy, "haar_crop", 5, seconds=0.05)
+    assert policy.plan() == PATHS
+
+
+def test_unknown_policy_falls_back_to_fixed():
+    assert DetectorPolicy("fastest", PATHS).policy == "fixed"
+
+
+def test_adaptive_waits_for_min_samples_on_every_path():
+    policy = DetectorPolicy("adaptive", PATHS, min_samples=3, explore_every=0)
+    _feed(policy, "haar_crop", 5, seconds=0.05)
+    _feed(policy, "retinaface", 2, seconds=2.0)
+    assert policy.plan() == PATHS
+    _feed(policy, "retinaface", 1, seconds=2.0)
+    assert policy.plan() == ["haar_crop", "retinaface"]
+
+
+def test_lenient_path_is_ranked_at_the_common_confidence_bar():
+    policy = DetectorPolicy("adaptive", PATHS, min_samples=3, explore_every=0, compare_confidence=0.5)
+    _feed(policy, "retinaface", 5, seconds=0.4, confidence=0.8)
+    # haar_crop is faster and accepts every photo, but only at 0.3 confidence
+    _feed(policy, "haar_crop", 5, seconds=0.1, confidence=0.3)
+    stats = policy.stats()["paths"]["haar_crop"]
+    assert stats["success_rate"] == 1.0
+    assert stats["confident_rate"] == 0.0
+    assert policy.plan() == ["retinaface", "haar_crop"]
+
+
+def test_exploration_puts_the_least_sampled_path_first():
+    policy = DetectorPolicy("adaptive", PATHS, min_samples=1, explore_every=2)
+    _feed(policy, "haar_crop", 5, seconds=0.05)
+    _feed(policy, "retinaface", 1, seconds=2.0)
+    assert policy.plan() == ["haar_crop", "retinaface"]
+    assert policy.plan() == ["retinaface", "haar_crop"]
+    assert policy.stats()["explored"] == 1
+
+
+def test_record_counts_winners_and_unresolved_photos():
+    policy = DetectorPolicy("adaptive", PATHS)
+    policy.record([("retinaface", False, 1.0, 0.2), ("haar_crop", True, 0.1, 0.7)])
+    policy.record([("retinaface", False, 1.0), ("haar_crop", False, 0.1)])
+    policy.record([("mtcnn", True, 0.5)])
+    stats = policy.stats()
+    assert stats["winners"] == {"retinaface": 0, "haar_crop": 1}
+    assert stats["unresolved"] == 2
+    assert stats["paths"]["retinaface"]["samples"] == 2
+    assert stats["paths"]["haar_crop"]["confident_rate"] == 0.5
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+from emotion_classifier import EMOTIONS, LexiconEmotionClassifier, cross_validate, featurize, load_training_rows
+
+
+@pytest.fixture(scope="module")
+def lexicon_model():
+    return LexiconEmotionClassifier()
+
+
+@pytest.mark.parametrize("message, emotion", [
+    ("I got the job!", "Excited"),
+    ("I failed my exam", "Sad"),
+    ("yako mata stress job eka gana", "Stress"),
+    ("I'm so nervous about tomorrow", "Anxious"),
+    ("කොහොමද ඔයා", "Neutral"),
+    ("මං අද හරිම සතුටුයි", "Happy"),
+])
+def test_seed_lexicon_covers_english_singlish_and_sinhala(lexicon_model, message, emotion):
+    assert lexicon_model.predict(message)[0] == emotion
+
+
+def test_no_evidence_means_neutral(lexicon_model):
+    emotion, confidence, probabilities = lexicon_model.predict("")
+    assert emotion == "Neutral"
+    assert set(probabilities) == set(EMOTIONS)
+    assert abs(sum(probabilities.values()) - 1.0) < 1e-3
+    assert confidence == pytest.approx(probabilities["Neutral"], abs=1e-4)
+
+
+def test_features_ignore_case_and_punctuation():
+    assert featurize("Hello there friend!!").tolist() == featurize("hello there friend").tolist()
+    assert len(featurize("")) == 0
+
+
+def test_fit_learns_phrases_outside_the_lexicon():
+    rows = [("my cat is purring", "Happy")] * 5 + [("the rain again", "Sad")] * 5
+    model = LexiconEmotionClassifier().fit(rows)
+    assert model.predict("my cat is purring")[0] == "Happy"
+    assert model.predict("the rain again")[0] == "Sad"
+    assert model.stats()["trained_on"] == 10
+
+    evaluation = cross_validate(rows)
+    assert evaluation["accuracy"] > evaluation["lexicon_only_accuracy"]
+    assert evaluation["majority_baseline"] == 0.5
+    assert cross_validate(rows[:3]) is None
+
+
+def test_training_rows_skip_unknown_emotions_and_bad_lines(tmp_path):
+    path = tmp_path / "history.jsonl"
+    path.write_text("\n".join([
+        json.dumps({"user_message": "so happy today", "ai_emotion": "Happy"}),
+        json.dumps({"user_message": "hmm", "ai_emotion": "Confused"}),
+        "{not json",
+        "",
+        json.dumps({"user_message": "", "ai_emotion": "Sad"}),
+    ]), encoding="utf-8")
+    assert load_training_rows(str(path)) == [("so happy today", "Happy")]
+    assert load_training_rows(str(tmp_path / "missing.jsonl")) == []
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+import face_emotion
+from face_emotion import hinted_face_crop, parse_face_hint
+from image_prep import PreparedImage
+
+
+@pytest.mark.parametrize("face_box,rotation,expected", [
+    ({"x": 10, "y": 20, "w": 30, "h": 40}, None, {"box": (10.0, 20.0, 30.0, 40.0), "rotation": 0}),
+    ({"left": 1, "top": 2, "width": 3, "height": 4, "rotation": 90}, None,
+     {"box": (1.0, 2.0, 3.0, 4.0), "rotation": 90}),
+    ('{"x": 0.1, "y": 0.2, "w": 0.3, "h": 0.4}', "-90", {"box": (0.1, 0.2, 0.3, 0.4), "rotation": 270}),
+    ("10, 20, 30, 40", 185, {"box": (10.0, 20.0, 30.0, 40.0), "rotation": 180}),
+    ([1, 2, 3, 4], 360, {"box": (1.0, 2.0, 3.0, 4.0), "rotation": 0}),
+])
+def test_parse_face_hint_formats(face_box, rotation, expected):
+    assert parse_face_hint(face_box, rotation) == expected
+
+
+@pytest.mark.parametrize("face_box", [None, "", "10,20,30", "a,b,c,d", "{not json", {"x": 1, "y": 2}])
+def test_parse_face_hint_rejects_unreadable_boxes(face_box):
+    assert parse_face_hint(face_box) is None
+
+
+@pytest.fixture
+def photo():
+    rng = np.random.default_rng(0)
+    return PreparedImage.from_array(rng.integers(0, 255, (400, 300, 3), dtype=np.uint8))
+
+
+@pytest.fixture
+def haar(monkeypatch):
+    """Stand-in face cascade: answers `found`, remembers the areas it was shown"""
+    state = {"found": True, "areas": []}
+
+    def fake(area):
+        state["areas"].append(area.shape)
+        return [(0, 0, 10, 10)] if state["found"] else []
+    monkeypatch.setattr(face_emotion, "FACE_HINT_VERIFY", True)
+    monkeypatch.setattr(face_emotion, "face_cascade", object())
+    monkeypatch.setattr(face_emotion, "_opencv_faces", fake)
+    return state
+
+
+def test_plausible_box_gives_an_upright_full_resolution_crop(photo, haar):
+    crop = hinted_face_crop(photo, {"box": (100, 100, 80, 120), "rotation": 0})
+    assert crop.shape[:2] == (144, 104)  # box plus 10% padding
+    turned = hinted_face_crop(photo, {"box": (100, 100, 80, 120), "rotation": 90})
+    assert turned.shape[:2] == (104, 144)
+    # the Haar check saw the area with a 30% margin, turned upright
+    assert haar["areas"][0][:2] == (192, 152)
+    assert haar["areas"][1][:2] == (152, 192)
+
+
+def test_fractional_box_is_scaled_to_the_image(photo, haar):
+    assert hinted_face_crop(photo, {"box": (0.25, 0.25, 0.5, 0.5), "rotation": 0}) is not None
+
+
+@pytest.mark.parametrize("box", [
+    (10, 10, 20, 20),      # smaller than FACE_HINT_MIN_SIZE
+    (10, 10, 200, 40),     # not face-shaped
+    (250, 350, 100, 100),  # mostly outside the image
+])
+def test_implausible_boxes_are_rejected(photo, haar, box):
+    assert hinted_face_crop(photo, {"box": box, "rotation": 0}) is None
+    assert haar["areas"] == []
+
+
+def test_flat_crop_is_rejected(haar):
+    blank = PreparedImage.from_array(np.full((400, 300, 3), 128, dtype=np.uint8))
+    assert hinted_face_crop(blank, {"box": (100, 100, 80, 80), "rotation": 0}) is None
+
+
+def test_box_without_a_face_is_rejected(photo, haar):
+    haar["found"] = False
+    assert hinted_face_crop(photo, {"box": (100, 100, 80, 80), "rotation": 0}) is None
+
+
+def test_verification_can_be_switched_off(photo, haar, monkeypatch):
+    haar["found"] = False
+    monkeypatch.setattr(face_emotion, "FACE_HINT_VERIFY", False)
+    assert hinted_face_crop(photo, {"box": (100, 100, 80, 80), "rotation": 0}) is not None
+    assert haar["areas"] == []
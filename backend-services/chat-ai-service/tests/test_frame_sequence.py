@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+import frame_sequence
+from frame_sequence import select_frames, smooth_emotions, track_faces
+
+BOX = (40, 40, 50, 50)
+
+
+def _frame(value):
+    return np.full((120, 160, 3), value, dtype=np.uint8)
+
+
+def test_select_frames_skips_near_duplicates():
+    frames = [_frame(10), _frame(11), _frame(60), _frame(61), _frame(120)]
+    assert select_frames(frames, threshold=6, max_frames=8) == [0, 2, 4]
+
+
+def test_select_frames_thins_evenly_to_max():
+    frames = [_frame(v) for v in range(0, 200, 20)]
+    picked = select_frames(frames, threshold=6, max_frames=4)
+    assert len(picked) == 4
+    assert picked[0] == 0 and picked[-1] == len(frames) - 1
+
+
+@pytest.fixture
+def scripted_faces(monkeypatch):
+    """_largest_face answering from a per-frame script: {"full": box | None, "roi": box | None}"""
+    calls = []
+
+    def install(script):
+        def fake(img, roi=None):
+            step = script[int(img[0, 0, 0])]
+            calls.append(("roi" if roi is not None else "full", int(img[0, 0, 0])))
+            return step.get("roi" if roi is not None else "full")
+        monkeypatch.setattr(frame_sequence, "_largest_face", fake)
+        return [_frame(i) for i in range(len(script))], calls
+    return install
+
+
+def test_track_faces_tracks_between_full_detections(scripted_faces):
+    frames, calls = scripted_faces([{"full": BOX}, {"roi": BOX}, {"roi": BOX}, {"full": BOX}])
+    tracked = track_faces(frames, [0, 1, 2, 3], redetect_every=2, max_reuse=2)
+    assert [how for _, how in tracked] == ["detect", "track", "track", "detect"]
+    assert calls == [("full", 0), ("roi", 1), ("roi", 2), ("full", 3)]
+
+
+def test_lost_face_is_reused_then_dropped_then_redetected(scripted_faces):
+    frames, _ = scripted_faces([{"full": BOX}, {}, {}, {}, {"full": BOX}])
+    tracked = track_faces(frames, [0, 1, 2, 3, 4], redetect_every=10, max_reuse=2)
+    assert [how for _, how in tracked] == ["detect", "reuse", "reuse", "none", "detect"]
+    assert tracked[3][0] is None
+
+
+def test_smooth_emotions_weighs_later_frames():
+    series = [{"happy": 100.0, "sad": 0.0}, {"happy": 0.0, "sad": 100.0}]
+    assert smooth_emotions(series, alpha=0.5) == {"happy": 50.0, "sad": 50.0}
+    assert smooth_emotions(series, alpha=0.8)["sad"] == pytest.approx(80.0)
+    assert smooth_emotions([]) == {}
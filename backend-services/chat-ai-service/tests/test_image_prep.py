@@ -0,0 +1,76 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from image_prep import PreparedImage, apply_orientation, decode_image, header_info, reduced_decode
+
+
+def _jpeg(width, height, orientation=None):
+    """Landscape test JPEG with a bright left edge, optionally tagged with an EXIF orientation"""
+    pixels = np.zeros((height, width, 3), dtype=np.uint8)
+    pixels[:, : width // 4] = 255
+    img = Image.fromarray(pixels)
+    buf = io.BytesIO()
+    if orientation is None:
+        img.save(buf, format="JPEG", quality=95)
+    else:
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        img.save(buf, format="JPEG", quality=95, exif=exif.tobytes())
+    return buf.getvalue()
+
+
+def test_header_info_reads_size_and_orientation():
+    assert header_info(_jpeg(400, 200, orientation=6)) == ((400, 200), 6)
+    assert header_info(_jpeg(400, 200)) == ((400, 200), None)
+    assert header_info(b"not an image") == (None, None)
+
+
+def test_apply_orientation_covers_every_tag():
+    img = np.arange(6, dtype=np.uint8).reshape(2, 3)
+    for orientation in (None, 0, 1, 2, 3, 4):
+        assert apply_orientation(img, orientation).shape == (2, 3)
+    for orientation in (5, 6, 7, 8):
+        assert apply_orientation(img, orientation).shape == (3, 2)
+    assert apply_orientation(img, 6)[0].tolist() == [3, 0]
+    assert apply_orientation(img, 8)[0].tolist() == [2, 5]
+    assert apply_orientation(None, 6) is None
+
+
+def test_decode_applies_exif_rotation():
+    upright = decode_image(_jpeg(400, 200, orientation=6))
+    assert upright.shape[:2] == (400, 200)
+    # orientation 6 turns the bright left edge into the top edge
+    assert upright[:50].mean() > 200
+    assert upright[-50:].mean() < 50
+    assert decode_image(_jpeg(400, 200)).shape[:2] == (200, 400)
+
+
+def test_reduced_decode_is_upright_and_capped():
+    image_bytes = _jpeg(1600, 800, orientation=8)
+    small = reduced_decode(image_bytes, 320)
+    assert small.shape[:2] == (320, 160)
+    # orientation 8 turns the bright left edge into the bottom edge
+    assert small[-20:].mean() > 200
+
+
+def test_prepared_image_keeps_small_and_full_views_aligned():
+    prepared = PreparedImage.from_bytes(_jpeg(1600, 800, orientation=6), max_dim=320)
+    assert prepared.orientation == 6
+    assert prepared.upright_known
+    assert prepared.small.shape[:2] == (320, 160)
+    assert prepared.full.shape[:2] == (1600, 800)
+    assert prepared.downscaled
+
+
+def test_prepared_image_without_exif_is_not_upright_known():
+    prepared = PreparedImage.from_bytes(_jpeg(300, 200), max_dim=640)
+    assert not prepared.upright_known
+    assert prepared.small.shape[:2] == (200, 300)
+    assert prepared.full.shape == prepared.small.shape
+
+
+def test_undecodable_bytes_give_none():
+    assert decode_image(b"\x00\x01garbage") is None
+    assert reduced_decode(b"\x00\x01garbage", 320) is None
@@ -0,0 +1,88 @@
+import json
+import time
+
+import pytest
+
+import json_salvage
+from json_salvage import parse_llm_json, partial_reply
+
+CASES = [
+    ('{"reply": "Hi there!", "emotion": "Happy"}', "json", "Hi there!", "Happy"),
+    ('Sure! Here\'s my response:\n{"reply": "Yo that\'s amazing! Congrats buddy! 🎉", "emotion": "Happy"}',
+     "extracted", "Yo that's amazing! Congrats buddy! 🎉", "Happy"),
+    ('```json\n{"reply": "Oya relax wenna try karanna macho 😌", "emotion": "Stress"}\n```',
+     "extracted", "Oya relax wenna try karanna macho 😌", "Stress"),
+    ("{'reply': \"I'm so glad you're feeling better! 🌈\", 'emotion': 'Happy'}",
+     "literal", "I'm so glad you're feeling better! 🌈", "Happy"),
+    ('{"reply": "Hey! Just chilling here 😊 What about you?", "emotion": "Neu',
+     "partial", "Hey! Just chilling here 😊 What about you?", None),
+    ("Hello friend, how was your day?", "plain_text", "Hello friend, how was your day?", None),
+]
+
+
+@pytest.mark.parametrize("raw,method,reply,emotion", CASES)
+def test_salvages_malformed_completions(raw, method, reply, emotion):
+    data, got = parse_llm_json(raw)
+    assert got == method
+    assert data["reply"] == reply
+    assert data.get("emotion") == emotion
+
+
+def test_truncated_reply_is_cut_back_to_a_sentence():
+    data, method = parse_llm_json('{"reply": "Aww, sorry to hear that buddy. What happened at work or')
+    assert method == "partial"
+    assert data["reply"] == "Aww, sorry to hear that buddy."
+
+
+def test_unicode_escapes_and_surrogate_pairs():
+    data, _ = parse_llm_json('{"reply": "Nice \\ud83d\\ude0a\\nsee you", "emotion": "Happy"')
+    assert data["reply"] == "Nice 😊\nsee you"
+
+
+def test_unrecoverable_input_fails():
+    assert parse_llm_json("") == (None, "failed")
+    assert parse_llm_json('{"emotion": "Sad"}')[1] == "failed"
+
+
+def test_partial_reply_drops_a_cut_escape():
+    assert partial_reply('{"emotion": "Happy", "reply": "Hey \\ud83d') == "Hey "
+    assert partial_reply('{"reply": "Line one\\') == "Line one"
+    assert partial_reply('{"emotion": "Ha') is None
+
+
+def test_capture_is_off_by_default(monkeypatch, tmp_path):
+    corpus = tmp_path / "corpus.jsonl"
+    monkeypatch.setattr(json_salvage, "MALFORMED_CORPUS_PATH", str(corpus))
+    assert json_salvage.CAPTURE_MALFORMED is False
+    json_salvage.salvage("not json at all {")
+    time.sleep(0.05)
+    assert not corpus.exists()
+
+
+def test_capture_stops_at_the_size_cap(monkeypatch, tmp_path):
+    corpus = tmp_path / "data" / "corpus.jsonl"
+    monkeypatch.setattr(json_salvage, "CAPTURE_MALFORMED", True)
+    monkeypatch.setattr(json_salvage, "MALFORMED_CORPUS_PATH", str(corpus))
+    monkeypatch.setattr(json_salvage, "MALFORMED_CORPUS_MAX_BYTES", 150)
+    written_before = json_salvage.stats()["capture"].get("written", 0)
+    for i in range(5):
+        json_salvage.salvage(f'{{"reply": "truncated answer number {i}')
+    deadline = time.time() + 2
+    while json_salvage._capture_queue.qsize() and time.time() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.05)
+    lines = corpus.read_text(encoding="utf-8").splitlines()
+    assert 1 <= len(lines) < 5
+    assert json.loads(lines[0])["method"] == "partial"
+    assert json_salvage.stats()["capture"]["written"] - written_before == len(lines)
+
+
+def test_seed_corpus_matches_its_recorded_methods():
+    with open(json_salvage.SEED_CORPUS_PATH, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    assert records and all(r["source"] == "seed" for r in records)
+    for record in records:
+        assert parse_llm_json(record["raw"])[1] == record["method"], record["raw"]
+    result = json_salvage.benchmark(repeat=1)
+    assert result["samples"] == len(records)
+    assert result["strict_json_ok"] == 0
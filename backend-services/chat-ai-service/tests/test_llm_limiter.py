@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from llm_limiter import FairLLMLimiter, LLMQueueRejected
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_admits_up_to_max_concurrency_without_queueing():
+    async def scenario():
+        limiter = FairLLMLimiter(max_concurrency=2)
+        await limiter.acquire("a")
+        await limiter.acquire("b")
+        return limiter.stats()
+
+    stats = run(scenario())
+    assert stats["in_flight"] == 2
+    assert stats["queued_total"] == 0
+
+
+def test_round_robin_between_users():
+    async def scenario():
+        limiter = FairLLMLimiter(max_concurrency=1, max_queue_wait=5)
+        order = []
+
+        async def call(user, tag):
+            async with limiter.slot(user):
+                order.append(tag)
+                await asyncio.sleep(0.01)
+
+        await limiter.acquire("holder")
+        # heavy user queues three calls before the light user's one
+        tasks = [asyncio.create_task(call("heavy", f"heavy{i}")) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(call("light", "light")))
+        await asyncio.sleep(0)
+        limiter._release()
+        await asyncio.gather(*tasks)
+        return order
+
+    order = run(scenario())
+    assert order.index("light") == 1
+
+
+def test_rejects_when_queue_is_full():
+    async def scenario():
+        limiter = FairLLMLimiter(max_concurrency=1, max_queue_depth=1, max_queue_wait=5)
+        await limiter.acquire("a")
+        waiter = asyncio.create_task(limiter.acquire("b"))
+        await asyncio.sleep(0)
+        with pytest.raises(LLMQueueRejected) as exc:
+            await limiter.acquire("c")
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        return exc.value.reason, limiter.stats()
+
+    reason, stats = run(scenario())
+    assert reason == "queue_full"
+    assert stats["rejected_queue_full"] == 1
+    assert stats["queue_depth"] == 0
+
+
+def test_times_out_and_leaves_the_queue_clean():
+    async def scenario():
+        limiter = FairLLMLimiter(max_concurrency=1, max_queue_wait=5)
+        await limiter.acquire("a")
+        with pytest.raises(LLMQueueRejected) as exc:
+            await limiter.acquire("b", max_wait=0.02)
+        return exc.value.reason, limiter.stats()
+
+    reason, stats = run(scenario())
+    assert reason == "timeout"
+    assert stats["queue_depth"] == 0
+    assert stats["queued_users"] == 0
+    assert stats["in_flight"] == 1
+
+
+def test_slot_is_released_on_error():
+    async def scenario():
+        limiter = FairLLMLimiter(max_concurrency=1)
+        with pytest.raises(RuntimeError):
+            async with limiter.slot("a"):
+                raise RuntimeError("groq down")
+        return limiter.stats()["in_flight"]
+
+    assert run(scenario()) == 0
@@ -0,0 +1,82 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import model_router
+from model_router import LLMDeadlineExceeded, ModelRouter
+
+
+def record(router, name, latency, ok=True, times=1):
+    for _ in range(times):
+        router._record(name, latency, ok)
+
+
+def test_cold_router_keeps_config_order():
+    router = ModelRouter(["small", "large"])
+    assert router.ranked() == ["small", "large"]
+
+
+def test_unsampled_model_costs_the_prior_not_zero():
+    router = ModelRouter(["small", "large"])
+    record(router, "large", 1.0, times=model_router.MODEL_MIN_SAMPLES)
+    # "small" has no samples: ranked at MODEL_PRIOR_LATENCY_SECONDS, behind a known 1s model
+    assert router.ranked() == ["large", "small"]
+    record(router, "small", 0.2, times=model_router.MODEL_MIN_SAMPLES)
+    assert router.ranked() == ["small", "large"]
+
+
+def test_faster_model_wins_once_sampled():
+    router = ModelRouter(["small", "large"])
+    record(router, "small", 1.5, times=model_router.MODEL_MIN_SAMPLES)
+    record(router, "large", 0.5, times=model_router.MODEL_MIN_SAMPLES)
+    assert router.ranked() == ["large", "small"]
+
+
+def test_errors_raise_expected_cost():
+    router = ModelRouter(["small", "large"])
+    record(router, "small", 0.5, times=3)
+    record(router, "small", None, ok=False, times=1)
+    record(router, "large", 0.8, times=3)
+    stats = router.stats()["models"]
+    assert stats["small"]["expected_cost_ms"] > 500
+    assert router.ranked() == ["small", "large"]
+    record(router, "small", None, ok=False, times=2)
+    assert router.ranked()[0] == "large"
+
+
+def test_unhealthy_model_sinks():
+    router = ModelRouter(["small", "large"])
+    router._stats["small"].cooldown_until = time.time() + 60
+    assert router.ranked() == ["large", "small"]
+
+
+def test_rate_limit_starts_cooldown():
+    router = ModelRouter(["small"])
+    router._record("small", 0.1, False, exc=SimpleNamespace(status_code=429))
+    assert not router._stats["small"].healthy(time.time())
+
+
+def test_spent_deadline_fails_fast():
+    router = ModelRouter(["small"])
+    calls = []
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+        create=lambda **kw: calls.append(kw))))
+    with pytest.raises(LLMDeadlineExceeded):
+        asyncio.run(router.complete(client, deadline_seconds=0, messages=[]))
+    assert calls == []
+
+
+def test_complete_falls_back_to_next_model():
+    router = ModelRouter(["broken", "ok"])
+
+    def create(model, **kw):
+        if model == "broken":
+            raise RuntimeError("500")
+        return "completion"
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    completion, name = asyncio.run(router.complete(client, messages=[]))
+    assert (completion, name) == ("completion", "ok")
+    assert router.stats()["models"]["broken"]["errors"] == 1
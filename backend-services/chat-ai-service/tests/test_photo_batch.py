@@ -0,0 +1,78 @@
+import asyncio
+import base64
+import io
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import face_emotion
+import main
+import photo_pool
+from photo_cache import PhotoResultCache
+from photo_pool import PhotoPool
+
+CORRUPT = b"\xff\xd8\xff\xe0 truncated upload"
+
+
+def _jpeg(seed):
+    pixels = np.random.default_rng(seed).integers(0, 255, (80, 120, 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+@pytest.fixture
+def batch_model(monkeypatch):
+    """Thread-mode pool, empty photo cache, every photo has a face and the model says 'happy'"""
+    passes = []
+
+    def predict(faces):
+        passes.append(len(faces))
+        return [{label: (90.0 if label == "happy" else 1.0) for label in face_emotion.EMOTION_MODEL_LABELS}
+                for _ in faces]
+
+    monkeypatch.setattr(face_emotion, "DEEPFACE_AVAILABLE", True)
+    monkeypatch.setattr(face_emotion, "_haar_face_crop", lambda prep, pad_ratio=0.0: prep.small[:40, :40])
+    monkeypatch.setattr(face_emotion, "predict_emotions_batch", predict)
+    monkeypatch.setattr(photo_pool, "photo_result_cache", PhotoResultCache())
+    return passes
+
+
+def test_corrupt_photo_comes_back_as_none_and_the_rest_share_one_pass(batch_model):
+    results = photo_pool.run_batch_pipeline([_jpeg(1), CORRUPT, _jpeg(2)])
+    assert results[1] is None
+    assert [r[0] for r in (results[0], results[2])] == ["Happy", "Happy"]
+    assert all(r[3] and r[4] == "opencv_crop" for r in (results[0], results[2]))
+    assert batch_model == [2]
+
+
+def test_pool_caches_the_decodable_photos_only(batch_model):
+    pool = PhotoPool(workers=0)
+    images = [_jpeg(1), CORRUPT, _jpeg(2)]
+    first = asyncio.run(pool.analyze_batch(images, user_id=7))
+    assert first[1] is None and first[0] is not None and first[2] is not None
+
+    again = asyncio.run(pool.analyze_batch(images, user_id=7))
+    assert again == first
+    # the corrupt photo is retried on its own, the other two come from the cache
+    assert batch_model == [2]
+    assert pool.stats()["batches"] == 2
+    assert pool.completed == 4
+
+
+def test_batch_endpoint_reports_the_corrupt_photo_and_saves_the_others(batch_model, monkeypatch):
+    saved = []
+    monkeypatch.setattr(main, "photo_pool", PhotoPool(workers=0))
+    monkeypatch.setattr(main, "save_moods_to_database", lambda rows: saved.extend(rows) or len(rows))
+    response = TestClient(main.app).post("/api/v1/analyze-emotion/batch", json={
+        "user_id": 3,
+        "images": [base64.b64encode(b).decode() for b in (_jpeg(1), CORRUPT, _jpeg(2))],
+    })
+    assert response.status_code == 200
+    body = response.json()
+    assert [item["status"] for item in body["results"]] == ["success", "decode_error", "success"]
+    assert body["results"][1]["confidence"] == 0.0
+    assert body["saved"] == 2
+    assert [row["emotion"] for row in saved] == ["Happy", "Happy"]
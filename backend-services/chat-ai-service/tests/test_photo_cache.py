@@ -0,0 +1,94 @@
+import cv2
+import numpy as np
+
+import photo_cache
+from photo_cache import PhotoResultCache, cache_key, hint_variant, image_hash
+
+RESULT = ("Happy", 0.9, {"happy": 90.0}, True, "retinaface")
+
+
+def test_keys_are_scoped_to_user_and_variant():
+    digest = image_hash(b"photo")
+    cache = PhotoResultCache()
+    cache.put(cache_key(digest, "alice"), RESULT)
+    assert cache.get(cache_key(digest, "alice")) == RESULT
+    assert cache.get(cache_key(digest, "bob")) is None
+    assert cache.get(cache_key(digest, "alice", "batch")) is None
+
+
+def test_only_identical_bytes_match():
+    cache = PhotoResultCache()
+    cache.put(cache_key(image_hash(b"photo-1"), "alice"), RESULT)
+    assert cache.get(cache_key(image_hash(b"photo-2"), "alice")) is None
+
+
+def test_empty_upload_is_never_cached():
+    cache = PhotoResultCache()
+    key = cache_key(image_hash(b""), "alice")
+    assert key is None
+    cache.put(key, RESULT)
+    assert cache.get(key) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_hint_variant_depends_on_the_box():
+    assert hint_variant(None) == "full"
+    a = hint_variant({"box": (10, 10, 50, 50), "rotation": 0})
+    b = hint_variant({"box": (10, 10, 60, 60), "rotation": 0})
+    assert a.startswith("hint:") and a != b
+
+
+def test_entries_expire_and_lru_is_bounded(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(photo_cache.time, "time", lambda: now[0])
+    cache = PhotoResultCache(max_entries=2, ttl_seconds=10)
+    for name in ("a", "b", "c"):
+        cache.put(cache_key(name, "u"), RESULT)
+    assert cache.get(cache_key("a", "u")) is None
+    assert cache.get(cache_key("c", "u")) == RESULT
+    now[0] += 11
+    assert cache.get(cache_key("c", "u")) is None
+    assert cache.stats()["entries"] == 1
+
+
+def _photo(seed):
+    rng = np.random.default_rng(seed)
+    img = cv2.resize(rng.integers(0, 255, (12, 16, 3), dtype=np.uint8), (640, 480), interpolation=cv2.INTER_CUBIC)
+    return img
+
+
+def _jpeg(img, quality=95):
+    return cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+
+def test_reencoded_or_resized_copy_hits_for_the_same_user():
+    img = _photo(1)
+    cache = PhotoResultCache(max_distance=2)
+    cache.put(cache_key(image_hash(_jpeg(img)), "alice"), RESULT)
+    reencoded = image_hash(_jpeg(img, quality=70))
+    resized = image_hash(_jpeg(cv2.resize(img, (320, 240), interpolation=cv2.INTER_AREA), quality=80))
+    assert reencoded[0] != image_hash(_jpeg(img))[0]
+    assert cache.get(cache_key(reencoded, "alice")) == RESULT
+    assert cache.get(cache_key(resized, "alice")) == RESULT
+    assert cache.stats()["near_hits"] == 2
+    # never across users or variants, and never for a different photo
+    assert cache.get(cache_key(reencoded, "bob")) is None
+    assert cache.get(cache_key(reencoded, "alice", "batch")) is None
+    assert cache.get(cache_key(image_hash(_jpeg(_photo(2))), "alice")) is None
+
+
+def test_zero_distance_matches_exact_bytes_only():
+    img = _photo(1)
+    cache = PhotoResultCache(max_distance=0)
+    cache.put(cache_key(image_hash(_jpeg(img)), "alice"), RESULT)
+    assert cache.get(cache_key(image_hash(_jpeg(img)), "alice")) == RESULT
+    assert cache.get(cache_key(image_hash(_jpeg(img, quality=70)), "alice")) is None
+
+
+def test_undecodable_upload_still_matches_exactly():
+    digest = image_hash(b"not an image")
+    assert digest[1] is None
+    cache = PhotoResultCache()
+    cache.put(cache_key(digest, "alice"), RESULT)
+    assert cache.get(cache_key(image_hash(b"not an image"), "alice")) == RESULT
+    assert cache.get(cache_key(image_hash(b"not an image either"), "alice")) is None
@@ -0,0 +1,35 @@
+import prompts
+from prompts import COMPACT_PROMPTS, SYSTEM_PROMPT, detect_language, estimate_tokens, select_system_prompt
+
+
+def test_detect_language():
+    assert detect_language("hello how are you") == "english"
+    assert detect_language("kohomada machan") == "singlish"
+    assert detect_language("I love it ane") == "singlish"
+    assert detect_language("කොහොමද ඔයා") == "sinhala"
+    assert detect_language("ok මචං") == "sinhala"
+    assert detect_language("") == "english"
+
+
+def test_estimate_tokens_counts_sinhala_script_denser():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd" * 10) == 10
+    assert estimate_tokens("කොහොමද") > estimate_tokens("kohomada")
+
+
+def test_compact_prompts_keep_the_safety_rules_and_json_format():
+    for language, prompt in COMPACT_PROMPTS.items():
+        assert "1926" in prompt, language
+        assert '{"reply": "...", "emotion": "..."}' in prompt, language
+        assert estimate_tokens(prompt) < estimate_tokens(SYSTEM_PROMPT) / 2, language
+    assert "සිංහල" in COMPACT_PROMPTS["sinhala"]
+
+
+def test_select_system_prompt(monkeypatch):
+    assert select_system_prompt("kohomada machan") == ("singlish", COMPACT_PROMPTS["singlish"])
+    monkeypatch.setattr(prompts, "COMPACT_PROMPTS_ENABLED", False)
+    assert select_system_prompt("කොහොමද") == ("sinhala", SYSTEM_PROMPT)
+    stats = prompts.prompt_stats()
+    assert stats["enabled"] is False
+    assert stats["estimated_tokens_saved_total"] == 0
+    assert stats["variants"]["sinhala"]["requests"] >= 1
@@ -0,0 +1,47 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from inference_warmup import InferenceReadiness
+
+
+@pytest.fixture
+def probe(monkeypatch):
+    readiness = InferenceReadiness()
+    monkeypatch.setattr(main, "inference_readiness", readiness)
+    monkeypatch.setattr(main, "DEEPFACE_WARMUP", True)
+    client = TestClient(main.app)
+    return readiness, lambda: client.get("/ready")
+
+
+def test_not_ready_while_warming(probe):
+    readiness, ready = probe
+    readiness.status = "warming"
+    assert ready().status_code == 503
+
+
+def test_ready_once_warm(probe):
+    readiness, ready = probe
+    readiness.run(lambda: {"retinaface": {"ok": True, "seconds": 1.0}})
+    response = ready()
+    assert response.status_code == 200
+    assert response.json()["inference"]["status"] == "ready"
+
+
+@pytest.mark.parametrize("warm_fn", [
+    lambda: {"retinaface": {"ok": False, "error": "weights download failed"}},
+    lambda: (_ for _ in ()).throw(RuntimeError("worker crashed")),
+])
+def test_failed_warmup_still_reports_ready(probe, warm_fn):
+    readiness, ready = probe
+    readiness.run(warm_fn)
+    assert readiness.status == "failed"
+    response = ready()
+    assert response.status_code == 200
+    assert response.json()["inference"]["error"]
+
+
+def test_unavailable_deepface_reports_ready(probe):
+    readiness, ready = probe
+    readiness.warm(None, available=False)
+    assert ready().status_code == 200
@@ -0,0 +1,64 @@
+import time
+
+from reply_cache import ReplyCache, mentions_distress, normalize_message
+
+
+def test_normalize_squeezes_repeats_and_punctuation():
+    assert normalize_message("Hiiii!!  there 😊") == "hii there"
+    assert normalize_message("") == ""
+
+
+def test_serves_variants_only_after_collecting_them():
+    cache = ReplyCache(variants=2)
+    key = cache.make_key("hi", "mood: Happy")
+    assert cache.get(key) is None
+    cache.put(key, "Hey!", "Happy")
+    assert cache.get(key) is None
+    cache.put(key, "Hello there!", "Happy")
+    replies = {cache.get(key)["reply"] for _ in range(4)}
+    assert replies == {"Hey!", "Hello there!"}
+
+
+def test_key_depends_on_the_prompt():
+    cache = ReplyCache()
+    assert cache.make_key("Hi!!", "mood: Happy") == cache.make_key("hi", "mood: Happy")
+    assert cache.make_key("hi", "mood: Happy") != cache.make_key("hi", "mood: Sad")
+
+
+def test_long_messages_are_not_cached():
+    cache = ReplyCache(max_words=3)
+    assert cache.make_key("one two three four") is None
+    assert cache.make_key("one two three") is not None
+
+
+def test_crisis_messages_bypass_the_cache():
+    cache = ReplyCache()
+    for message in ("i want to die", "better off dead", "mata marenna ona", "මැරෙන්න ඕනේ"):
+        assert mentions_distress(message)
+        assert cache.make_key(message) is None
+    assert cache.get(None) is None
+    assert cache.stats()["bypassed"] == 1
+
+
+def test_everyday_words_are_not_distress():
+    cache = ReplyCache()
+    for message in ("deadline today", "new skill", "on a diet", "studied all night"):
+        assert not mentions_distress(message)
+        assert cache.make_key(message) is not None
+
+
+def test_expired_entries_are_dropped():
+    cache = ReplyCache(ttl_seconds=60, variants=1)
+    key = cache.make_key("hello")
+    cache.put(key, "Hi!", "Happy")
+    cache._entries[key]["created_at"] = time.time() - 120
+    assert cache.get(key) is None
+
+
+def test_lru_eviction():
+    cache = ReplyCache(max_entries=2, variants=1)
+    for word in ("hi", "hello", "hey"):
+        cache.put(cache.make_key(word), word, "Happy")
+    assert cache.get(cache.make_key("hi")) is None
+    assert cache.get(cache.make_key("hey"))["reply"] == "hey"
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,81 @@
+import json
+import os
+
+import pytest
+
+import safety
+from safety import SafetyMatcher, safety_matcher
+
+REPLIES = {"english": "en-reply", "singlish": "singlish-reply", "sinhala": "si-reply"}
+
+
+def _write(path, keywords, replies=REPLIES, mtime=None):
+    path.write_text(json.dumps({"emotion": "Sad", "keywords": keywords, "replies": replies},
+                               ensure_ascii=False), encoding="utf-8")
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def keywords_file(tmp_path):
+    path = tmp_path / "safety_keywords.json"
+    _write(path, {"english": ["die", "end it all"], "singlish": ["mata marenna"], "sinhala": ["මැරෙන්න"]},
+           mtime=1_000_000)
+    return path
+
+
+@pytest.mark.parametrize("message", ["I just want to die", "die.", "DIE", "i'll end it all tonight"])
+def test_keywords_match_on_word_boundaries(keywords_file, message):
+    assert SafetyMatcher(str(keywords_file)).match(message)["language"] == "english"
+
+
+@pytest.mark.parametrize("message", ["starting a diet", "I studied all day", "the end it allows", "diesel"])
+def test_keywords_inside_other_words_do_not_match(keywords_file, message):
+    assert SafetyMatcher(str(keywords_file)).match(message) is None
+
+
+def test_sinhala_and_singlish_entries(keywords_file):
+    matcher = SafetyMatcher(str(keywords_file))
+    assert matcher.match("Mata marenna hithenawa")["reply"] == "singlish-reply"
+    hit = matcher.match("මට මැරෙන්න ඕනේ")
+    assert hit["language"] == "sinhala" and hit["reply"] == "si-reply" and hit["emotion"] == "Sad"
+
+
+def test_reply_language_follows_priority(keywords_file):
+    matcher = SafetyMatcher(str(keywords_file))
+    assert matcher.match("i want to die, mata marenna")["language"] == "singlish"
+    assert matcher.match("die මැරෙන්න mata marenna")["language"] == "sinhala"
+
+
+def test_missing_language_reply_falls_back_to_english(tmp_path):
+    path = tmp_path / "k.json"
+    _write(path, {"singlish": ["mata marenna"]}, replies={"english": "en-reply"})
+    assert SafetyMatcher(str(path)).match("mata marenna")["reply"] == "en-reply"
+
+
+def test_hot_reload_when_the_file_changes(keywords_file, monkeypatch):
+    monkeypatch.setattr(safety, "SAFETY_RELOAD_CHECK_SECONDS", 0)
+    matcher = SafetyMatcher(str(keywords_file))
+    assert matcher.match("no way out") is None
+    _write(keywords_file, {"english": ["no way out"]}, mtime=1_000_100)
+    assert matcher.match("no way out")["keyword"] == "no way out"
+    assert matcher.match("i want to die") is None
+
+
+def test_malformed_reload_keeps_the_previous_matcher(keywords_file, monkeypatch):
+    monkeypatch.setattr(safety, "SAFETY_RELOAD_CHECK_SECONDS", 0)
+    matcher = SafetyMatcher(str(keywords_file))
+    keywords_file.write_text('{"keywords": {"english": ["die"', encoding="utf-8")
+    os.utime(keywords_file, (1_000_200, 1_000_200))
+    assert matcher.reload() is False
+    assert matcher.match("i want to die")["reply"] == "en-reply"
+    assert matcher.stats()["keywords"] == 4
+
+
+def test_shipped_keyword_file():
+    assert safety_matcher.match("I want to die")["language"] == "english"
+    assert safety_matcher.match("I don’t want to live anymore")["language"] == "english"
+    assert safety_matcher.match("mata maranna hithenawa")["language"] == "singlish"
+    assert safety_matcher.match("ජීවිතේ ඉවරයි")["language"] == "sinhala"
+    for message in ("my diet starts today", "deadline is tomorrow", "I learned a new skill"):
+        assert safety_matcher.match(message) is None
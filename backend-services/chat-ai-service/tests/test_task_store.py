@@ -0,0 +1,134 @@
+import asyncio
+import time
+
+import pytest
+
+import task_store
+from task_store import PhotoTaskStore, PhotoTaskWorkers, TaskStoreFull
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PhotoTaskStore(str(tmp_path / "data" / "photo_tasks.db"), ttl_seconds=60, max_tasks=3)
+
+
+def test_claim_returns_the_oldest_queued_task(store):
+    assert store.claim() is None
+    store.create("t1", 7, b"img-1", kind="photo")
+    store.create("t2", 8, b"img-2", kind="photo_chat")
+    assert store.claim() == ("t1", 7, b"img-1", "photo", 1)
+    assert store.get("t1")["status"] == "processing"
+    assert store.claim() == ("t2", 8, b"img-2", "photo_chat", 1)
+    assert store.claim() is None
+
+
+def test_requeued_task_waits_out_its_delay(store):
+    store.create("t1", 7, b"img")
+    store.claim()
+    store.requeue("t1", 60)
+    assert store.get("t1")["status"] == "queued"
+    assert store.claim() is None
+    store.requeue("t1", 0)  # only a processing task can be requeued
+    assert store.claim() is None
+
+    store.create("t2", 7, b"img")
+    store.claim()
+    store.requeue("t2", 0)
+    assert store.claim() == ("t2", 7, b"img", "photo", 2)
+
+
+def test_stale_task_is_requeued_then_abandoned(store, monkeypatch):
+    monkeypatch.setattr(task_store, "PHOTO_TASK_STALE_SECONDS", -1)
+    monkeypatch.setattr(task_store, "PHOTO_TASK_MAX_ATTEMPTS", 2)
+    store.create("t1", 7, b"img")
+    assert store.claim()[4] == 1
+    # its process "died": the next claim hands it out again
+    assert store.claim()[4] == 2
+    assert store.claim() is None
+    item = store.get("t1")
+    assert item["status"] == "error"
+    assert item["result"]["reason"] == "max_attempts"
+    stats = store.stats()
+    assert stats["requeued"] == 1 and stats["abandoned"] == 1
+
+
+def test_finish_stores_the_result_and_drops_the_photo(store):
+    store.create("t1", 7, b"img", kind="photo_chat", result={"phase": "coarse"})
+    assert store.get("t1")["result"] == {"phase": "coarse"}
+    store.claim()
+    store.finish("t1", "done", {"emotion": "Happy"})
+    assert store.get("t1")["result"] == {"emotion": "Happy"}
+    image = store._db().execute("SELECT image FROM photo_tasks WHERE task_id = 't1'").fetchone()[0]
+    assert image is None
+
+
+def test_full_store_evicts_finished_tasks_first(store):
+    for task_id in ("t1", "t2", "t3"):
+        store.create(task_id, 7, b"img")
+    with pytest.raises(TaskStoreFull):
+        store.create("t4", 7, b"img")
+    store.claim()
+    store.finish("t1", "done", {})
+    store.create("t4", 7, b"img")
+    assert store.get("t1") is None
+    stats = store.stats()
+    assert stats["evicted"] == 1 and stats["rejected"] == 1
+
+
+def test_finished_tasks_expire_after_the_ttl(store, monkeypatch):
+    store.create("t1", 7, b"img")
+    store.claim()
+    store.finish("t1", "done", {})
+    later = time.time() + 120
+    monkeypatch.setattr(task_store.time, "time", lambda: later)
+    assert store.get("t1") is None
+    store.create("t2", 7, b"img")
+    assert store.stats()["evicted"] == 1
+
+
+def test_long_poll_wakes_on_a_local_finish(store, monkeypatch):
+    monkeypatch.setattr(task_store, "PHOTO_TASK_WATCH_POLL_SECONDS", 5.0)
+    workers = PhotoTaskWorkers(store, workers=1)
+    store.create("t1", 7, b"img")
+
+    async def scenario():
+        waiter = asyncio.create_task(workers.wait_until_finished("t1", timeout=5.0))
+        await asyncio.sleep(0.05)
+        store.claim()
+        workers._publish("t1")
+        await asyncio.sleep(0.05)
+        started = time.monotonic()
+        store.finish("t1", "done", {"emotion": "Happy"})
+        workers._publish("t1")
+        item = await waiter
+        return item, time.monotonic() - started
+
+    item, waited = asyncio.run(scenario())
+    assert item["status"] == "done"
+    assert item["result"] == {"emotion": "Happy"}
+    assert waited < 1.0
+    assert workers._watchers == {}
+
+
+def test_long_poll_sees_other_processes_by_polling(store, monkeypatch):
+    monkeypatch.setattr(task_store, "PHOTO_TASK_WATCH_POLL_SECONDS", 0.05)
+    workers = PhotoTaskWorkers(store, workers=1)
+    store.create("t1", 7, b"img")
+
+    async def scenario():
+        waiter = asyncio.create_task(workers.wait_until_finished("t1", timeout=5.0))
+        await asyncio.sleep(0.1)
+        store.claim()
+        store.finish("t1", "error", {"error": "no face"})
+        return await waiter
+
+    assert asyncio.run(scenario())["status"] == "error"
+
+
+def test_long_poll_returns_the_current_state_on_timeout(store):
+    workers = PhotoTaskWorkers(store, workers=1)
+    store.create("t1", 7, b"img")
+    started = time.monotonic()
+    assert asyncio.run(workers.wait_until_finished("t1", timeout=0.1))["status"] == "queued"
+    assert time.monotonic() - started < 1.0
+    assert asyncio.run(workers.wait_until_finished("missing", timeout=0.1)) is None
@@ -0,0 +1,130 @@
+import asyncio
+import base64
+import threading
+import time
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import face_emotion
+import main
+from photo_pool import PhotoQueueFull
+from task_store import PhotoTaskStore, PhotoTaskWorkers
+
+PHOTO = b"\xff\xd8 not really a jpeg"
+COARSE = ("Happy", 0.55, {"happy": 55.0}, True, "quick")
+REFINED = ("Sad", 0.91, {"sad": 91.0}, True, "retinaface")
+
+
+def test_emotion_model_is_built_once_under_concurrent_first_calls(monkeypatch):
+    builds = []
+
+    class FakeDeepFace:
+        @staticmethod
+        def build_model(task=None, model_name=None):
+            builds.append(model_name)
+            time.sleep(0.05)
+            return object()
+
+    monkeypatch.setattr(face_emotion, "DeepFace", FakeDeepFace)
+    monkeypatch.setattr(face_emotion, "_emotion_model", None)
+    models = []
+    threads = [threading.Thread(target=lambda: models.append(face_emotion._get_emotion_model())) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert builds == ["Emotion"]
+    assert len({id(m) for m in models}) == 1
+
+
+def test_quick_emotion_survives_an_emotion_model_error(monkeypatch):
+    def broken(faces):
+        raise RuntimeError("model exploded")
+
+    monkeypatch.setattr(face_emotion, "DEEPFACE_AVAILABLE", True)
+    monkeypatch.setattr(face_emotion, "_haar_face_crop", lambda prep, pad_ratio=0.1: np.zeros((60, 60, 3), np.uint8))
+    monkeypatch.setattr(face_emotion, "predict_emotions_batch", broken)
+    image = np.random.default_rng(0).integers(0, 255, (120, 120, 3), dtype=np.uint8)
+    assert face_emotion.quick_emotion(image) == ("Neutral", 0.4, {}, True, "quick")
+    assert face_emotion.warm_emotion_model()["emotion_model"]["ok"] is False
+
+
+@pytest.fixture
+def two_phase(monkeypatch, tmp_path):
+    """photo-emotion-chat with a fake photo pool, a temporary task store and no database"""
+    store = PhotoTaskStore(str(tmp_path / "photo_tasks.db"))
+    saved = []
+    state = {"refine": lambda: REFINED}
+
+    async def analyze_quick(image_bytes, face_hint=None, user_id=None):
+        return COARSE, False
+
+    async def analyze(image_bytes, face_hint=None, user_id=None):
+        return state["refine"]()
+
+    monkeypatch.setattr(main, "DEEPFACE_AVAILABLE", True)
+    monkeypatch.setattr(main, "photo_task_store", store)
+    monkeypatch.setattr(main, "photo_task_workers", PhotoTaskWorkers(store, workers=1))
+    monkeypatch.setattr(main.photo_pool, "analyze_quick", analyze_quick)
+    monkeypatch.setattr(main.photo_pool, "analyze", analyze)
+    monkeypatch.setattr(main, "get_mood_with_time_analysis", lambda *args, **kwargs: None)
+    monkeypatch.setattr(main, "save_mood_to_database", lambda **kwargs: saved.append(kwargs) or True)
+
+    def post():
+        response = TestClient(main.app).post("/api/photo-emotion-chat", json={
+            "user_id": 5, "image": base64.b64encode(PHOTO).decode(), "two_phase": True})
+        assert response.status_code == 200
+        return response.json()
+
+    def run_refinement():
+        task_id, user_id, image, kind, attempt = store.claim()
+        status, result = asyncio.run(main._process_photo_background(task_id, image, user_id, kind, attempt))
+        if status != "retry":
+            store.finish(task_id, status, result)
+        return status, store.get(task_id)
+
+    return post, run_refinement, store, saved, state
+
+
+def test_coarse_reply_then_refined_result_replaces_it(two_phase):
+    post, run_refinement, store, saved, _ = two_phase
+    body = post()
+    assert body["phase"] == "coarse"
+    assert body["emotion_analysis"]["emotion"] == "Happy"
+    assert body["data_saved"] is False and saved == []
+    task_id = body["refinement"]["task_id"]
+    queued = store.get(task_id)
+    assert queued["status"] == "queued" and queued["kind"] == "photo_chat"
+    assert queued["result"]["coarse"] == list(COARSE)
+
+    status, item = run_refinement()
+    assert status == "done" and item["status"] == "done"
+    assert item["result"]["phase"] == "refined"
+    assert item["result"]["emotion_analysis"]["emotion"] == "Sad"
+    assert [s["emotion"] for s in saved] == ["Sad"]
+
+
+def test_failed_refinement_saves_the_coarse_result(two_phase):
+    post, run_refinement, _, saved, state = two_phase
+    state["refine"] = lambda: (_ for _ in ()).throw(RuntimeError("detector crashed"))
+    post()
+    status, item = run_refinement()
+    assert status == "done"
+    assert item["result"]["phase"] == "coarse"
+    assert item["result"]["emotion_analysis"]["emotion"] == "Happy"
+    assert "detector crashed" in item["result"]["refinement_error"]
+    assert [s["emotion"] for s in saved] == ["Happy"]
+
+
+def test_busy_pool_retries_the_refinement(two_phase):
+    post, run_refinement, _, saved, state = two_phase
+
+    def busy():
+        raise PhotoQueueFull("18 photos in flight")
+    state["refine"] = busy
+    post()
+    status, item = run_refinement()
+    assert status == "retry"
+    assert item["result"]["phase"] == "coarse" and saved == []
@@ -0,0 +1,43 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Stands in for the uvicorn server: imports the app the way `uvicorn.run("main:app")` does,
+# then asks a spawned photo worker which modules it has loaded
+FAKE_UVICORN = textwrap.dedent('''
+    import importlib
+    import json
+    import sys
+
+
+    def worker_modules():
+        mp_main = sys.modules.get("__mp_main__")
+        return {"main": "main" in sys.modules, "mp_main_file": getattr(mp_main, "__file__", None),
+                "photo_pool": "photo_pool" in sys.modules}
+
+
+    def run(target, **kwargs):
+        module_name = target.split(":")[0]
+        importlib.import_module(module_name)
+        from photo_pool import photo_pool
+        print("WORKER " + json.dumps(photo_pool._get_executor().submit(worker_modules).result(timeout=120)))
+        photo_pool.shutdown()
+''')
+
+
+def test_photo_workers_do_not_import_main(tmp_path):
+    (tmp_path / "uvicorn.py").write_text(FAKE_UVICORN)
+    env = dict(os.environ, PYTHONPATH=str(tmp_path), PHOTO_WORKERS="1", DEEPFACE_WARMUP="false",
+               SOULBUDDY_DATA_DIR=str(tmp_path / "data"))
+    out = subprocess.run([sys.executable, "run.py"], cwd=SERVICE_DIR, env=env, capture_output=True,
+                         text=True, timeout=180)
+    line = next((l for l in out.stdout.splitlines() if l.startswith("WORKER ")), None)
+    assert line, out.stdout[-2000:] + out.stderr[-2000:]
+    modules = json.loads(line[len("WORKER "):])
+    assert modules["photo_pool"] is True
+    assert modules["main"] is False
+    assert os.path.basename(modules["mp_main_file"]) == "run.py"
@@ -1,12 +1,15 @@
 """
 SoulBuddy User Service - User authentication and management
 """
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Response, Header
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from datetime import timedelta, datetime
+from typing import Optional
 import time
+import hmac
 
 from database import engine, get_db, Base
 from models import User, UserProfile
@@ -64,6 +67,16 @@ import requests
 def _supabase_headers():
     return {"apikey": SUPABASE_KEY, "Authorization": f"Bearer {SUPABASE_KEY}"} if SUPABASE_KEY else {}
 
+# Shared secret for service-to-service endpoints (sent as X-Service-Token); unset = they refuse everyone
+INTERNAL_SERVICE_TOKEN = os.getenv("INTERNAL_SERVICE_TOKEN", "")
+
+async def require_service_token(x_service_token: Optional[str] = Header(None)):
+    """Only other SoulBuddy services may call internal endpoints - users' JWTs are not accepted"""
+    if not x_service_token:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Service token required")
+    if not INTERNAL_SERVICE_TOKEN or not hmac.compare_digest(x_service_token, INTERNAL_SERVICE_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid service token")
+
 # Dependency to get current user from token
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
@@ -422,6 +435,39 @@ async def get_user_profile(
     return profile
 
 
+# Fields the chat service uses to personalise prompts (kept small - fetched per user on cache refresh)
+PROFILE_SNAPSHOT_FIELDS = (
+    "hobbies", "pet_name", "job_title", "top_company", "ambitions", "age", "is_student",
+    "relationship_status", "city", "favorite_songs", "exercise_time", "lifestyle",
+)
+
+def _profile_version(updated_at, created_at) -> str:
+    stamp = updated_at or created_at
+    return stamp.isoformat() if stamp else "0"
+
+@app.get("/api/profile/{user_id}/snapshot", dependencies=[Depends(require_service_token)])
+async def get_profile_snapshot(
+    user_id: int,
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """Compact, versioned profile for other services (service token only). Send the last ETag in If-None-Match to get
+    a 304 (version-only query, no row transfer) when nothing changed."""
+    stamps = db.query(UserProfile.updated_at, UserProfile.created_at).filter(UserProfile.user_id == user_id).first()
+    if not stamps:
+        if request.headers.get("if-none-match") == '"0"':
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": '"0"'})
+        return JSONResponse(content={"user_id": user_id, "version": "0", "profile": {}}, headers={"ETag": '"0"'})
+    version = _profile_version(stamps.updated_at, stamps.created_at)
+    etag = f'"{version}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    columns = [getattr(UserProfile, field) for field in PROFILE_SNAPSHOT_FIELDS]
+    row = db.query(*columns).filter(UserProfile.user_id == user_id).first()
+    profile = {field: value for field, value in zip(PROFILE_SNAPSHOT_FIELDS, row) if value not in (None, "", [], {})}
+    return JSONResponse(content={"user_id": user_id, "version": version, "profile": profile}, headers={"ETag": etag})
+
 # Backward-compatible public route used by mobile frontend (some clients call /users/profile/:id)
 @app.get('/users/profile/{user_id}')
 async def users_profile_compat(user_id: str, db: Session = Depends(get_db)):
@@ -65,6 +65,7 @@ export const API_ENDPOINTS = {
   ANALYZE_EMOTION: `${API_CONFIG.CHAT_SERVICE}/api/v1/analyze-emotion`,
   ANALYZE_PHOTO: `${API_CONFIG.CHAT_SERVICE}/analyze-photo-emotion`,
   SAVE_MOOD: `${API_CONFIG.CHAT_SERVICE}/api/v1/save-mood`,
+  SESSION_START: `${API_CONFIG.CHAT_SERVICE}/api/v1/session/start`,
 
   // Event Service
   EVENTS: `${API_CONFIG.EVENT_SERVICE}/api/events`,
@@ -4,6 +4,8 @@ import { useNavigation, useRoute } from '@react-navigation/native';
 import HomeScreen from '../screens/home/Home/HomeScreen';
 import LifestyleScreen from '../screens/home/Lifestyle/LifestyleScreen';
 import ProfileScreen from '../screens/home/Profile/ProfileScreen';
+import AsyncStorage from '@react-native-async-storage/async-storage';
+import { chatService } from '../services/api';
 
 type Tab = 'Home' | 'Lifestyle' | 'Profile';
 
@@ -15,6 +17,14 @@ const MainTabs = () => {
 
   React.useEffect(() => { console.log('MainTabs mounted - initial active:', active); }, []);
 
+  // Warm the chat service's per-user context so the first chat message skips cold reads
+  useEffect(() => {
+    (async () => {
+      const userId = await AsyncStorage.getItem('user_id');
+      if (userId && !isNaN(Number(userId))) chatService.startSession(userId);
+    })();
+  }, []);
+
   useEffect(() => {
     const initialTab = route?.params?.initialTab as Tab | undefined;
     if (initialTab && ['Home','Lifestyle','Profile','Lifestyles'].includes(initialTab as string)) {
@@ -352,11 +352,12 @@ const ChatScreen = () => {
                   };
                   setMessages(prev => [...prev, ackMsg]);
 
-                  // Poll task status until done (short-lived, timeout after ~25s)
+                  // Long-poll task status: the server answers as soon as the task finishes (give up after ~25s)
                   const start = Date.now();
                   const poll = async () => {
                     try {
-                      const statusResp = await fetch(`${API_ENDPOINTS.ANALYZE_PHOTO}/status/${taskId}`);
+                      const waitSeconds = Math.max(1, Math.round((25000 - (Date.now() - start)) / 1000));
+                      const statusResp = await fetch(`${API_ENDPOINTS.ANALYZE_PHOTO}/status/${taskId}?wait=${waitSeconds}`);
                       const statusJson = await statusResp.json();
                       console.log('Photo task status:', statusJson);
                       if (statusJson.status === 'done' && statusJson.result) {
@@ -381,13 +382,13 @@ const ChatScreen = () => {
                       console.warn('Polling error:', err);
                     }
                     if (Date.now() - start < 25000) {
-                      setTimeout(poll, 1500);
+                      setTimeout(poll, 500);
                     } else {
                       const timeoutMsg = { id: Date.now().toString() + '_bot_timeout', text: "Analysis is taking longer than expected — I'll try again later.", sender: 'bot' };
                       setMessages(prev => [...prev, timeoutMsg]);
                     }
                   };
-                  setTimeout(poll, 1000);
+                  poll();
                   return;
                 }
 
@@ -135,6 +135,23 @@ export const chatService = {
     return response.json();
   },
 
+  // Warm chat context (mood, recent turns) on app open - fire and forget
+  async startSession(userId: string) {
+    try {
+      await fetchWithTimeout(
+        API_ENDPOINTS.SESSION_START,
+        {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({ user_id: Number(userId) }),
+        },
+        API_CONFIG.TIMEOUT.DEFAULT
+      );
+    } catch (error) {
+      console.warn('Chat session prefetch failed', error);
+    }
+  },
+
   async resetChat() {
     const response = await fetchWithTimeout(
       API_ENDPOINTS.RESET_CHAT,